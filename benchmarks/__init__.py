@@ -0,0 +1,5 @@
+"""
+Benchmarks of the griem package, run as modules from the repository root, e.g.
+
+    python -m benchmarks.suite run --output base.json
+"""
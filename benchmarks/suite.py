@@ -0,0 +1,452 @@
+"""
+suite.py
+
+Reproducible benchmarks of every stage of the Griem pipeline and of its scaling axes.
+
+Each benchmark is timed with `time.perf_counter` after one warm-up call, repeated until it has
+run for `min_time` seconds (at least `min_repeats` and at most `max_repeats` times). Results are
+written as JSON together with the machine, library versions and git commit they were measured
+on, and two result files are compared benchmark by benchmark:
+
+    python -m benchmarks.suite run --output base.json
+    python -m benchmarks.suite run --quick --axes stages,velocity --elements Rb --output new.json
+    python -m benchmarks.suite compare base.json new.json --threshold 0.1
+
+The axes are:
+    - stages: `load_energy_data`, `process_data`, `create_terms`, `calculate_rhos`, `sum`,
+      `integrate_griem` and `Griem.calculate` for one line on a 1000-point Maxwellian grid
+    - velocity: the number of velocity points, 1 to 10^5
+    - n_terms: the number of perturbing states, 1 to all
+    - states: the number of upper states calculated together (`run_series`)
+    - workers: `Griem.calculate` of a whole series on 1 to 4 processes
+    - startup: a new Python process importing griem, or running one line with `run_engine.run`
+      or `Griem.calculate` (as each task of a job array does), next to a bare interpreter
+
+`compare` exits with status 1 if any benchmark got slower by more than `threshold` (relative)
+and `min_delta` seconds, so it can gate a CI job.
+"""
+
+# Import modules
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+import numpy as np
+import scipy
+
+import griem
+from griem import Griem, __version__
+from griem.constants import BOLTZMANN_CONSTANT, ELECTRON_MASS
+from griem.run_engine import run_series
+from griem.calc.data_processing import process_data, create_terms
+from griem.calc.integral import integrate_griem
+from griem.calc.rho_min.rhos_solve import calculate_rhos
+from griem.calc.summation import sum as griem_sum
+from griem.utils import functions
+from griem.utils.helpers import clear_energy_data_cache, find_upper_states
+from griem.utils.helpers import load_energy_data, load_energy_index
+
+# Lower state, single upper state and series orbital benchmarked for each element
+LINES = {"Rb": ("4D3/2", "12F5/2", "F5/2"),
+         "Cs": ("6P3/2", "12D5/2", "D5/2")}
+
+# Values of every scaling axis, full and --quick
+AXES = ("stages", "velocity", "n_terms", "states", "workers", "startup")
+SWEEPS = {"velocity": [1, 10, 100, 1000, 10000, 100000],
+          "n_terms": [1, 2, 5, 10, 20, "all"],
+          "states": [1, 4, 16, "all"],
+          "workers": [1, 2, 4]}
+QUICK_SWEEPS = {"velocity": [1, 100, 1000],
+                "n_terms": [1, 5, "all"],
+                "states": [1, 4],
+                "workers": [1, 2]}
+
+# Code run by a new interpreter for each startup benchmark, and for each element
+STARTUP_IMPORTS = {"python": "pass",
+                   "import griem": "import griem",
+                   "import run_engine": "from griem.run_engine import run",
+                   "import Griem": "from griem import Griem"}
+STARTUP_RUNS = {"run": "from griem.run_engine import run\n"
+                       "run({element!r}, {lower_state!r}, {upper_state!r}, 1e6, n_terms=5)",
+                "Griem.calculate": "from griem import Griem\n"
+                                   "Griem({element!r}, {lower_state!r}, {upper_state!r}, 1e6)"
+                                   ".calculate(5)"}
+
+# Electron temperature [K] of the benchmark EVDF, grid size of the fixed-size axes and their
+# number of perturbing states
+TEMPERATURE = 10000.0
+N_VELOCITIES = 1000
+N_TERMS = 5
+
+
+def maxwellian_grid(n_velocities: int):
+    """
+    Velocity grid and Maxwell-Boltzmann speed distribution at `TEMPERATURE`.
+
+    Args:
+        n_velocities (int): Number of velocity points; 1 gives the thermal speed and an EVDF of 1.
+
+    Returns:
+        tuple: (velocity, EVDF).
+    """
+    v_thermal = np.sqrt(2*BOLTZMANN_CONSTANT*TEMPERATURE/ELECTRON_MASS)
+    if n_velocities == 1:
+        return v_thermal, 1.0
+    velocity = np.linspace(0.01, 6, n_velocities)*v_thermal
+    EVDF = 4/np.sqrt(np.pi)*velocity**2/v_thermal**3*np.exp(-(velocity/v_thermal)**2)
+    return velocity, EVDF
+
+
+def cases(
+        elements: list,
+        axes: list,
+        quick: bool = False
+    ):
+    """
+    Benchmarks of the chosen axes, set up lazily one at a time. Each callable binds its own
+    inputs, so the cases may also be collected into a list before they are run.
+
+    Args:
+        elements (list): Element symbols (keys of `LINES`).
+        axes (list): Axes to run (see `AXES`).
+        quick (bool, optional): Use the short sweeps. Defaults to False.
+
+    Yields:
+        tuple: (axis, element or None, function name, parameters, callable of no arguments).
+    """
+    sweeps = QUICK_SWEEPS if quick else SWEEPS
+    if "startup" in axes:
+        for name, code in STARTUP_IMPORTS.items():
+            yield "startup", None, name, {}, _startup(code)
+    for element in elements:
+        lower_state, upper_state, orbital = LINES[element]
+        index = load_energy_index(element)
+        processed_data = process_data(index, lower_state, upper_state)
+        n_all = len(processed_data["omega"]) - 1
+
+        if "stages" in axes:
+            velocity, EVDF = maxwellian_grid(N_VELOCITIES)
+            omegas, exp_vals_sqrd, _ = create_terms(processed_data, N_TERMS)
+            rhos = calculate_rhos(velocity, omegas, exp_vals_sqrd)
+            summation = griem_sum(rhos, velocity, omegas, exp_vals_sqrd)
+            params = {"n_vel": N_VELOCITIES, "n_terms": N_TERMS}
+            yield "stages", element, "load_energy_data", {}, partial(_load_cold, element)
+            yield "stages", element, "process_data", {}, \
+                partial(process_data, index, lower_state, upper_state)
+            yield "stages", element, "create_terms", {"n_terms": N_TERMS}, \
+                partial(create_terms, processed_data, N_TERMS)
+            yield "stages", element, "calculate_rhos", params, \
+                partial(calculate_rhos, velocity, omegas, exp_vals_sqrd)
+            yield "stages", element, "sum", params, \
+                partial(griem_sum, rhos, velocity, omegas, exp_vals_sqrd)
+            yield "stages", element, "integrate_griem", params, \
+                partial(integrate_griem, velocity, rhos, summation, EVDF)
+            yield "stages", element, "Griem.calculate", params, \
+                _calculate(element, lower_state, upper_state, velocity, EVDF, N_TERMS)
+
+        if "velocity" in axes:
+            omegas, exp_vals_sqrd, _ = create_terms(processed_data, N_TERMS)
+            for n_velocities in sweeps["velocity"]:
+                velocity, EVDF = maxwellian_grid(n_velocities)
+                rhos = calculate_rhos(velocity, omegas, exp_vals_sqrd)
+                summation = griem_sum(rhos, velocity, omegas, exp_vals_sqrd)
+                params = {"n_vel": n_velocities, "n_terms": N_TERMS}
+                yield "velocity", element, "calculate_rhos", params, \
+                    partial(calculate_rhos, velocity, omegas, exp_vals_sqrd)
+                yield "velocity", element, "sum", params, \
+                    partial(griem_sum, rhos, velocity, omegas, exp_vals_sqrd)
+                yield "velocity", element, "integrate_griem", params, \
+                    partial(integrate_griem, velocity, rhos, summation, EVDF)
+                yield "velocity", element, "Griem.calculate", params, \
+                    _calculate(element, lower_state, upper_state, velocity, EVDF, N_TERMS)
+
+        if "n_terms" in axes:
+            velocity, EVDF = maxwellian_grid(N_VELOCITIES)
+            for n_terms in sweeps["n_terms"]:
+                n_terms = n_all if n_terms == "all" else min(n_terms, n_all)
+                yield "n_terms", element, "Griem.calculate", \
+                    {"n_vel": N_VELOCITIES, "n_terms": n_terms}, \
+                    _calculate(element, lower_state, upper_state, velocity, EVDF, n_terms)
+
+        if "states" in axes:
+            velocity, EVDF = maxwellian_grid(N_VELOCITIES)
+            states = list(find_upper_states(element, orbital))
+            for n_states in sweeps["states"]:
+                subset = states if n_states == "all" else states[-n_states:]
+                yield "states", element, "run_series", \
+                    {"n_vel": N_VELOCITIES, "n_terms": N_TERMS, "n_states": len(subset)}, \
+                    partial(run_series, element, lower_state, subset, velocity, EVDF, N_TERMS)
+
+        if "workers" in axes:
+            velocity, EVDF = maxwellian_grid(N_VELOCITIES)
+            for workers in sweeps["workers"]:
+                yield "workers", element, "Griem.calculate", \
+                    {"n_vel": N_VELOCITIES, "n_terms": N_TERMS, "workers": workers}, \
+                    _calculate(element, lower_state, orbital, velocity, EVDF, N_TERMS,
+                               executor="process", max_workers=workers)
+
+        if "startup" in axes:
+            for name, code in STARTUP_RUNS.items():
+                code = code.format(element=element, lower_state=lower_state,
+                                   upper_state=upper_state)
+                yield "startup", element, name, {"n_terms": N_TERMS}, _startup(code)
+
+
+def _load_cold(element: str):
+    """Read the energy data of `element` from its store, bypassing the in-process cache."""
+    clear_energy_data_cache(element)
+    return load_energy_data(element)
+
+
+def _startup(code: str):
+    """Run `code` in a new interpreter that imports the same griem package as this one."""
+    environment = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(griem.__file__)))
+    environment["PYTHONPATH"] = os.pathsep.join(filter(None, [root, environment.get("PYTHONPATH")]))
+    def startup():
+        subprocess.run([sys.executable, "-c", code], env=environment, check=True)
+    return startup
+
+
+def _calculate(
+        element: str,
+        lower_state: str,
+        upper_state: str,
+        velocity,
+        EVDF,
+        n_terms: int,
+        **kwargs
+    ):
+    """End-to-end `Griem.calculate` on a new object each call, so no stage is reused."""
+    def calculate():
+        griem = Griem(element, lower_state, upper_state, velocity, EVDF)
+        griem.calculate(n_terms, **kwargs)
+        return griem.results
+    return calculate
+
+
+def measure(
+        function: callable,
+        min_time: float = 0.2,
+        min_repeats: int = 3,
+        max_repeats: int = 100
+    ):
+    """
+    Time a function of no arguments.
+
+    Args:
+        function (callable): The benchmark.
+        min_time (float, optional): Total time [s] to repeat the function for. Defaults to 0.2.
+        min_repeats (int, optional): Fewest timed calls. Defaults to 3.
+        max_repeats (int, optional): Most timed calls. Defaults to 100.
+
+    Returns:
+        dict: Time [s] of the warm-up call ('first') and the statistics of the timed calls.
+    """
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+
+    times = []
+    while len(times) < max_repeats and (len(times) < min_repeats or sum(times) < min_time):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"repeats": len(times), "first": first, "min": min(times),
+            "median": statistics.median(times), "mean": statistics.fmean(times),
+            "stdev": statistics.stdev(times) if len(times) > 1 else 0.0, "times": times}
+
+
+def benchmark_name(
+        axis: str,
+        element: str,
+        function: str,
+        params: dict
+    ):
+    """
+    Name identifying a benchmark across runs, e.g. 'velocity/Rb/sum[n_terms=5,n_vel=1000]'
+    ('startup/import griem[]' for a benchmark without an element).
+    """
+    values = ",".join(f"{key}={value}" for key, value in sorted(params.items()))
+    return "/".join(filter(None, [axis, element, f"{function}[{values}]"]))
+
+
+def metadata(options: dict):
+    """
+    Machine, library versions, git commit and options of a run.
+
+    Args:
+        options (dict): Options of the run.
+
+    Returns:
+        dict: The metadata.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"griem": __version__, "python": platform.python_version(), "numpy": np.__version__,
+            "scipy": scipy.__version__, "platform": platform.platform(),
+            "processor": platform.processor(), "cpu_count": os.cpu_count(), "commit": commit,
+            "backend": functions.get_backend(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "options": options}
+
+
+def run_suite(
+        output: str,
+        elements: list = None,
+        axes: list = None,
+        quick: bool = False,
+        min_time: float = 0.2,
+        verbose: bool = True
+    ):
+    """
+    Run the benchmarks and write them to `output` as JSON.
+
+    Args:
+        output (str): Output `.json` file.
+        elements (list, optional): Element symbols. Defaults to None (all of `LINES`).
+        axes (list, optional): Axes to run. Defaults to None (all of `AXES`).
+        quick (bool, optional): Use the short sweeps. Defaults to False.
+        min_time (float, optional): Time [s] to repeat each benchmark for. Defaults to 0.2.
+        verbose (bool, optional): Print each benchmark as it finishes. Defaults to True.
+
+    Raises:
+        ValueError: If an element or axis is unknown.
+
+    Returns:
+        dict: The results, as written.
+    """
+    elements = list(LINES) if elements is None else elements
+    axes = list(AXES) if axes is None else axes
+    unknown = [name for name in elements if name not in LINES] + [axis for axis in axes if axis not in AXES]
+    if unknown:
+        raise ValueError(f"Unknown elements or axes: {unknown}")
+
+    benchmarks = []
+    for axis, element, function_name, params, function in cases(elements, axes, quick):
+        name = benchmark_name(axis, element, function_name, params)
+        result = measure(function, min_time)
+        benchmarks.append({"name": name, "axis": axis, "element": element,
+                           "function": function_name, "params": params, **result})
+        if verbose:
+            print(f"{name:<70} {result['median']*1e3:12.3f} ms  (x{result['repeats']})", flush=True)
+
+    results = {"metadata": metadata({"elements": elements, "axes": axes, "quick": quick,
+                                     "min_time": min_time}),
+               "benchmarks": benchmarks}
+    with open(output, "w") as file:
+        json.dump(results, file, indent=1)
+    return results
+
+
+def compare(
+        base: dict,
+        new: dict,
+        threshold: float = 0.1,
+        min_delta: float = 1e-4,
+        statistic: str = "median"
+    ):
+    """
+    Compare two runs benchmark by benchmark.
+
+    Args:
+        base (dict): Reference results (as written by `run_suite`).
+        new (dict): Results to check.
+        threshold (float, optional): Relative slowdown flagged as a regression. Defaults to 0.1.
+        min_delta (float, optional): Smallest absolute slowdown [s] flagged, which keeps timer
+                                     noise of very fast benchmarks out. Defaults to 1e-4.
+        statistic (str, optional): 'median', 'min' or 'mean'. Defaults to 'median'.
+
+    Returns:
+        list: One dict per benchmark with the `name`, `base` and `new` times, their `ratio`
+              (new/base) and a `status`: 'regression', 'improvement', 'unchanged', 'added'
+              or 'removed'.
+    """
+    base_times = {entry["name"]: entry[statistic] for entry in base["benchmarks"]}
+    new_times = {entry["name"]: entry[statistic] for entry in new["benchmarks"]}
+    rows = []
+    for name in list(base_times) + [name for name in new_times if name not in base_times]:
+        old, current = base_times.get(name), new_times.get(name)
+        if old is None or current is None:
+            rows.append({"name": name, "base": old, "new": current, "ratio": None,
+                         "status": "added" if old is None else "removed"})
+            continue
+        ratio = current/old
+        if ratio > 1 + threshold and current - old > min_delta:
+            status = "regression"
+        elif ratio < 1/(1 + threshold) and old - current > min_delta:
+            status = "improvement"
+        else:
+            status = "unchanged"
+        rows.append({"name": name, "base": old, "new": current, "ratio": ratio, "status": status})
+    return rows
+
+
+def _print_comparison(rows: list):
+    """Print the output of `compare` as a table."""
+    print(f"{'benchmark':<70} {'base [ms]':>12} {'new [ms]':>12} {'ratio':>8}  status")
+    for row in rows:
+        base = "-" if row["base"] is None else f"{row['base']*1e3:.3f}"
+        new = "-" if row["new"] is None else f"{row['new']*1e3:.3f}"
+        ratio = "-" if row["ratio"] is None else f"{row['ratio']:.3f}"
+        print(f"{row['name']:<70} {base:>12} {new:>12} {ratio:>8}  {row['status']}")
+    counts = {status: sum(row["status"] == status for row in rows)
+              for status in ("regression", "improvement", "unchanged", "added", "removed")}
+    print(", ".join(f"{count} {status}" for status, count in counts.items() if count))
+
+
+def main(argv: list = None):
+    """
+    Command line entry point, see the module docstring.
+
+    Args:
+        argv (list, optional): Arguments. Defaults to None (`sys.argv[1:]`).
+
+    Returns:
+        int: Exit status, 1 if `compare` found a regression.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite", description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", default="benchmarks.json", help="output JSON file")
+    run_parser.add_argument("--elements", default=",".join(LINES), help="comma-separated elements")
+    run_parser.add_argument("--axes", default=",".join(AXES), help="comma-separated axes")
+    run_parser.add_argument("--quick", action="store_true", help="short sweeps")
+    run_parser.add_argument("--min-time", type=float, default=0.2,
+                            help="seconds to repeat each benchmark for")
+    compare_parser = commands.add_parser("compare", help="compare two runs")
+    compare_parser.add_argument("base", help="reference JSON file")
+    compare_parser.add_argument("new", help="JSON file to check")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="relative slowdown flagged as a regression")
+    compare_parser.add_argument("--min-delta", type=float, default=1e-4,
+                                help="smallest absolute slowdown [s] flagged")
+    compare_parser.add_argument("--statistic", choices=["median", "min", "mean"], default="median")
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        run_suite(args.output, args.elements.split(","), args.axes.split(","), args.quick,
+                  args.min_time)
+        return 0
+    with open(args.base) as file:
+        base = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    rows = compare(base, new, args.threshold, args.min_delta, args.statistic)
+    _print_comparison(rows)
+    return int(any(row["status"] == "regression" for row in rows))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,404 @@
+"""
+validation.py
+
+Accuracy-versus-speed validation of the optional fast paths against golden reference results.
+
+The reference is the exact path: the SciPy special functions (`functions` 'exact' backend),
+`scipy.optimize.brentq` for every velocity (`rho_method='brentq'`) and the trapezoidal rule on a
+dense velocity grid, for a fixed matrix of Rb and Cs lines and Maxwellian electron temperatures
+(`LINES`, `TEMPERATURES`). `generate` computes it once and stores it as JSON; `check` runs every
+fast mode on the same matrix, and reports the largest and RMS relative deviation of the width,
+shift and shift-to-width ratio (d/w) from the reference together with the wall-clock speedup,
+and whether each mode is within its thresholds (`MODES`):
+
+    python -m benchmarks.validation generate
+    python -m benchmarks.validation check --output report.json
+    python -m benchmarks.validation check --modes reference,fast_functions,surrogate
+    python -m benchmarks.validation solver
+
+A mode fails if the largest deviation of any quantity exceeds its 'max' threshold or the RMS
+deviation exceeds its 'rms' threshold, and `check` then exits with status 1, so it can gate a CI
+job. Speedups are relative to the reference time of the same run if the 'reference' mode is
+included, and otherwise to the time recorded in the golden file (possibly on another machine).
+
+`solver` checks that the vectorized Brent solver takes the same steps as `brentq`: it solves a
+batch of equations with `solve_batch` and each member alone with `solve`, and compares the
+iteration counts member by member. For a polynomial test equation, whose batched and scalar
+values are bitwise identical, every count must match. The rho_min equation of the `LINES` is
+only known to rounding noise near its root (its two sides cancel), and its batched and scalar
+values differ in the last bits (matrix products of different shapes), so the two solvers can
+take different steps inside the noise; there the mismatches are only reported, and the roots
+must agree to `ROOT_TOLERANCE`.
+"""
+
+# Import modules
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import scipy
+
+from griem import __version__
+from griem.constants import BOLTZMANN_CONSTANT, ELECTRON_MASS
+from griem.calc.data_processing import create_terms, process_data
+from griem.calc.rho_min.rho import rho_equation
+from griem.calc.rho_min.rhos_solve import DOMAIN
+from griem.calc.rho_min.root_solver import solve, solve_batch
+from griem.run_engine import run, run_adaptive, run_temperatures
+from griem.utils import functions
+from griem.utils.helpers import load_energy_index
+
+# Lines and electron temperatures [K] of the validation matrix
+LINES = [("Rb", "5S1/2", "7P3/2"), ("Rb", "5P3/2", "10S1/2"), ("Rb", "5P1/2", "8D3/2"),
+         ("Rb", "4D3/2", "12F5/2"), ("Cs", "6S1/2", "9P3/2"), ("Cs", "6P1/2", "10S1/2"),
+         ("Cs", "6P3/2", "12D5/2")]
+TEMPERATURES = [2000.0, 10000.0, 50000.0]
+
+# Number of perturbing states of the reference, and points of its velocity grid, which spans
+# [0, MAXWELLIAN_CUTOFF] thermal speeds of the highest temperature
+N_TERMS = 20
+N_VELOCITIES = 6000
+MAXWELLIAN_CUTOFF = 6.0
+
+# Largest relative difference of the rho_min roots of `solve_batch` and `solve`
+ROOT_TOLERANCE = 1e-8
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "reference.json")
+
+# Fast modes: description, settings (see `evaluate`), and the largest and RMS relative
+# deviation allowed for each of the width, shift and d/w
+MODES = {
+    "reference": ("exact functions, brentq, dense trapezoid (recomputed)",
+                  {"rho_method": "brentq"}, {"max": 1e-12, "rms": 1e-12}),
+    "batch": ("vectorized Brent solver (default)",
+              {}, {"max": 1e-8, "rms": 1e-9}),
+    "fast_functions": ("tabulated A/B/a/b, rtol=1e-10",
+                       {"backend": "fast"}, {"max": 1e-8, "rms": 1e-9}),
+    "surrogate": ("surrogate rho_min(v), rtol=1e-6",
+                  {"rho_method": "surrogate"}, {"max": 1e-5, "rms": 3e-6}),
+    "quadrature": ("Maxwellian Gauss-Legendre quadrature, 32 nodes",
+                   {"quadrature": 32}, {"max": 1e-5, "rms": 3e-6}),
+    "quadrature_16": ("Maxwellian Gauss-Legendre quadrature, 16 nodes",
+                      {"quadrature": 16}, {"max": 1e-3, "rms": 3e-4}),
+    "adaptive": ("adaptive Gauss-Kronrod integration, rtol=1e-6",
+                 {"adaptive": 1e-6}, {"max": 1e-5, "rms": 3e-6}),
+    "n_terms_10": ("10 perturbing states",
+                   {"n_terms": 10}, {"max": 1e-2, "rms": 5e-3}),
+    "n_terms_5": ("5 perturbing states",
+                  {"n_terms": 5}, {"max": 1e-2, "rms": 5e-3}),
+    "all_fast": ("fast functions, 32-node quadrature",
+                 {"backend": "fast", "quadrature": 32}, {"max": 1e-5, "rms": 3e-6}),
+}
+
+
+def maxwellian(temperature: float):
+    """
+    Normalized Maxwell-Boltzmann speed distribution of electrons, as a function of velocity.
+
+    Args:
+        temperature (float): Electron temperature [K].
+
+    Returns:
+        callable: The distribution at an array of velocities [m/s].
+    """
+    v_thermal = np.sqrt(2*BOLTZMANN_CONSTANT*temperature/ELECTRON_MASS)
+    def evdf(velocity):
+        u = np.asarray(velocity, dtype=np.float64)/v_thermal
+        return 4/np.sqrt(np.pi)*u**2*np.exp(-u**2)/v_thermal
+    return evdf
+
+
+def velocity_grid(n_velocities: int = N_VELOCITIES):
+    """
+    Dense velocity grid of the reference, and the Maxwellian of every temperature on it.
+
+    Args:
+        n_velocities (int, optional): Number of points. Defaults to `N_VELOCITIES`.
+
+    Returns:
+        tuple: (velocity, EVDF of shape (n_temperatures, n_velocities)).
+    """
+    v_max = MAXWELLIAN_CUTOFF*np.sqrt(2*BOLTZMANN_CONSTANT*max(TEMPERATURES)/ELECTRON_MASS)
+    velocity = np.linspace(v_max/n_velocities, v_max, n_velocities)
+    return velocity, np.array([maxwellian(temperature)(velocity) for temperature in TEMPERATURES])
+
+
+def evaluate(
+        settings: dict,
+        n_terms: int = N_TERMS,
+        n_velocities: int = N_VELOCITIES
+    ):
+    """
+    Width and shift of every line and temperature of the matrix with the given settings.
+
+    Args:
+        settings (dict): Any of 'backend' ('exact' or 'fast'), 'rho_method' (see
+                         `run_engine.run`), 'quadrature' (number of Maxwellian quadrature nodes,
+                         see `run_engine.run_temperatures`), 'adaptive' (tolerance of
+                         `run_engine.run_adaptive`) and 'n_terms'; the rest follow the reference.
+        n_terms (int, optional): Default number of perturbing states. Defaults to `N_TERMS`.
+        n_velocities (int, optional): Points of the dense grid. Defaults to `N_VELOCITIES`.
+
+    Returns:
+        tuple: (complex width + 1j*shift of shape (n_lines, n_temperatures), wall time [s]).
+    """
+    previous = functions.get_backend()
+    functions.set_backend(settings.get("backend", "exact"))
+    n_terms = settings.get("n_terms", n_terms)
+    velocity, EVDF = velocity_grid(n_velocities)
+    width_shift = np.empty((len(LINES), len(TEMPERATURES)), dtype=np.complex128)
+    try:
+        start = time.perf_counter()
+        for n, (element, lower_state, upper_state) in enumerate(LINES):
+            if "quadrature" in settings:
+                width_shift[n] = run_temperatures(element, lower_state, upper_state, TEMPERATURES,
+                                                  n_terms, settings["quadrature"])[0]
+            elif "adaptive" in settings:
+                for t, temperature in enumerate(TEMPERATURES):
+                    v_max = MAXWELLIAN_CUTOFF*np.sqrt(2*BOLTZMANN_CONSTANT*temperature/ELECTRON_MASS)
+                    width_shift[n, t] = run_adaptive(element, lower_state, upper_state,
+                                                     np.array([v_max/n_velocities, v_max]),
+                                                     maxwellian(temperature), n_terms,
+                                                     settings["adaptive"])[0]
+            else:
+                width_shift[n] = run(element, lower_state, upper_state, velocity, EVDF, n_terms,
+                                     rho_method=settings.get("rho_method", "batch"))[0]
+        elapsed = time.perf_counter() - start
+    finally:
+        functions.set_backend(previous)
+    return width_shift, elapsed
+
+
+def deviations(
+        width_shift: np.ndarray,
+        reference: np.ndarray
+    ):
+    """
+    Largest and RMS relative deviation of the width, shift and d/w from the reference.
+
+    Args:
+        width_shift (np.ndarray): Complex width + 1j*shift.
+        reference (np.ndarray): Reference values, same shape.
+
+    Returns:
+        dict: {'width': {'max': ..., 'rms': ...}, 'shift': ..., 'ratio': ...}.
+    """
+    quantities = {"width": (width_shift.real, reference.real),
+                  "shift": (width_shift.imag, reference.imag),
+                  "ratio": (width_shift.imag/width_shift.real, reference.imag/reference.real)}
+    result = {}
+    for name, (values, expected) in quantities.items():
+        relative = np.abs(values - expected)/np.abs(expected)
+        result[name] = {"max": float(np.max(relative)), "rms": float(np.sqrt(np.mean(relative**2)))}
+    return result
+
+
+def generate(
+        output: str = GOLDEN_FILE,
+        n_terms: int = N_TERMS,
+        n_velocities: int = N_VELOCITIES
+    ):
+    """
+    Compute the reference results and write them to `output`.
+
+    Args:
+        output (str, optional): Output `.json` file. Defaults to `GOLDEN_FILE`.
+        n_terms (int, optional): Number of perturbing states. Defaults to `N_TERMS`.
+        n_velocities (int, optional): Points of the dense grid. Defaults to `N_VELOCITIES`.
+
+    Returns:
+        dict: The golden results, as written.
+    """
+    width_shift, elapsed = evaluate(MODES["reference"][1], n_terms, n_velocities)
+    results = [{"element": element, "lower_state": lower_state, "upper_state": upper_state,
+                "temperature": temperature, "width": width_shift[n, t].real,
+                "shift": width_shift[n, t].imag}
+               for n, (element, lower_state, upper_state) in enumerate(LINES)
+               for t, temperature in enumerate(TEMPERATURES)]
+    golden = {"metadata": {**_environment(), "n_terms": n_terms, "n_velocities": n_velocities,
+                           "time": elapsed},
+              "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(golden, file, indent=1)
+    return golden
+
+
+def check(
+        golden: dict,
+        modes: list = None
+    ):
+    """
+    Run the fast modes and compare them with the golden results.
+
+    Args:
+        golden (dict): Golden results (as written by `generate`).
+        modes (list, optional): Names of `MODES` to run. Defaults to None (all but 'reference').
+
+    Raises:
+        ValueError: If a mode is unknown, or the golden file holds another matrix.
+
+    Returns:
+        dict: Per mode, its `description`, `deviation` (see `deviations`), `time` [s],
+              `speedup`, `thresholds` and whether it `passed`, plus the `reference_time` and
+              its `reference_source` ('run' or 'golden').
+    """
+    modes = [name for name in MODES if name != "reference"] if modes is None else modes
+    unknown = [name for name in modes if name not in MODES]
+    if unknown:
+        raise ValueError(f"Unknown modes: {unknown}")
+    reference = _golden_values(golden)
+    n_terms, n_velocities = golden["metadata"]["n_terms"], golden["metadata"]["n_velocities"]
+
+    report = {}
+    for name in modes:
+        description, settings, thresholds = MODES[name]
+        width_shift, elapsed = evaluate(settings, n_terms, n_velocities)
+        deviation = deviations(width_shift, reference)
+        passed = all(values[kind] <= thresholds[kind]
+                     for values in deviation.values() for kind in ("max", "rms"))
+        report[name] = {"description": description, "deviation": deviation, "time": elapsed,
+                        "thresholds": thresholds, "passed": passed}
+
+    if "reference" in report:
+        reference_time, source = report["reference"]["time"], "run"
+    else:
+        reference_time, source = golden["metadata"]["time"], "golden"
+    for entry in report.values():
+        entry["speedup"] = reference_time/entry["time"]
+    return {"metadata": _environment(), "reference_time": reference_time,
+            "reference_source": source, "modes": report}
+
+
+def solver_consistency(n_members: int = 1000):
+    """
+    Compare the iterations of `solve_batch` with those of `solve`, member by member.
+
+    Args:
+        n_members (int, optional): Members of the polynomial test batch. Defaults to 1000.
+
+    Returns:
+        dict: Per case, the number of `members`, of iteration `mismatches`, the largest
+              relative `root_difference`, whether the counts must be `exact`, and whether it
+              `passed`.
+    """
+    rng = np.random.default_rng(0)
+    cases = {"cubic": (lambda x, a, b: (x - a)**3 + 1e-3*b*(x - a), [0.01, 10.0],
+                       (rng.uniform(0.1, 9.0, n_members), rng.uniform(0.01, 5.0, n_members)),
+                       (), True)}
+    velocity = np.geomspace(1e4, 1e7, 200)
+    for element, lower_state, upper_state in LINES:
+        data = process_data(load_energy_index(element), lower_state, upper_state)
+        omegas, exp_vals_sqrd, _ = create_terms(data, N_TERMS)
+        cases[f"{element} {lower_state}-{upper_state}"] = (rho_equation, DOMAIN, (velocity,),
+                                                           (omegas, exp_vals_sqrd), False)
+
+    report = {}
+    for name, (func, bracket, batch_args, args, exact) in cases.items():
+        roots, _, info = solve_batch(func, bracket, batch_args, *args, full_output=True)
+        mismatches, difference = 0, 0.0
+        for n in range(len(roots)):
+            root, stats = solve(func, bracket, *(arg[n] for arg in batch_args), *args,
+                                full_output=True)
+            mismatches += int(stats["iterations"] != info["iterations"][n])
+            difference = max(difference, abs(root - roots[n])/abs(root))
+        passed = (mismatches == 0) if exact else difference <= ROOT_TOLERANCE
+        report[name] = {"members": len(roots), "mismatches": mismatches,
+                        "root_difference": difference, "exact": exact, "passed": passed}
+    return report
+
+
+def _golden_values(golden: dict):
+    """Reference width + 1j*shift (n_lines x n_temperatures), checking the matrix matches."""
+    matrix = [(element, lower_state, upper_state, temperature)
+              for element, lower_state, upper_state in LINES for temperature in TEMPERATURES]
+    stored = [(entry["element"], entry["lower_state"], entry["upper_state"], entry["temperature"])
+              for entry in golden["results"]]
+    if stored != matrix:
+        raise ValueError("The golden file holds another validation matrix; run 'generate' again")
+    values = np.array([entry["width"] + 1j*entry["shift"] for entry in golden["results"]])
+    return values.reshape(len(LINES), len(TEMPERATURES))
+
+
+def _environment():
+    """Library versions, machine, git commit and date."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"griem": __version__, "python": platform.python_version(), "numpy": np.__version__,
+            "scipy": scipy.__version__, "platform": platform.platform(), "commit": commit,
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds")}
+
+
+def _print_report(report: dict):
+    """Print the output of `check` as a table."""
+    print(f"Reference time {report['reference_time']:.2f} s ({report['reference_source']})")
+    print(f"{'mode':<16} {'width max':>10} {'rms':>9} {'shift max':>10} {'rms':>9} "
+          f"{'d/w max':>10} {'rms':>9} {'time [s]':>9} {'speedup':>8}  result")
+    for name, entry in report["modes"].items():
+        deviation = entry["deviation"]
+        columns = " ".join(f"{deviation[q]['max']:10.2e} {deviation[q]['rms']:9.2e}"
+                           for q in ("width", "shift", "ratio"))
+        result = "PASS" if entry["passed"] else "FAIL"
+        print(f"{name:<16} {columns} {entry['time']:9.3f} {entry['speedup']:8.1f}  {result}")
+
+
+def main(argv: list = None):
+    """
+    Command line entry point, see the module docstring.
+
+    Args:
+        argv (list, optional): Arguments. Defaults to None (`sys.argv[1:]`).
+
+    Returns:
+        int: Exit status, 1 if a mode failed its thresholds.
+    """
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.validation",
+                                     description=__doc__.split("\n\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate_parser = commands.add_parser("generate", help="compute the golden reference")
+    generate_parser.add_argument("--output", default=GOLDEN_FILE, help="golden JSON file")
+    generate_parser.add_argument("--n-terms", type=int, default=N_TERMS)
+    generate_parser.add_argument("--n-velocities", type=int, default=N_VELOCITIES)
+    check_parser = commands.add_parser("check", help="validate the fast modes")
+    check_parser.add_argument("--golden", default=GOLDEN_FILE, help="golden JSON file")
+    check_parser.add_argument("--modes", default=None,
+                              help=f"comma-separated modes, of {', '.join(MODES)}")
+    check_parser.add_argument("--output", default=None, help="write the report as JSON")
+    commands.add_parser("solver", help="compare solve_batch with solve, member by member")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        golden = generate(args.output, args.n_terms, args.n_velocities)
+        print(f"Wrote {len(golden['results'])} reference results to {args.output} "
+              f"in {golden['metadata']['time']:.1f} s")
+        return 0
+    if args.command == "solver":
+        report = solver_consistency()
+        print(f"{'case':<22} {'members':>8} {'mismatches':>11} {'root diff':>10}  result")
+        for name, entry in report.items():
+            result = ("PASS" if entry["passed"] else "FAIL") + ("" if entry["exact"] else " (roots)")
+            print(f"{name:<22} {entry['members']:8d} {entry['mismatches']:11d} "
+                  f"{entry['root_difference']:10.2e}  {result}")
+        return int(not all(entry["passed"] for entry in report.values()))
+    with open(args.golden) as file:
+        golden = json.load(file)
+    report = check(golden, None if args.modes is None else args.modes.split(","))
+    _print_report(report)
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=1)
+    return int(not all(entry["passed"] for entry in report["modes"].values()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,2 +1,22 @@
 # griem/__init__.py
-from .api import Griem
+__version__ = "0.1.0"
+
+__all__ = ["Griem"]
+
+# Public names imported on first use, and the submodule defining each. `Griem` (and with it
+# pandas and tabulate) is lazy, so numeric code importing only `griem.run_engine` and worker
+# processes start without them
+_LAZY = {"Griem": ".api"}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        from importlib import import_module
+        value = getattr(import_module(_LAZY[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
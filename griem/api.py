@@ -6,14 +6,25 @@ Class that wraps around run() from run_engine.py for API
 
 # Import modules
 import numpy as np
+import pandas as pd
+from concurrent.futures import Executor
+from functools import partial
 from typing import Union
 
 from .utils.data_frame import Table
 from .utils.helpers import AliasDict
 
-from .utils.helpers import load_energy_data
+from .utils.helpers import load_energy_data, load_energy_index
 from .utils.helpers import find_upper_states
-from .run_engine import run
+from .utils.parallel import map_ordered, split_work
+from .utils.stages import StageCache
+from .utils.profiling import Profiler
+from .utils import functions
+from .run_engine import run, run_series, run_temperatures, run_adaptive
+from .run_engine import series_terms, series_kernel
+from .calc.data_processing import process_data, check_states
+from .calc.integral import as_evdf, integrate_series, integrate_stream
+from .utils.result_cache import ResultCache, DiskCache
 from .results.griem_results import GriemResults
 
 
@@ -36,15 +47,21 @@ class Griem:
         upper_state (str): Upper state(s) of the transition (e.g. '12F5/2' or 'F5/2').
         velocity (float, np.ndarray): Velocity of the electrons - can be a single value (v_bar),
                                       or it can be an array of velocities used with an EVDF.
-        EVDF (float, np.ndarray): Electron velocity distribution function (e.g. Maxwell-Boltzmann).
+        EVDF (float, np.ndarray): Electron velocity distribution function (e.g. Maxwell-Boltzmann),
+                                  or a 2-D array with one distribution per row.
         n_terms (int): The number of perturbing states to include in the calculation.
 
         energy_data (Table): The energy data used for the calculation.
         processed_data (AliasDict): Contains all the dataframes of calculation data.
         results (GriemResults): Contains the widths, shifts, and a table of the widths and shifts.
+        stages (StageCache): Outputs of the calculation stages and the inputs they depend on;
+                             `stages.recomputed` lists the stages the last `calculate()` ran.
 
     Methods:
         calculate(): Run the Griem calculation for the provided input.
+        scan_temperature(temperatures): Run the calculation for Maxwellian electrons at several
+                                        temperatures.
+        stream_evdf(snapshots): Yield the width and shift of a stream of EVDF snapshots.
 
     Example:
         >>> griem = Griem("Rb", "4D3/2", "12F5/2", 4e5, n_terms=4)
@@ -69,7 +86,12 @@ class Griem:
             velocity (float, np.ndarray): Velocity of the electrons - can be a single value (v_bar),
                                           or it can be an array of velocities used with an EVDF.
             EVDF (float, np.ndarray, optional): Electron velocity distribution function (e.g. 
-                                                Maxwell-Boltzmann). Defaults to 1.0.
+                                                Maxwell-Boltzmann). Defaults to 1.0. Several
+                                                EVDFs on the same velocity grid can be given as a
+                                                2-D array (n_distributions x n_vel) or an iterable;
+                                                each gets its own width and shift. A function of
+                                                velocity is evaluated on `velocity`, or on the
+                                                adaptive nodes of `calculate(rtol=...)`.
             n_terms (int, optional): The number of perturbing states to include in the calculation. 
                                      Defaults to 1.
         """
@@ -78,32 +100,188 @@ class Griem:
         self.lower_state = lower_state
         self.upper_state = upper_state
         self.velocity = velocity
-        self.EVDF = EVDF
+        self.EVDF = as_evdf(EVDF)
 
         # Initialize attributes for storing intermediate and final calculation values
         self.energy_data = Table(load_energy_data(element), title="Energy Data")
         self.processed_data = None
         self.results = None
+        self.stages = StageCache()
 
     # Define a method for the calculation
     def calculate(
             self,
-            num_terms: int = 1,
-            want_interact_states: bool = False
+            num_terms: Union[int, str] = 1,
+            want_interact_states: bool = False,
+            executor: Union[str, Executor] = "serial",
+            max_workers: int = None,
+            rtol: float = None,
+            terms_rtol: float = 1e-3,
+            cache: Union[ResultCache, DiskCache] = None,
+            rho_method: str = 'batch',
+            rho_rtol: float = 1e-6,
+            profile: Union[bool, Profiler] = False
         ):
         """Performs the Griem calculation using the specified upper states.
 
         This will calculate the width/shift for a single upper state if a complete quantum state
         is specified (e.g. "12F5/2"), or the width/shift for all the upper states with L_{j}
-        specified (e.g. "F5/2").
+        specified (e.g. "F5/2"). The upper states are independent, so they can be calculated in
+        parallel with `executor`; results are always in the order of the states.
+
+        With a fixed number of terms, the trapezoidal rule, the default rho_min solver and no
+        `cache`, each stage of the pipeline (process_data -> create_terms -> rho_min/summation
+        -> integral) is kept in `stages` with the inputs it depends on, and only the stages
+        downstream of a changed input are recomputed: a new `EVDF` is only re-integrated, a new
+        `num_terms` reuses the processed data, and an unchanged object is not recalculated at all.
 
         Args:
+            num_terms (int, str, optional): The number of perturbing states to include, or 'auto'
+                                            to add states (nearest first) until the width and
+                                            shift change by less than `terms_rtol`. Defaults to 1.
             want_interact_states (bool): user specifies if to show interacting states.
+            executor (str or Executor, optional): 'serial', 'thread', 'process', or an existing
+                                                  `concurrent.futures.Executor`. Defaults to 'serial'.
+            max_workers (int, optional): Number of thread or process workers. Defaults to None,
+                                         which lets `concurrent.futures` choose.
+            rtol (float, optional): If given, integrate adaptively over the range of `velocity`
+                                    to this relative error instead of using the trapezoidal rule
+                                    on `velocity`; the error estimates are added to the results.
+                                    Defaults to None.
+            terms_rtol (float, optional): Relative tolerance of `num_terms='auto'`. Defaults to 1e-3.
+            cache (ResultCache, DiskCache, optional): Cache of results by upper state, e.g.
+                                                      shared by several Griem objects with
+                                                      different lower states, or a `DiskCache`
+                                                      shared by processes and jobs; each upper
+                                                      state is then calculated once. Not used
+                                                      with `rtol`. Defaults to None.
+            rho_method (str, optional): rho_min solver method, e.g. 'surrogate' to solve at a few
+                                        adaptively chosen velocities and interpolate (see
+                                        `calc.rho_min.rhos_solve`); each state is then run on its
+                                        own. Defaults to 'batch'.
+            rho_rtol (float, optional): Residual tolerance of the 'surrogate' method. Defaults
+                                        to 1e-6.
+            profile (bool, Profiler, optional): Time the pipeline stages and count the root-solver
+                                                iterations and special-function evaluations (see
+                                                `utils.profiling`), with a new or the given
+                                                `Profiler`, whose callbacks receive the report; the
+                                                report is stored as `results.profile`. Defaults
+                                                to False.
         """
+        if not profile:
+            self._calculate(num_terms, want_interact_states, executor, max_workers, rtol,
+                            terms_rtol, cache, rho_method, rho_rtol)
+            return
+        profiler = Profiler() if profile is True else profile
+        with profiler:
+            self._calculate(num_terms, want_interact_states, executor, max_workers, rtol,
+                            terms_rtol, cache, rho_method, rho_rtol)
+        self.results.profile = profiler.report()
+
+    def _calculate(
+            self,
+            num_terms: Union[int, str],
+            want_interact_states: bool,
+            executor: Union[str, Executor],
+            max_workers: int,
+            rtol: float,
+            terms_rtol: float,
+            cache: Union[ResultCache, DiskCache],
+            rho_method: str,
+            rho_rtol: float
+        ):
+        """Runs `calculate` with the arguments it documents."""
         states = self._get_states()
-        width_shift, interact_states, processed_data = self._build_width_shift(states, num_terms)
+        if rtol is None and num_terms != 'auto' and cache is None and rho_method == 'batch':
+            self._calculate_stages(states, num_terms, want_interact_states, executor, max_workers)
+            return
+        width_shift, interact_states, processed_data, error = self._build_width_shift(
+            states, num_terms, executor, max_workers, rtol, terms_rtol, cache, rho_method, rho_rtol)
         self.processed_data = self._assign_processed_data(states, processed_data)
-        self.results = self._assign_results(width_shift, states, interact_states, want_interact_states)
+        n_terms = [len(row) for row in interact_states] if num_terms == 'auto' else None
+        self.results = self._assign_results(width_shift, states, interact_states, want_interact_states,
+                                            error, n_terms)
+
+    def scan_temperature(
+            self,
+            temperatures: Union[float, np.ndarray],
+            num_terms: int = 1,
+            n_nodes: int = 32,
+            want_interact_states: bool = False,
+            executor: Union[str, Executor] = "serial",
+            max_workers: int = None
+        ):
+        """Performs the Griem calculation for Maxwellian electrons at several temperatures.
+
+        The `velocity` and `EVDF` attributes are not used: every temperature is integrated with a
+        Maxwellian quadrature rule (see `calc.integral.maxwellian_quadrature`), and the rho_min
+        solutions and summation are shared by all temperatures of an upper state.
+
+        Args:
+            temperatures (float, np.ndarray): Electron temperatures [K].
+            num_terms (int, optional): The number of perturbing states to include. Defaults to 1.
+            n_nodes (int, optional): Number of quadrature nodes per temperature. Defaults to 32.
+            want_interact_states (bool): user specifies if to show interacting states.
+            executor (str or Executor, optional): 'serial', 'thread', 'process', or an existing
+                                                  `concurrent.futures.Executor`. Defaults to 'serial'.
+            max_workers (int, optional): Number of thread or process workers. Defaults to None.
+
+        Returns:
+            GriemResults: The results, with one width and shift per upper state and temperature.
+        """
+        temperatures = np.atleast_1d(np.asarray(temperatures, dtype=np.float64))
+        states = self._get_states()
+        run_state = partial(run_temperatures, self.element, self.lower_state,
+                            temperatures=temperatures, n_terms=num_terms, n_nodes=n_nodes)
+        results = map_ordered(run_state, states, executor, max_workers,
+                              energy_data={self.element: load_energy_index(self.element).levels})
+
+        width_shift = np.zeros((len(states), len(temperatures)), dtype=np.complex128)
+        interact_states = [[] for _ in range(len(states))]
+        processed_data = {}
+        for n, result in enumerate(results):
+            width_shift[n], interact_states[n], processed_data[n] = result
+        self.processed_data = self._assign_processed_data(states, processed_data)
+        self.results = GriemResults(width_shift, states,
+                                    interact_states if want_interact_states else None,
+                                    temperatures=temperatures)
+        return self.results
+
+    def stream_evdf(
+            self,
+            snapshots,
+            num_terms: int = 1,
+            batch_size: int = 256,
+            executor: Union[str, Executor] = "serial",
+            max_workers: int = None
+        ):
+        """Yields the width and shift of each EVDF snapshot on the `velocity` grid.
+
+        rho_min and the summation are solved once (and reused from `stages` if `velocity` and
+        `num_terms` did not change), then the snapshots are integrated in batches as they are
+        read, so the snapshots never have to fit in memory together. The `EVDF` attribute is
+        not used.
+
+        Example:
+            >>> snapshots = np.load("evdf.npy", mmap_mode="r")   # (n_snapshots x n_vel)
+            >>> widths = [width_shift.real for width_shift in griem.stream_evdf(snapshots, 3)]
+
+        Args:
+            snapshots (np.ndarray or iterable): (n_snapshots x n_vel) array or memory map, or an
+                                                iterable (e.g. a generator) of EVDF arrays.
+            num_terms (int, optional): The number of perturbing states to include. Defaults to 1.
+            batch_size (int, optional): Number of snapshots integrated together. Defaults to 256.
+            executor (str or Executor, optional): How to run the rho_min stage. Defaults to 'serial'.
+            max_workers (int, optional): Number of thread or process workers. Defaults to None.
+
+        Yields:
+            np.ndarray: width/shift complex value of each upper state, one array per snapshot.
+        """
+        self.stages.reset_log()
+        (rhos, summation), _, _ = self._kernel_stages(self._get_states(), num_terms, executor,
+                                                      max_workers)
+        for width_shift in integrate_stream(self.velocity, rhos, summation, snapshots, batch_size):
+            yield width_shift / (2*np.pi)
 
     # Define submethods of `calculation()` method
     def _get_states(self):
@@ -117,51 +295,198 @@ class Griem:
         else:
             return find_upper_states(self.element, self.upper_state)
 
+    def _calculate_stages(
+            self,
+            states: np.ndarray,
+            num_terms: int,
+            want_interact_states: bool,
+            executor: Union[str, Executor] = "serial",
+            max_workers: int = None
+        ):
+        """Calculates the width and shift of all the `states`, reusing unchanged stages.
+
+        Args:
+            states (np.ndarray): array of strings of all the upper states for width and shift calc.
+            num_terms (int): The number of perturbing states to include.
+            want_interact_states (bool): user specifies if to show interacting states.
+            executor (str or Executor, optional): How to run the rho_min stage. Defaults to 'serial'.
+            max_workers (int, optional): Number of thread or process workers. Defaults to None.
+        """
+        self.stages.reset_log()
+        kernel, kernel_key, interact_states = self._kernel_stages(states, num_terms, executor,
+                                                                  max_workers)
+        EVDF = as_evdf(self.EVDF)
+        if callable(EVDF):
+            EVDF = EVDF(self.velocity)
+        width_shift, _ = self.stages.run(
+            "integral", (kernel_key, EVDF),
+            lambda: integrate_series(self.velocity, *kernel, EVDF) / (2*np.pi))
+        self.results = self._assign_results(width_shift, states, interact_states, want_interact_states)
+
+    def _kernel_stages(
+            self,
+            states: np.ndarray,
+            num_terms: int,
+            executor: Union[str, Executor] = "serial",
+            max_workers: int = None
+        ):
+        """Runs (or reuses) the stages up to rho_min and the summation, and sets `processed_data`.
+
+        Args:
+            states (np.ndarray): array of strings of all the upper states for width and shift calc.
+            num_terms (int): The number of perturbing states to include.
+            executor (str or Executor, optional): How to run the rho_min stage. Defaults to 'serial'.
+            max_workers (int, optional): Number of thread or process workers. Defaults to None.
+
+        Returns:
+            tuple:
+                tuple: rho_min and the summation, each (n_states x n_vel).
+                str: input digest of the kernel stage.
+                list: interacting states of each upper state.
+        """
+        # The lower state is only checked, so changing it does not invalidate any stage
+        index = load_energy_index(self.element)
+        for state in states:
+            check_states(index, self.lower_state, state)
+
+        stages = self.stages
+        processed_data, processed_key = stages.run(
+            "process_data", (self.element, *states),
+            lambda: [process_data(index, None, state) for state in states])
+        self.processed_data, _ = stages.run(
+            "tables", (processed_key,),
+            lambda: self._assign_processed_data(states, dict(enumerate(processed_data))))
+        terms, terms_key = stages.run("terms", (processed_key, num_terms),
+                                      lambda: series_terms(processed_data, num_terms))
+        omegas, exp_vals_sqrd, interact_states = terms
+
+        backend = (functions.get_backend(), getattr(functions._BACKEND["tables"], "rtol", None))
+        kernel, kernel_key = stages.run(
+            "kernel", (terms_key, self.velocity, *backend),
+            lambda: self._build_kernel(omegas, exp_vals_sqrd, executor, max_workers))
+        return kernel, kernel_key, interact_states
+
+    def _build_kernel(
+            self,
+            omegas: np.ndarray,
+            exp_vals_sqrd: np.ndarray,
+            executor: Union[str, Executor] = "serial",
+            max_workers: int = None
+        ):
+        """rho_min and the summation of every upper state on `velocity`, one chunk of states
+        per worker.
+
+        Args:
+            omegas (np.ndarray): Angular frequencies of the perturbing states (n_states x n_terms).
+            exp_vals_sqrd (np.ndarray): Squared expectation values (n_states x n_terms).
+            executor (str or Executor, optional): How to run the chunks. Defaults to 'serial'.
+            max_workers (int, optional): Number of thread or process workers. Defaults to None.
+
+        Returns:
+            tuple: rho_min and the summation, each (n_states x n_vel).
+        """
+        chunks = [(self.velocity, omegas[rows], exp_vals_sqrd[rows])
+                  for rows in split_work(np.arange(len(omegas)), executor, max_workers)]
+        results = map_ordered(_kernel_chunk, chunks, executor, max_workers)
+        return (np.concatenate([rhos for rhos, _ in results]),
+                np.concatenate([summation for _, summation in results]))
+
     def _build_width_shift(
             self, 
             states: np.ndarray,
-            num_terms: int = 1
+            num_terms: Union[int, str] = 1,
+            executor: Union[str, Executor] = "serial",
+            max_workers: int = None,
+            rtol: float = None,
+            terms_rtol: float = 1e-3,
+            cache: Union[ResultCache, DiskCache] = None,
+            rho_method: str = 'batch',
+            rho_rtol: float = 1e-6
         ):
         """Calculates the width and shift of all the `states`.
 
+        With a fixed number of terms and the trapezoidal rule, the states are calculated together
+        by `run_series` (one batch per worker); otherwise each state is run on its own.
+
         Args:
             states (np.ndarray): array of strings of all the upper states for width and shift calc.
+            num_terms (int, optional): The number of perturbing states to include. Defaults to 1.
+            executor (str or Executor, optional): How to run the states. Defaults to 'serial'.
+            max_workers (int, optional): Number of thread or process workers. Defaults to None.
+            rtol (float, optional): Relative error of adaptive integration. Defaults to None, which
+                                    uses the trapezoidal rule on `velocity`.
+            terms_rtol (float, optional): Relative tolerance of `num_terms='auto'`. Defaults to 1e-3.
+            cache (ResultCache, DiskCache, optional): Cache of results by upper state. Defaults
+                                                      to None.
+            rho_method (str, optional): rho_min solver method. Defaults to 'batch'.
+            rho_rtol (float, optional): Residual tolerance of the 'surrogate' method. Defaults
+                                        to 1e-6.
 
         Returns:
             tuple:
-                np.ndarray: width/shift complex value.
+                np.ndarray: width/shift complex value, (n_states x n_distributions) for several EVDFs.
                 np.ndarray: list of interacting states.
                 dict: processed energy/exp_val data for each upper states.                                          
+                np.ndarray: width/shift error estimates of adaptive integration, otherwise None.
         """
         num_states = len(states)
-        width_shift = np.zeros(num_states, dtype=np.complex128)
+        if np.ndim(self.EVDF) == 2:
+            width_shift = np.zeros((num_states, len(self.EVDF)), dtype=np.complex128)
+        else:
+            width_shift = np.zeros(num_states, dtype=np.complex128)
         interact_states = [[] for _ in range(num_states)]
         processed_data = {}
-        for n, state in enumerate(states):
-            width_shift[n], interact_states[n], processed_data[n] = run(self.element, self.lower_state, 
-                                                                        state, self.velocity, self.EVDF, 
-                                                                        num_terms)  
-        return width_shift, interact_states, processed_data
+        if rtol is None and num_terms != 'auto' and rho_method == 'batch':
+            run_chunk = partial(run_series, self.element, self.lower_state, velocity=self.velocity,
+                                EVDF=self.EVDF, n_terms=num_terms, cache=cache)
+            results = map_ordered(run_chunk, split_work(states, executor, max_workers), executor,
+                                  max_workers,
+                                  energy_data={self.element: load_energy_index(self.element).levels})
+            n = 0
+            for chunk_width_shift, chunk_interact_states, chunk_processed_data in results:
+                for m in range(len(chunk_interact_states)):
+                    width_shift[n], interact_states[n] = chunk_width_shift[m], chunk_interact_states[m]
+                    processed_data[n] = chunk_processed_data[m]
+                    n += 1
+            return width_shift, interact_states, processed_data, None
+
+        if rtol is None:
+            error = None
+            run_state = partial(run, self.element, self.lower_state, velocity=self.velocity,
+                                EVDF=self.EVDF, n_terms=num_terms, terms_rtol=terms_rtol,
+                                cache=cache, rho_method=rho_method, rho_rtol=rho_rtol)
+        else:
+            error = np.zeros(num_states, dtype=np.complex128)
+            run_state = partial(run_adaptive, self.element, self.lower_state, velocity=self.velocity,
+                                EVDF=self.EVDF, n_terms=num_terms, rtol=rtol)
+        results = map_ordered(run_state, states, executor, max_workers,
+                              energy_data={self.element: load_energy_index(self.element).levels})
+        for n, result in enumerate(results):
+            if rtol is None:
+                width_shift[n], interact_states[n], processed_data[n] = result
+            else:
+                width_shift[n], error[n], interact_states[n], processed_data[n] = result
+        return width_shift, interact_states, processed_data, error
     
     def _assign_processed_data(
             self, 
             states: np.ndarray, 
             processed_data: dict
         ):
-        """Creates alias for each dict key and converts each dataframe to `Table()`.
+        """Creates alias for each dict key and converts each processed array to `Table()`.
         
-        Takes dict of processed data dataframes and converts each dataframe to a `Table` and creates
+        Takes dict of processed data arrays and converts each array to a `Table` and creates
         alias key for each Table, e.g. processed_data[0] = processed_data["12F5/2"].
 
         Args:
             states (np.ndarray): String array of all upper states to calculate width/shift for.
-            processed_data (dict): Contains all processed_data dataframes for each upper state.
+            processed_data (dict): Contains all processed_data structured arrays for each upper state.
 
         Returns:
             dict: A new AliasDict mapping both integer and state name keys to Table objects.
         """
 
-        tables = {n: Table(processed_data[n], title=f"Upper state {state.replace('/', '')} data")
+        tables = {n: Table(pd.DataFrame(processed_data[n]), title=f"Upper state {state.replace('/', '')} data")
                   for n, state in enumerate(states)}
         aliases = {state: n for n, state in enumerate(states)}
         return AliasDict(tables, aliases=aliases)
@@ -171,7 +496,9 @@ class Griem:
             width_shift: np.ndarray, 
             states: np.ndarray, 
             interact_states: np.ndarray, 
-            want_interact_states: bool
+            want_interact_states: bool,
+            error: np.ndarray = None,
+            n_terms: list = None
         ):
         """Assigns the results of the calculation.
 
@@ -181,13 +508,20 @@ class Griem:
             interact_states (np.ndarray): 2D array of the interacting states 
                                           included in each calculation.
             want_interact_states (bool): if user wants to show the interacting states.
+            error (np.ndarray, optional): width/shift error estimates (np.complex128). Defaults to None.
+            n_terms (list, optional): number of perturbing states used for each upper state, shown
+                                      when they were chosen automatically. Defaults to None.
 
         Returns:
             GriemResults: object containing widths and shifts to display or save.
         """
         if want_interact_states:
-            return GriemResults(width_shift, states, interact_states)
+            return GriemResults(width_shift, states, interact_states, error=error, n_terms=n_terms)
         else:
-            return GriemResults(width_shift, states)
+            return GriemResults(width_shift, states, error=error, n_terms=n_terms)
         
 
+
+def _kernel_chunk(chunk: tuple):
+    """`series_kernel` of a (velocity, omegas, exp_vals_sqrd) chunk (process pool task)."""
+    return series_kernel(*chunk)
@@ -9,15 +9,28 @@ expectation value computation, and extraction of perturbing states.
 
 
 # Import modules
+from __future__ import annotations
+
 import numpy as np
-import pandas as pd
+from typing import TYPE_CHECKING, Union
+
+from ..constants import SPEED_OF_LIGHT
+from ..utils.energy_index import EnergyIndex
+from ..utils.profiling import timed
 
-from ..constants import ANGULAR_MOMENTUM_QUANTUM_NUMBERS, SPEED_OF_LIGHT
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Columns added to the energy data by `process_data`
+_FREQUENCY_FIELDS = [("nu", np.float64), ("nu_abs", np.float64), ("omega", np.float64)]
+_CROSS_SECTION_FIELDS = [("sigma_minus", np.float64), ("sigma_plus", np.float64),
+                         ("expectation_value_sqrd", np.float64)]
 
 
 # Define main functions
+@timed("process_data")
 def process_data(
-        energy_data: pd.DataFrame, 
+        energy_data: Union[EnergyIndex, pd.DataFrame], 
         lower_state: str, 
         upper_state: str
     ):
@@ -29,84 +42,124 @@ def process_data(
     transition frequencies, angular frequencies, and dipole interaction cross sections, and
     prepares the data for summation in the line broadening model.
 
+    The filtering works on the array-backed `EnergyIndex` of the element: the candidate rows
+    are the precomputed rows with l = L ± 1, so each state only takes a few array slices.
+
     Args:
-        energy_data (pd.DataFrame): Raw energy level data, including configuration, l, j, and energy columns.
-        lower_state (str): Configuration string of the lower state (e.g., "5P3/2").
+        energy_data (EnergyIndex, pd.DataFrame): Energy level index (see
+                                                 `helpers.load_energy_index`), or raw energy
+                                                 level data, including configuration, l, j,
+                                                 and energy columns.
+        lower_state (str): Configuration string of the lower state (e.g., "5P3/2"), or None if
+                           the transition has been checked already.
         upper_state (str): Configuration string of the upper state (e.g., "12F5/2").
 
     Raises:
         ValueError: If the `lower_state` or `upper_state` configuration is not found in the data.
 
     Returns:
-        pd.DataFrame: A processed DataFrame containing:
+        np.ndarray: A processed structured array, sorted by `nu_abs`, with the columns of the
+                    energy data and:
             - transition frequencies (`nu`, `nu_abs`)
             - angular frequencies (`omega`)
             - squared expectation values (`expectation_value_sqrd`)
             - labeled and filtered interaction states
     """
     shift_direction = -1
+    index = energy_data if isinstance(energy_data, EnergyIndex) else EnergyIndex.from_frame(energy_data)
+
     # Define quantum values to use in calculations
-    upper_momentum_letter = upper_state[-4]
-    upper_momentum_value = ANGULAR_MOMENTUM_QUANTUM_NUMBERS[upper_momentum_letter]
-
-    # Deleting rows of momentum other than `upper_momentum_value`
-    data = energy_data.copy()
-    data = data.loc[(data['l'] == upper_momentum_value + 1) 
-                                        | (data['l'] == upper_momentum_value - 1) 
-                                        | (data['Config'] == upper_state)]
-    
-    # Find row index of states
-    lower_state_match = data.index[data['Config'] == lower_state]
-    if not lower_state_match.empty:
-        lower_state_index = lower_state_match[0]
-    else:
-        raise ValueError(f"No lower state with configuation: {lower_state}")
+    upper_state_index = check_states(index, lower_state, upper_state)
+    upper_momentum_value = int(index.l[upper_state_index])
+
+    # Rows of momentum `upper_momentum_value` +- 1, and the upper state itself, in table order
+    no_rows = np.zeros(0, dtype=np.intp)
+    same_l = index.by_l.get(upper_momentum_value, no_rows)
+    rows = np.sort(np.concatenate([index.by_l.get(upper_momentum_value - 1, no_rows),
+                                   index.by_l.get(upper_momentum_value + 1, no_rows),
+                                   same_l[index.levels["Config"][same_l] == upper_state]]))
+
+    # Calculate energy differences, and sort by them
+    energy = index.levels["Energy"][rows]
+    nu = SPEED_OF_LIGHT*100*(energy - index.levels["Energy"][upper_state_index])*shift_direction
+    order = np.argsort(np.abs(nu), kind="quicksort")
+    rows, nu = rows[order], nu[order]
 
-    upper_state_match = data.index[data['Config'] == upper_state]
-    if not upper_state_match.empty:
-        upper_state_index = upper_state_match[0]
-    else:
-        raise ValueError(f"No upper state with configuation: {upper_state}")
+    # Dropping configurations of multiple j
+    _, first = np.unique(index.general[rows], return_index=True)
+    keep = np.sort(first)
+    rows, nu = rows[keep], nu[keep]
+
+    fields = (index.levels.dtype.descr + _FREQUENCY_FIELDS
+              + [("Config_general", index.general.dtype)] + _CROSS_SECTION_FIELDS)
+    data = np.empty(len(rows), dtype=fields)
+    for name in index.levels.dtype.names:
+        data[name] = index.levels[name][rows]
+    data["nu"] = nu
+    data["nu_abs"] = np.abs(nu)
+    data["omega"] = nu*2*np.pi
+    data["Config_general"] = index.general[rows]
 
+    # Calculating cross sections
+    nnl, l = data["nnl"], index.l[rows]
+    minus, plus = l == upper_momentum_value - 1, l == upper_momentum_value + 1
+    data["sigma_minus"], data["sigma_plus"], data["expectation_value_sqrd"] = np.nan, np.nan, np.nan
+    data["sigma_minus"][minus] = ((3/2)*nnl[minus]
+                                  *np.sqrt(np.abs((nnl[minus]**2 - upper_momentum_value**2)
+                                                  / (4*upper_momentum_value**2 - 1))))
+    data["sigma_plus"][plus] = ((3/2)*nnl[plus]
+                                *np.sqrt(np.abs((nnl[plus]**2 - (upper_momentum_value + 1)**2)
+                                                / (4*(upper_momentum_value + 1)**2 - 1))))
+
+    data["expectation_value_sqrd"][minus] = (
+        upper_momentum_value*(2*upper_momentum_value - 1)*data["sigma_minus"][minus]**2)
+    data["expectation_value_sqrd"][plus] = (
+        (upper_momentum_value + 1)*(2*upper_momentum_value + 3)*data["sigma_plus"][plus]**2)
 
+    return data
 
 
+def check_states(
+        index: EnergyIndex,
+        lower_state: str,
+        upper_state: str
+    ):
+    """
+    Check that a transition exists in the energy data.
 
-    # Calculate energy differences
-    # transition_energy = data.loc[lower_state_index, 'Energy'] - data.loc[upper_state_index, 'Energy']
-    # omega_lower_state = 2*SPEED_OF_LIGHT*100*np.pi*wave_number
-    data['nu'] = SPEED_OF_LIGHT*100*(data['Energy'] - data.loc[upper_state_index, 'Energy'])*shift_direction
-    data['nu_abs'] = np.abs(data['nu'])
-    data['omega'] = data['nu']*2*np.pi
-    data = data.sort_values('nu_abs')
+    The lower state must have l = L ± 1, where L is the orbital angular momentum of the upper
+    state. This is the only way the lower state enters the calculation, so results can be
+    shared between lines with the same upper state (see `utils.result_cache`).
 
-    # Dropping configurations of multiple j
-    data['Config_general'] = data['Config'].str[:-3]
-    data = data.drop_duplicates(subset=['Config_general'], keep='first')
+    Args:
+        index (EnergyIndex): Energy level index of the element.
+        lower_state (str): Configuration string of the lower state (e.g., "5P3/2"), or None to
+                           only check the upper state.
+        upper_state (str): Configuration string of the upper state (e.g., "12F5/2").
 
-    # Calculating cross sections
-    cross_sections_minus = ((3/2)*data.loc[data['l'] == upper_momentum_value - 1, 'nnl']
-                           *np.sqrt(np.abs((data.loc[data['l'] == upper_momentum_value - 1, 'nnl']**2 
-                                            - upper_momentum_value**2) / (4*upper_momentum_value**2 - 1))))
-    cross_sections_plus = ((3/2)*data.loc[data['l'] == upper_momentum_value + 1, 'nnl']
-                        *np.sqrt(np.abs((data.loc[data['l'] == upper_momentum_value + 1, 'nnl']**2 
-                                        - (upper_momentum_value + 1)**2) / (4*(upper_momentum_value + 1)**2 - 1))))
-
-    data.loc[data['l'] == upper_momentum_value-1, 'sigma_minus'] = cross_sections_minus
-    data.loc[data['l'] == upper_momentum_value+1, 'sigma_plus'] = cross_sections_plus
-
-
-    data.loc[data['l'] == upper_momentum_value - 1, 'expectation_value_sqrd'] = (
-        upper_momentum_value*(2*upper_momentum_value - 1)*data['sigma_minus']**2)
-    
-    data.loc[data['l'] == upper_momentum_value + 1, 'expectation_value_sqrd'] = (
-        (upper_momentum_value + 1)*(2*upper_momentum_value + 3)*data['sigma_plus']**2)
-    
-    return data
+    Raises:
+        ValueError: If the `lower_state` or `upper_state` configuration is not found in the data.
 
+    Returns:
+        int: Row of the upper state in `index`.
+    """
+    upper_state_index = index.row(upper_state)
+    lower_state_index = index.row(lower_state)
+    if upper_state_index is None:
+        raise ValueError(f"No upper state with configuation: {upper_state}")
+    upper_momentum_value = int(index.l[upper_state_index])
+    if lower_state is None:
+        return upper_state_index
+    if lower_state_index is None or (index.l[lower_state_index] not in (upper_momentum_value - 1,
+                                                                      upper_momentum_value + 1)
+                                     and lower_state != upper_state):
+        raise ValueError(f"No lower state with configuation: {lower_state}")
+    return upper_state_index
 
+
+@timed("create_terms")
 def create_terms(
-        processed_data: pd.DataFrame, 
+        processed_data: Union[np.ndarray, pd.DataFrame], 
         n_terms: int
     ):
     """
@@ -117,7 +170,8 @@ def create_terms(
     directionality (+ or -) for display purposes.
 
     Args:
-        processed_data (pd.DataFrame): The output of `process_data()`, containing sorted and filtered states.
+        processed_data (np.ndarray, pd.DataFrame): The output of `process_data()`, containing
+                                                   sorted and filtered states.
         n_terms (int): Number of perturbing terms to extract for summation.
 
     Returns:
@@ -126,15 +180,13 @@ def create_terms(
             exp_vals_sqrd (np.ndarray): Expectation values squared for each perturbing state.
             signed_interact_states (list of str): Labels for perturbing states with sign (e.g., "+5D3/2").
     """
-    omegas = np.array(processed_data['omega'].iloc[1:n_terms+1]) 
-    exp_vals_sqrd = np.array(processed_data['expectation_value_sqrd'].iloc[1:n_terms+1])
+    omegas = np.array(processed_data['omega'][1:n_terms+1], dtype=np.float64)
+    exp_vals_sqrd = np.array(processed_data['expectation_value_sqrd'][1:n_terms+1], dtype=np.float64)
 
     signs_float = np.sign(omegas)
     signs_str = ["+" if sign > 0 else "-" for sign in signs_float]
 
-    interact_states = processed_data['Config'].iloc[1:n_terms+1].tolist()
+    interact_states = [str(state) for state in processed_data['Config'][1:n_terms+1]]
     signed_interact_states = [sign + state for sign, state in zip(signs_str, interact_states)]
 
     return omegas, exp_vals_sqrd, signed_interact_states
-
-
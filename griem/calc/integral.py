@@ -6,18 +6,47 @@ from Griem, Physical Review 128, 515 (1962).
 
 The integral combines impact parameter dependence, the velocity distribution
 (EVDF), and a summation over perturbing states to compute the total width/shift.
+Several EVDFs sharing the same velocity grid can be integrated at once: the
+velocity kernel does not depend on the EVDF, so all integrals reduce to a single
+matrix product.
 """
 
 # Import modules
+from itertools import islice
+
 import numpy as np
+from scipy.special import roots_legendre
 from typing import Union
 
-from ..constants import H_BAR, ELECTRON_MASS
+from ..constants import H_BAR, ELECTRON_MASS, BOLTZMANN_CONSTANT
+from ..utils.profiling import timed
+
+# Reduced speed v/v_T beyond which the Maxwellian is negligible (exp(-36) ~ 2e-16)
+MAXWELLIAN_CUTOFF = 6.0
 
+# Gauss-Kronrod (7, 15) rule on [-1, 1]. The Gauss nodes are the Kronrod nodes with odd index
+_KRONROD_NODES = np.array([
+    0.991455371120812639206854697526329, 0.949107912342758524526189684047851,
+    0.864864423359769072789712788640926, 0.741531185599394439863864773280788,
+    0.586087235467691130294144845693013, 0.405845151377397166906606412076961,
+    0.207784955007898467600689403773245, 0.0])
+_KRONROD_WEIGHTS = np.array([
+    0.022935322010529224963732008058970, 0.063092092629978553290700663189204,
+    0.104790010322250183839876322541518, 0.140653259715525918745189590510238,
+    0.169004726639267902826583426598550, 0.190350578064785409913256402421014,
+    0.204432940075298892414161999234649, 0.209482141084727828012999174891714])
+_GAUSS_WEIGHTS = np.array([
+    0.129484966168869693270611432679082, 0.279705391489276667901467771423780,
+    0.381830050505118944950369775488975, 0.417959183673469387755102040816327])
+GK_NODES = np.concatenate([-_KRONROD_NODES[:-1], _KRONROD_NODES[::-1]])
+GK_WEIGHTS = np.concatenate([_KRONROD_WEIGHTS[:-1], _KRONROD_WEIGHTS[::-1]])
+GAUSS_WEIGHTS = np.concatenate([_GAUSS_WEIGHTS[:-1], _GAUSS_WEIGHTS[::-1]])
+
+@timed("integrate")
 def integrate_griem(
-        vels: Union[float, np.ndarray], 
-        rhos: Union[float, np.ndarray], 
-        summation: Union[float, np.ndarray], 
+        vels: Union[float, np.ndarray],
+        rhos: Union[float, np.ndarray],
+        summation: Union[float, np.ndarray],
         EVDF: Union[float, np.ndarray]
     ):
     """
@@ -28,16 +57,336 @@ def integrate_griem(
     electron velocity distribution function (EVDF). If `vels` is a scalar, the expression is
     evaluated directly; if an array, numerical integration is performed using the trapezoidal rule.
 
+    A 2-D `EVDF` of shape (n_distributions, n_vel) is integrated row by row with one matrix
+    product against the trapezoid-weighted kernel, giving one result per distribution.
+
     Args:
         vels (float or np.ndarray): Electron velocity (single value or array for EVDF integration).
         rhos (float or np.ndarray): Critical impact parameter(s), one per velocity.
         summation (float or np.ndarray): Summed contribution from perturbing states, same shape as `vels`.
-        EVDF (float or np.ndarray): Electron velocity distribution function values (same shape as `vels`).
+        EVDF (float or np.ndarray): Electron velocity distribution function values (same shape as `vels`),
+                                    or one distribution per row.
 
     Returns:
-        float: Result of the evaluated or integrated broadening expression.
+        float or np.ndarray: Result of the evaluated or integrated broadening expression, one per
+                             distribution for a 2-D `EVDF`.
     """
-    f = EVDF * (np.pi*vels*(rhos*1e-10)**2 + ((4*np.pi)/(3*vels))*(H_BAR/ELECTRON_MASS)**2 * summation)
+    kernel = velocity_kernel(vels, rhos, summation)
+    if np.ndim(EVDF) == 2:
+        EVDF = np.asarray(EVDF, dtype=np.float64)
+        if kernel.size == 1:
+            return EVDF[:, 0]*kernel[0]
+        weighted = trapezoid_weights(vels)*kernel
+        return EVDF @ weighted.real + 1j*(EVDF @ weighted.imag)
+
+    f = EVDF * kernel
     if len(f) == 1:
         return f
     else: return np.trapz(f, vels)
+
+
+@timed("integrate")
+def integrate_series(
+        vels: Union[float, np.ndarray],
+        rhos: np.ndarray,
+        summation: np.ndarray,
+        EVDF: Union[float, np.ndarray]
+    ):
+    """
+    Integrate the broadening expression of several upper states at once.
+
+    Same as `integrate_griem`, with one row of `rhos` and `summation` per upper state, all on
+    the velocity grid `vels`.
+
+    Args:
+        vels (float or np.ndarray): Electron velocity (single value or array for EVDF integration).
+        rhos (np.ndarray): Critical impact parameters (n_states x n_vel).
+        summation (np.ndarray): Summed contribution from perturbing states (n_states x n_vel).
+        EVDF (float or np.ndarray): Electron velocity distribution function (same shape as `vels`),
+                                    or one distribution per row.
+
+    Returns:
+        np.ndarray: One result per upper state, (n_states x n_distributions) for a 2-D `EVDF`.
+    """
+    kernel = velocity_kernel(vels, rhos, summation)
+    if np.ndim(EVDF) == 2:
+        EVDF = np.asarray(EVDF, dtype=np.float64)
+        if kernel.shape[-1] == 1:
+            return kernel[:, :1]*EVDF[:, 0]
+        weighted = trapezoid_weights(vels)*kernel
+        return (EVDF @ weighted.real.T + 1j*(EVDF @ weighted.imag.T)).T
+
+    f = EVDF * kernel
+    if f.shape[-1] == 1:
+        return f[:, 0]
+    return np.trapz(f, vels, axis=-1)
+
+
+def integrate_stream(
+        vels: np.ndarray,
+        rhos: np.ndarray,
+        summation: np.ndarray,
+        snapshots,
+        batch_size: int = 256
+    ):
+    """
+    Integrate a stream of EVDF snapshots against a fixed velocity kernel.
+
+    The snapshots are read `batch_size` at a time (slices of an array or memory map, or items
+    of an iterator), so only one batch is ever held in memory, and each batch is integrated by
+    `integrate_series` as a 2-D EVDF.
+
+    Args:
+        vels (np.ndarray): Electron velocity grid shared by all snapshots.
+        rhos (np.ndarray): Critical impact parameters (n_states x n_vel).
+        summation (np.ndarray): Summed contribution from perturbing states (n_states x n_vel).
+        snapshots (np.ndarray or iterable): (n_snapshots x n_vel) array or memory map, or an
+                                            iterable of EVDF arrays on `vels`.
+        batch_size (int, optional): Number of snapshots integrated together. Defaults to 256.
+
+    Raises:
+        ValueError: If a snapshot does not have one value per velocity.
+
+    Yields:
+        np.ndarray: One integral per upper state, for each snapshot in order.
+    """
+    if isinstance(snapshots, np.ndarray):
+        batches = (snapshots[start:start + batch_size]
+                   for start in range(0, len(snapshots), batch_size))
+    else:
+        iterator = iter(snapshots)
+        batches = iter(lambda: list(islice(iterator, batch_size)), [])
+
+    for batch in batches:
+        batch = np.array(batch, dtype=np.float64, ndmin=2)
+        if batch.shape[1] != np.size(vels):
+            raise ValueError(f"EVDF snapshots must have {np.size(vels)} values, got {batch.shape[1]}")
+        yield from integrate_series(vels, rhos, summation, batch).T
+
+
+def velocity_kernel(
+        vels: Union[float, np.ndarray],
+        rhos: Union[float, np.ndarray],
+        summation: Union[float, np.ndarray]
+    ):
+    """
+    The EVDF-independent integrand of Griem's broadening expression.
+
+    Args:
+        vels (float or np.ndarray): Electron velocities.
+        rhos (float or np.ndarray): Critical impact parameter(s), one per velocity.
+        summation (float or np.ndarray): Summed contribution from perturbing states.
+
+    Returns:
+        np.ndarray: Complex integrand at each velocity, to be multiplied by the EVDF.
+    """
+    vels = np.atleast_1d(vels)
+    return np.pi*vels*(rhos*1e-10)**2 + ((4*np.pi)/(3*vels))*(H_BAR/ELECTRON_MASS)**2 * summation
+
+
+@timed("integrate")
+def integrate_weighted(
+        weights: np.ndarray,
+        vels: np.ndarray,
+        rhos: np.ndarray,
+        summation: np.ndarray
+    ):
+    """
+    Integrate the broadening expression with precomputed quadrature weights.
+
+    Each row of `weights` already combines a distribution with its quadrature rule (e.g. from
+    `maxwellian_quadrature`), so every integral is a plain weighted sum of the kernel.
+
+    Args:
+        weights (np.ndarray): Quadrature weights (n_distributions x n_vel).
+        vels (np.ndarray): Electron velocities (quadrature nodes).
+        rhos (np.ndarray): Critical impact parameters, one per velocity, or one row per upper state.
+        summation (np.ndarray): Summed contribution from perturbing states, same shape as `rhos`.
+
+    Returns:
+        np.ndarray: One integral per row of `weights`, (n_states x n_distributions) for 2-D `rhos`.
+    """
+    kernel = velocity_kernel(vels, rhos, summation)
+    return kernel.real @ weights.T + 1j*(kernel.imag @ weights.T)
+
+
+def integrate_adaptive(
+        kernel: callable,
+        EVDF: callable,
+        bounds: tuple,
+        rtol: float = 1e-6,
+        atol: float = 0.0,
+        initial_intervals: int = 8,
+        max_intervals: int = 1024
+    ):
+    """
+    Integrate the broadening expression with globally adaptive Gauss-Kronrod quadrature.
+
+    The velocity range is split into `initial_intervals` intervals, each integrated with the
+    (7, 15) Gauss-Kronrod rule; the difference between the two rules is the interval's error
+    estimate. Intervals whose error is above their share of the tolerance are bisected, and
+    the kernel is evaluated once per round for the nodes of all new intervals only. The width
+    (real part) and shift (imaginary part) are error-controlled separately.
+
+    Args:
+        kernel (callable): Complex kernel at an array of velocities, see `velocity_kernel`.
+        EVDF (callable): Electron velocity distribution function at an array of velocities.
+        bounds (tuple): Lower and upper velocity of the integral.
+        rtol (float, optional): Relative error tolerance. Defaults to 1e-6.
+        atol (float, optional): Absolute error tolerance. Defaults to 0.
+        initial_intervals (int, optional): Number of equal intervals to start from. Defaults to 8.
+        max_intervals (int, optional): Refinement stops at this many intervals, even if the
+                                       tolerance has not been met. Defaults to 1024.
+
+    Returns:
+        tuple:
+            integral (complex): The integral.
+            error (complex): Error estimate of the width (real) and shift (imaginary) parts.
+            n_evaluations (int): Number of velocities the kernel was evaluated at.
+    """
+    lower_bound, upper_bound = float(bounds[0]), float(bounds[1])
+    edges = np.linspace(lower_bound, upper_bound, initial_intervals + 1)
+    lower, upper = edges[:-1], edges[1:]
+    kronrod = np.zeros(0, dtype=np.complex128)
+    error = np.zeros(0, dtype=np.complex128)
+    new = np.ones(len(lower), dtype=bool)
+    n_evaluations = 0
+
+    while True:
+        # Evaluate the rules on the new intervals, with one kernel call for all of their nodes
+        centers, half_widths = (lower[new] + upper[new])/2, (upper[new] - lower[new])/2
+        vels = (centers[:, None] + half_widths[:, None]*GK_NODES).ravel()
+        f = (EVDF(vels)*kernel(vels)).reshape(-1, len(GK_NODES))
+        n_evaluations += len(vels)
+        new_kronrod = half_widths*(f @ GK_WEIGHTS)
+        new_error = new_kronrod - half_widths*(f[:, 1::2] @ GAUSS_WEIGHTS)
+        kronrod = np.concatenate([kronrod[~new[:len(kronrod)]], new_kronrod])
+        error = np.concatenate([error[~new[:len(error)]], new_error])
+        lower = np.concatenate([lower[~new], lower[new]])
+        upper = np.concatenate([upper[~new], upper[new]])
+
+        # Compare the error of each part with its tolerance
+        integral = np.sum(kronrod)
+        error_real, error_imag = np.abs(error.real), np.abs(error.imag)
+        tol_real = max(atol, rtol*np.abs(integral.real))
+        tol_imag = max(atol, rtol*np.abs(integral.imag))
+        if (np.sum(error_real) <= tol_real and np.sum(error_imag) <= tol_imag) \
+                or len(lower) >= max_intervals:
+            break
+
+        # Bisect the intervals above their share of the tolerance (at least the worst one)
+        share = (upper - lower)/(upper_bound - lower_bound)
+        split = (error_real > tol_real*share) | (error_imag > tol_imag*share)
+        split[np.argmax(np.maximum(error_real/max(tol_real, np.finfo(float).tiny),
+                                   error_imag/max(tol_imag, np.finfo(float).tiny)))] = True
+        middle = (lower[split] + upper[split])/2
+        kronrod, error = kronrod[~split], error[~split]
+        lower = np.concatenate([lower[~split], lower[split], middle])
+        upper = np.concatenate([upper[~split], middle, upper[split]])
+        new = np.arange(len(lower)) >= len(kronrod)
+
+    total_error = np.sum(error_real) + 1j*np.sum(error_imag)
+    return integral, total_error, n_evaluations
+
+
+def evdf_function(
+        velocity: np.ndarray,
+        EVDF: Union[float, np.ndarray, callable]
+    ):
+    """
+    The EVDF as a function of velocity, for adaptive integration.
+
+    Args:
+        velocity (np.ndarray): Velocity grid `EVDF` is tabulated on.
+        EVDF (float, np.ndarray or callable): A constant, values on `velocity` (linearly
+                                              interpolated), or a function of velocity.
+
+    Raises:
+        ValueError: If `EVDF` holds several distributions.
+
+    Returns:
+        callable: The EVDF at an array of velocities.
+    """
+    if callable(EVDF):
+        return EVDF
+    if np.ndim(EVDF) == 0:
+        return lambda vels: np.full(np.shape(vels), float(EVDF))
+    if np.ndim(EVDF) != 1:
+        raise ValueError("Adaptive integration supports a single EVDF only")
+    velocity, EVDF = np.asarray(velocity, dtype=np.float64), np.asarray(EVDF, dtype=np.float64)
+    return lambda vels: np.interp(vels, velocity, EVDF)
+
+
+def maxwellian_quadrature(
+        temperatures: Union[float, np.ndarray],
+        n_nodes: int = 32
+    ):
+    """
+    Quadrature nodes and weights for Maxwellian averages at several temperatures.
+
+    For each temperature T the normalized Maxwell-Boltzmann speed distribution is integrated with
+    an `n_nodes` point Gauss-Legendre rule in the reduced speed u = v/v_T over [0, MAXWELLIAN_CUTOFF],
+    where v_T = sqrt(2 k_B T / m_e). The Griem kernel is smooth in v but not in v**2, so this
+    converges much faster than Gauss-Laguerre in energy (about 4e-7 relative error with 32 nodes).
+    The nodes of all temperatures form one grid, so a single kernel evaluation serves every
+    temperature. Nodes are scaled by each thermal speed, so only those of repeated temperatures
+    coincide (and are evaluated once); distinct temperatures contribute `n_nodes` nodes each.
+
+    Args:
+        temperatures (float or np.ndarray): Electron temperatures [K].
+        n_nodes (int, optional): Number of nodes per temperature. Defaults to 32.
+
+    Returns:
+        tuple:
+            vels (np.ndarray): Sorted, unique velocity nodes [m/s].
+            weights (np.ndarray): Weights (n_temperatures x len(vels)), such that
+                                  `weights[t] @ g(vels)` approximates the Maxwellian average of g.
+    """
+    temperatures = np.atleast_1d(np.asarray(temperatures, dtype=np.float64))
+    x, w = roots_legendre(n_nodes)
+    u = MAXWELLIAN_CUTOFF*(x + 1)/2
+    u_weights = (MAXWELLIAN_CUTOFF/2)*w*(4/np.sqrt(np.pi))*u**2*np.exp(-u**2)
+
+    thermal_speeds = np.sqrt(2*BOLTZMANN_CONSTANT*temperatures/ELECTRON_MASS)
+    vels, inverse = np.unique(np.multiply.outer(thermal_speeds, u), return_inverse=True)
+    weights = np.zeros((len(temperatures), len(vels)))
+    rows = np.repeat(np.arange(len(temperatures)), n_nodes)
+    np.add.at(weights, (rows, inverse.ravel()), np.tile(u_weights, len(temperatures)))
+    return vels, weights
+
+
+def trapezoid_weights(vels: np.ndarray):
+    """
+    Quadrature weights of the trapezoidal rule, so that `np.trapz(f, vels) == weights @ f`.
+
+    Args:
+        vels (np.ndarray): Velocity grid.
+
+    Returns:
+        np.ndarray: One weight per velocity.
+    """
+    vels = np.asarray(vels, dtype=np.float64)
+    steps = np.diff(vels)
+    weights = np.zeros_like(vels)
+    weights[:-1] += steps/2
+    weights[1:] += steps/2
+    return weights
+
+
+def as_evdf(EVDF):
+    """
+    Convert an EVDF argument to an array.
+
+    Scalars, arrays and functions of velocity are returned unchanged. Other iterables are
+    materialized: an iterable of numbers is one EVDF, and an iterable of arrays is a 2-D stack
+    of EVDFs.
+
+    Args:
+        EVDF (float, np.ndarray, callable or iterable): EVDF argument.
+
+    Returns:
+        float, np.ndarray or callable: The EVDF as a scalar, array or function.
+    """
+    if np.isscalar(EVDF) or isinstance(EVDF, np.ndarray) or callable(EVDF):
+        return EVDF
+    return np.array([np.asarray(evdf, dtype=np.float64) for evdf in EVDF])
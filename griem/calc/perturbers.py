@@ -0,0 +1,214 @@
+"""
+perturbers.py
+
+Incremental evaluation of the Griem model as perturbing states are added one at a time, used to
+choose the number of terms automatically (`n_terms='auto'`).
+
+Adding a perturbing state only adds one term to the sums over perturbers, so the special
+functions of the states already included are kept, per velocity, at the current rho_min. The
+new rho_min is warm-started from the previous one: the equation at the old root is known from
+the kept sums plus the new term, and the bracket is widened from there only as far as needed.
+Velocities whose root does not move by more than the solver tolerance keep all of their values.
+"""
+
+# Import modules
+import numpy as np
+from typing import Union
+
+from .data_processing import create_terms
+from .integral import integrate_griem
+from .rho_min.rho import rho_equation, rho_residual
+from .rho_min.rhos_solve import calculate_rhos, DOMAIN
+from .rho_min.root_solver import solve_batch, XTOL, RTOL
+from ..utils.functions import griem_functions
+
+
+class PerturberSeries:
+    """
+    rho_min and the summation for a growing set of perturbing states.
+
+    Attributes:
+        vels (np.ndarray): Electron velocities.
+        omegas (np.ndarray): Angular frequencies of the perturbing states added so far.
+        exp_vals_sqrd (np.ndarray): Squared matrix elements of the perturbing states added so far.
+        rhos (np.ndarray): rho_min at each velocity, None before the first state is added.
+        summation (np.ndarray): Summation term at each velocity.
+
+    Methods:
+        add(omega, exp_val_sqrd): Add a perturbing state and update rho_min and the summation.
+    """
+    def __init__(
+            self,
+            vels: Union[float, np.ndarray],
+            max_terms: int
+        ):
+        """
+        Initialize an empty PerturberSeries.
+
+        Args:
+            vels (float, np.ndarray): Electron velocities.
+            max_terms (int): Largest number of perturbing states that will be added.
+        """
+        self.vels = np.atleast_1d(np.asarray(vels, dtype=np.float64))
+        self.omegas = np.zeros(0)
+        self.exp_vals_sqrd = np.zeros(0)
+        self.rhos = None
+        self.summation = np.zeros(len(self.vels), dtype=np.complex128)
+
+        # A, B, a and b of every perturbing state (columns) at the current rho_min of each velocity
+        self._values = np.zeros((4, len(self.vels), max_terms))
+
+    @property
+    def n_terms(self):
+        """Number of perturbing states added so far."""
+        return len(self.omegas)
+
+    def add(
+            self,
+            omega: float,
+            exp_val_sqrd: float
+        ):
+        """
+        Add a perturbing state and update rho_min and the summation.
+
+        Args:
+            omega (float): Angular frequency of the perturbing state.
+            exp_val_sqrd (float): Squared matrix element of the perturbing state.
+
+        Raises:
+            ValueError: If more than `max_terms` states are added, or rho_min cannot be found.
+        """
+        n = self.n_terms
+        if n == self._values.shape[2]:
+            raise ValueError(f"Cannot add more than {n} perturbing states")
+        self.omegas = np.append(self.omegas, omega)
+        self.exp_vals_sqrd = np.append(self.exp_vals_sqrd, exp_val_sqrd)
+
+        if self.rhos is None:
+            rhos, moved = calculate_rhos(self.vels, self.omegas, self.exp_vals_sqrd), None
+        else:
+            rhos, moved = self._warm_solve(omega, exp_val_sqrd)
+
+        # The new state at every velocity, and the earlier states only where the root moved
+        self._values[..., n:n + 1] = self._evaluate(rhos, self.vels, self.omegas[n:])
+        if moved is None:
+            moved = np.ones(len(self.vels), dtype=bool)
+        if n and moved.any():
+            self._values[:, moved, :n] = self._evaluate(rhos[moved], self.vels[moved], self.omegas[:n])
+        self.rhos = rhos
+
+        a, b = self._values[2, :, :n + 1], self._values[3, :, :n + 1]
+        self.summation = a @ self.exp_vals_sqrd + 1j*(b @ self.exp_vals_sqrd)
+
+    def _warm_solve(
+            self,
+            omega: float,
+            exp_val_sqrd: float
+        ):
+        """Solve for the new rho_min starting from the current one. The far end of each bracket is
+        first guessed as if the LHS fell as rho**-2, and widened in log(rho) where that guess does
+        not bracket the root. Returns the roots and a mask of the velocities whose root moved by
+        more than the solver tolerance."""
+        n = self.n_terms - 1
+        vels = self.vels
+        z = np.abs(1e-10*self.rhos/vels*omega)
+        A_new, B_new = griem_functions(z, "AB")
+        A_sum = self._values[0, :, :n] @ self.exp_vals_sqrd[:n] + exp_val_sqrd*A_new
+        B_sum = self._values[1, :, :n] @ self.exp_vals_sqrd[:n] + exp_val_sqrd*B_new
+        f_old = rho_residual(self.rhos, vels, A_sum, B_sum)
+
+        # First guess of the far end: the root if the LHS fell as rho**-2. It is not a bound (B
+        # grows with z, so the LHS can fall more slowly), so wherever it does not bracket the
+        # root, widen (in log(rho)) towards the sign change until it does
+        RHS = -rho_residual(self.rhos, vels, 0.0, 0.0)
+        LHS = f_old + RHS
+        with np.errstate(invalid="ignore"):
+            far = self.rhos*np.sqrt(LHS/RHS)
+        f_far = rho_equation(far, vels, self.omegas, self.exp_vals_sqrd)
+        direction = np.sign(f_old)
+        pending = (direction != 0) & (np.sign(f_far) == direction)
+        width = 0.01
+        log_min, log_max = np.log(DOMAIN)
+        while pending.any():
+            log_far = np.clip(np.log(self.rhos[pending]) + direction[pending]*width, log_min, log_max)
+            far[pending] = np.exp(log_far)
+            f_far[pending] = rho_equation(far[pending], vels[pending], self.omegas, self.exp_vals_sqrd)
+            at_edge = (log_far == log_min) | (log_far == log_max)
+            pending[pending] = (np.sign(f_far[pending]) == direction[pending]) & ~at_edge
+            width *= 4
+
+        rhos = self.rhos.copy()
+        active = direction != 0
+        if active.any():
+            lower = np.minimum(self.rhos, far)[active]
+            upper = np.maximum(self.rhos, far)[active]
+            roots, converged = solve_batch(rho_equation, [lower, upper], (vels[active],),
+                                           self.omegas, self.exp_vals_sqrd)
+            if not np.all(converged):
+                raise ValueError(f"Error in root finding: no solution within bracket {DOMAIN} "
+                                 f"for velocities {vels[active][~converged]}")
+            rhos[active] = roots
+
+        moved = np.abs(rhos - self.rhos) > XTOL + RTOL*np.abs(self.rhos)
+        rhos[~moved] = self.rhos[~moved]
+        return rhos, moved
+
+    @staticmethod
+    def _evaluate(
+            rhos: np.ndarray,
+            vels: np.ndarray,
+            omegas: np.ndarray
+        ):
+        """A, B, a and b of the states `omegas` at `rhos`, shape (4, len(rhos), len(omegas))."""
+        z = 1e-10*np.multiply.outer(rhos/vels, omegas)
+        values = np.empty((4,) + z.shape)
+        griem_functions(z, "ABa", out=values[:3])
+        z *= 3/4
+        griem_functions(z, "b", out=values[3:])
+        return values
+
+
+def converge_terms(
+        processed_data: np.ndarray,
+        vels: Union[float, np.ndarray],
+        EVDF: Union[float, np.ndarray],
+        rtol: float = 1e-3,
+        max_terms: int = None
+    ):
+    """
+    Add perturbing states in order of `nu_abs` until the width and shift have converged.
+
+    The states are taken in the order of `processed_data` (sorted by `nu_abs`), and the
+    calculation stops once two consecutive states have each changed both the width and the
+    shift by less than `rtol` (relative), or when all states (or `max_terms`) are included.
+
+    Args:
+        processed_data (np.ndarray): The output of `process_data()`.
+        vels (float, np.ndarray): Electron velocities.
+        EVDF (float, np.ndarray): Electron velocity distribution function(s), see `integrate_griem`.
+        rtol (float, optional): Relative tolerance on the width and shift. Defaults to 1e-3.
+        max_terms (int, optional): Largest number of perturbing states. Defaults to None (all).
+
+    Returns:
+        tuple:
+            integral (float or np.ndarray): Integrated width/shift (not yet divided by 2*pi).
+            interacting_states (list): Signed labels of the perturbing states used.
+    """
+    available = len(processed_data) - 1
+    max_terms = available if max_terms is None else min(max_terms, available)
+    omegas, exp_vals_sqrd, interact_states = create_terms(processed_data, max_terms)
+
+    series = PerturberSeries(vels, max_terms)
+    previous, stable = None, 0
+    for omega, exp_val_sqrd in zip(omegas, exp_vals_sqrd):
+        series.add(omega, exp_val_sqrd)
+        integral = integrate_griem(vels, series.rhos, series.summation, EVDF)
+        if previous is not None:
+            change = integral - previous
+            small = (np.all(np.abs(change.real) <= rtol*np.abs(integral.real))
+                     and np.all(np.abs(change.imag) <= rtol*np.abs(integral.imag)))
+            stable = stable + 1 if small else 0
+        previous = integral
+        if stable >= 2:
+            break
+    return integral, interact_states[:series.n_terms]
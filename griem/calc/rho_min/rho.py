@@ -12,18 +12,20 @@ References:
 
 # Import modules
 import numpy as np
-from scipy.optimize import fsolve, minimize
+from typing import Union
 from scipy.special import gamma
 
-from ...utils.functions import A, B
+from ...utils.functions import WORK_SLOTS, griem_functions
 from ...constants import H_BAR, ELECTRON_MASS
 
 
 def rho_equation(
-        rho: float, 
-        vel: float, 
+        rho: Union[float, np.ndarray], 
+        vel: Union[float, np.ndarray], 
         omegas: np.ndarray, 
-        exp_vals_sqrd: np.ndarray
+        exp_vals_sqrd: np.ndarray,
+        out: np.ndarray = None,
+        work: np.ndarray = None
     ):
     """
     Equation to solve for the critical impact parameter (rho_min).
@@ -33,27 +35,87 @@ def rho_equation(
     collisional interactions between electrons and atoms in the Griem model. It is
     designed to be passed to a root solver (e.g. `scipy.optimize.root_scalar`, `fsolve`, etc.).
 
+    `rho` and `vel` broadcast against each other, so the equation can be evaluated for a
+    whole batch of velocities at once (as done by `root_solver.solve_batch`). With 2-D `omegas`
+    and `exp_vals_sqrd`, each row holds the perturbing states of the matching `rho`, so members
+    of the batch may belong to different upper states.
+
+    The z_mins, A and B terms and the special-function intermediates have one entry per
+    (rho, perturbing state) pair. A solver that evaluates the equation repeatedly can pass
+    `out` and `work` buffers for them (see `equation_buffers`), so no array of that size is
+    allocated per call.
+
+    Args:
+        rho (float, np.ndarray): The trial value(s) of the critical impact parameter (rho_min).
+        vel (float, np.ndarray): The electron velocity (or velocities).
+        omegas (np.ndarray): Angular frequency differences between upper and perturbing states,
+                             or one row of them per `rho`.
+        exp_vals_sqrd (np.ndarray): Squared matrix elements (or transition moments), same shape
+                                    as `omegas`.
+        out (np.ndarray, optional): Buffer of shape (2,) + z.shape for the A and B terms, where
+                                    z.shape is rho.shape + (number of perturbing states,).
+        work (np.ndarray, optional): Scratch buffer of shape (WORK_SLOTS + 1,) + z.shape, for
+                                     the z_mins and the special-function intermediates.
+
+    Returns:
+        float or np.ndarray: The value of the equation LHS - RHS. Root-finding methods will seek
+                             a value of `rho` for which this function evaluates to zero.
+    """
+    # Calculate A and B terms, one row of z_mins per (rho, vel) pair
+    z_mins, functions_work = (None, None) if work is None else (work[0], work[1:])
+    if np.ndim(omegas) == 2:
+        z_mins = np.multiply(1e-10*(rho/vel)[..., None], omegas, out=z_mins)
+        A_terms, B_terms = griem_functions(np.abs(z_mins, out=z_mins), "AB", out, functions_work)
+        A_sum = np.einsum("...k,...k->...", A_terms, exp_vals_sqrd)
+        B_sum = np.einsum("...k,...k->...", B_terms, exp_vals_sqrd)
+        return rho_residual(rho, vel, A_sum, B_sum)
+    z_mins = np.multiply.outer(rho/vel, omegas, out=z_mins)
+    z_mins *= 1e-10
+    A_terms, B_terms = griem_functions(np.abs(z_mins, out=z_mins), "AB", out, functions_work)
+    return rho_residual(rho, vel, A_terms @ exp_vals_sqrd, B_terms @ exp_vals_sqrd)
+
+
+def equation_buffers(
+        size: int,
+        n_terms: int
+    ):
+    """
+    `out` and `work` buffers of `rho_equation` for up to `size` values of rho.
+
     Args:
-        rho (float): The trial value of the critical impact parameter (rho_min).
-        vel (float): The electron velocity.
-        omegas (np.ndarray): Angular frequency differences between upper and perturbing states.
-        exp_vals_sqrd (np.ndarray): Squared matrix elements (or transition moments).
+        size (int): Largest number of values of rho evaluated at once.
+        n_terms (int): Number of perturbing states.
 
     Returns:
-        float: The value of the equation LHS - RHS. Root-finding methods will seek
-               a value of `rho` for which this function evaluates to zero.
+        tuple: (out, work). Slice both as buf[:, :n] for n values of rho.
     """
-    # Calculate A and B terms
-    z_mins = np.abs(1e-10*rho*omegas/vel)
-    A_terms, B_terms = np.array(A(z_mins)), np.array(B(z_mins))
-    A_sum, B_sum = np.sum(exp_vals_sqrd*A_terms), np.sum(exp_vals_sqrd*B_terms)
+    return np.empty((2, size, n_terms)), np.empty((WORK_SLOTS + 1, size, n_terms))
 
-    try:
+
+def rho_residual(
+        rho: Union[float, np.ndarray],
+        vel: Union[float, np.ndarray],
+        A_sum: Union[float, np.ndarray],
+        B_sum: Union[float, np.ndarray]
+    ):
+    """
+    The rho_min equation (LHS - RHS) from already summed A and B terms.
+
+    Lets callers that keep the sums over perturbing states (e.g. `calc.perturbers`) evaluate
+    the equation without recomputing the special functions.
+
+    Args:
+        rho (float, np.ndarray): The trial value(s) of the critical impact parameter (rho_min).
+        vel (float, np.ndarray): The electron velocity (or velocities).
+        A_sum (float, np.ndarray): Sum of A(z_min) weighted by the squared matrix elements.
+        B_sum (float, np.ndarray): Sum of B(z_min) weighted by the squared matrix elements.
+
+    Returns:
+        float or np.ndarray: The value of the equation LHS - RHS.
+    """
+    with np.errstate(divide="ignore"):
         LHS = (2/3)*((1e+10*H_BAR)/(ELECTRON_MASS*vel*rho))**2*np.sqrt(A_sum**2 + B_sum**2) 
-    except ZeroDivisionError:
-        LHS = np.inf
     RHS = (1/2*gamma(1/3))**(-3/2)
 
     # Return difference
     return LHS - RHS
-
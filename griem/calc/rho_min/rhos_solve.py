@@ -3,44 +3,308 @@ rhos_solve.py
 
 Solves for all critical impact parameters (rho_min) across a range of electron velocities.
 
-This module loops over an array of electron velocities and numerically solves the
-rho_min equation for each using a specified root-finding method. These values are used
-in the Griem model to describe electron impact line broadening.
+By default the rho_min equation is solved for every velocity at once with a vectorized
+Brent solver; the original per-velocity loop over `scipy.optimize.brentq` is kept as the
+'brentq' reference method. The 'continuation' method walks along the velocity grid and
+warm-starts each solve from a tight bracket around the root predicted by its neighbours.
+The 'surrogate' method solves exactly only at a few adaptively chosen velocities and
+interpolates rho_min(v) between them, with the residual of the rho_min equation as error
+control. These values are used in the Griem model to describe electron impact line broadening.
 """
 
 # Import modules
 import numpy as np
+from scipy.special import gamma
+
+from ...calc.rho_min.rho import equation_buffers, rho_equation
+from ...calc.rho_min.root_solver import solve, solve_batch
+from ...utils import profiling
+from ...utils.profiling import timed
+
+# Bracket used when nothing is known about the root
+DOMAIN = [0.01, 1e+8]
+
+# Surrogate rho_min(v): initial and largest number of exact solves, and the scale of the
+# rho_min equation (its right-hand side), which makes the residual relative
+SURROGATE_NODES = 9
+SURROGATE_MAX_NODES = 1025
+RESIDUAL_SCALE = (1/2*gamma(1/3))**(-3/2)
 
-from ...calc.rho_min.rho import rho_equation
-from ...calc.rho_min.root_solver import solve
 
 # Main equation
+@timed("calculate_rhos")
 def calculate_rhos(
-        vels: np.ndarray, 
-        omegas: np.ndarray, 
-        exp_vals_sqrd: np.ndarray
+        vels: np.ndarray,
+        omegas: np.ndarray,
+        exp_vals_sqrd: np.ndarray,
+        method: str = 'batch',
+        full_output: bool = False,
+        rtol: float = 1e-6
     ):
     """
     Solve for rho_min across a range of electron velocities.
 
     For each velocity in `vels`, this function solves the rho_min equation using
-    a root-finding method over a fixed bracketed domain. It returns an array of 
+    a root-finding method over a fixed bracketed domain. It returns an array of
     rho_min values corresponding to each input velocity.
 
     Args:
         vels (np.ndarray): Electron velocities. Can be a scalar or array-like.
-        omegas (np.ndarray): Angular frequency differences between upper and perturbing states.
-        exp_vals_sqrd (np.ndarray): Squared matrix elements for each interacting state.
+        omegas (np.ndarray): Angular frequency differences between upper and perturbing states,
+                             or (for the 'batch' method) one row of them per velocity.
+        exp_vals_sqrd (np.ndarray): Squared matrix elements for each interacting state, same
+                                    shape as `omegas`.
+        method (str, optional): 'batch' solves all velocities together with the vectorized
+                                Brent solver, 'brentq' loops over `scipy.optimize.brentq`,
+                                'continuation' loops with warm-started brackets, and
+                                'surrogate' interpolates between a few exact solves (see
+                                `_surrogate`). Defaults to 'batch'.
+        full_output (bool, optional): Also return the solver statistics. Defaults to False.
+        rtol (float, optional): Largest relative residual of the rho_min equation allowed by
+                                the 'surrogate' method, about twice the relative error of
+                                rho_min. Defaults to 1e-6.
+
+    Raises:
+        ValueError: If `method` is unknown, or if the root could not be found for one or more
+                    velocities (all failing velocities are listed).
 
     Returns:
         np.ndarray: Array of rho_min values, one for each electron velocity.
+        dict: If `full_output`, per-velocity `iterations` and `function_calls` arrays; for
+              'surrogate', the solved `nodes`, the total `function_calls` and the largest
+              relative `residual` at the test points.
     """
     vels = np.atleast_1d(vels)
-    rhos = np.empty_like(vels, dtype=np.float64)
-    domain = [0.01, 1e+8]
 
-    for vel, n in zip(vels, range(0, len(vels))):
-        rho = solve(rho_equation, domain, vel, omegas, exp_vals_sqrd)
-        rhos[n] = rho
+    if method == 'batch':
+        # Per-velocity perturbing states are sliced with the velocities, shared ones passed as is
+        if np.ndim(omegas) == 2:
+            batch_args, args = (vels, omegas, exp_vals_sqrd), ()
+        else:
+            batch_args, args = (vels,), (omegas, exp_vals_sqrd)
+        equation = _buffered_equation(len(vels), np.shape(omegas)[-1])
+        rhos, info = _solve_checked(equation, batch_args, args)
+    elif np.ndim(omegas) == 2:
+        raise ValueError(f"Method {method} does not support one set of perturbing states per velocity")
+    elif method == 'brentq':
+        rhos = np.empty_like(vels, dtype=np.float64)
+        info = {"iterations": np.zeros(len(vels), dtype=np.int64),
+                "function_calls": np.zeros(len(vels), dtype=np.int64)}
+        for vel, n in zip(vels, range(0, len(vels))):
+            rhos[n], stats = solve(rho_equation, DOMAIN, vel, omegas, exp_vals_sqrd,
+                                   full_output=True)
+            info["iterations"][n], info["function_calls"][n] = stats["iterations"], stats["function_calls"]
+    elif method == 'continuation':
+        rhos, info = _continuation(vels, omegas, exp_vals_sqrd)
+    elif method == 'surrogate':
+        rhos, info = _surrogate(vels, omegas, exp_vals_sqrd, rtol)
+    else:
+        raise ValueError(f"Unknown rho_min solver method: {method}")
+
+    if profiling._ACTIVE is not None:
+        profiling._ACTIVE.record_solver(info)
+    if full_output:
+        return rhos, info
     return rhos
 
+
+def _continuation(
+        vels: np.ndarray,
+        omegas: np.ndarray,
+        exp_vals_sqrd: np.ndarray
+    ):
+    """
+    Solve for rho_min along the velocity grid using the neighbouring roots as a warm start.
+
+    Velocities are visited in increasing order. The next root is predicted by extrapolating
+    the previous two roots linearly in log(v)-log(rho), and brentq is started from a tight
+    bracket around the prediction. The bracket half-width (in log(rho)) is the size of the
+    previous step, and is widened by a factor of 4 only while the ends fail the sign check.
+
+    Args:
+        vels (np.ndarray): Electron velocities.
+        omegas (np.ndarray): Angular frequency differences between upper and perturbing states.
+        exp_vals_sqrd (np.ndarray): Squared matrix elements for each interacting state.
+
+    Returns:
+        tuple:
+            rhos (np.ndarray): Array of rho_min values, one for each electron velocity.
+            info (dict): Per-velocity `iterations` and `function_calls` arrays. Function calls
+                         include the evaluations spent checking the bracket.
+    """
+    rhos = np.empty_like(vels, dtype=np.float64)
+    iterations = np.zeros(len(vels), dtype=np.int64)
+    function_calls = np.zeros(len(vels), dtype=np.int64)
+    log_min, log_max = np.log(DOMAIN)
+
+    solved = []
+    for n in np.argsort(vels, kind="stable"):
+        vel = vels[n]
+        if not solved:
+            bracket = DOMAIN
+        else:
+            # Predict log(rho) from the previous roots and bracket the prediction
+            log_v1, log_r1 = solved[-1]
+            if len(solved) > 1 and log_v1 != solved[-2][0]:
+                log_v0, log_r0 = solved[-2]
+                slope = (log_r1 - log_r0)/(log_v1 - log_v0)
+                width = np.abs(log_r1 - log_r0)
+            else:
+                slope, width = 0.0, 0.0
+            guess = log_r1 + slope*(np.log(vel) - log_v1)
+            width = max(width, 1e-6)
+
+            while True:
+                lower, upper = max(guess - width, log_min), min(guess + width, log_max)
+                bracket = [np.exp(lower), np.exp(upper)]
+                if lower == log_min and upper == log_max:
+                    bracket = DOMAIN
+                    break
+                f_lower = rho_equation(bracket[0], vel, omegas, exp_vals_sqrd)
+                f_upper = rho_equation(bracket[1], vel, omegas, exp_vals_sqrd)
+                function_calls[n] += 2
+                if f_lower*f_upper <= 0:
+                    break
+                width *= 4
+
+        rhos[n], stats = solve(rho_equation, bracket, vel, omegas, exp_vals_sqrd, full_output=True)
+        iterations[n] += stats["iterations"]
+        function_calls[n] += stats["function_calls"]
+        solved.append((np.log(vel), np.log(rhos[n])))
+
+    return rhos, {"iterations": iterations, "function_calls": function_calls}
+
+
+def _surrogate(
+        vels: np.ndarray,
+        omegas: np.ndarray,
+        exp_vals_sqrd: np.ndarray,
+        rtol: float
+    ):
+    """
+    Interpolate rho_min(v) between exact solves at adaptively chosen velocities.
+
+    rho_min is smooth and monotone in the velocity for a fixed transition, so log(rho_min) is
+    interpolated against log(v) with cubic Hermite polynomials. The slope at each node follows
+    from the equation itself: the left-hand side depends on rho and v only through
+    rho**-2 v**-2 S(rho/v), so d log(rho)/d log(v) = 1 + 4/g, where g = d log(LHS)/d log(rho)
+    at fixed v (evaluated by a central difference). The slopes are limited as in Fritsch-Carlson,
+    so the interpolant stays monotone between monotone nodes.
+
+    Starting from SURROGATE_NODES nodes spread uniformly in log(v), the residual of the rho_min
+    equation (relative to its right-hand side) is evaluated at the midpoint of every interval,
+    and each interval whose residual exceeds `rtol` is split by solving at its midpoint. If the
+    nodes would exceed SURROGATE_MAX_NODES (or there are few velocities), every velocity is
+    solved.
+
+    Args:
+        vels (np.ndarray): Electron velocities.
+        omegas (np.ndarray): Angular frequency differences between upper and perturbing states.
+        exp_vals_sqrd (np.ndarray): Squared matrix elements for each interacting state.
+        rtol (float): Largest relative residual at the test points.
+
+    Returns:
+        tuple:
+            rhos (np.ndarray): Array of rho_min values, one for each electron velocity.
+            info (dict): The solved `nodes` (velocities), the total `function_calls` and the
+                         largest relative `residual` at the last test points.
+    """
+    from scipy.interpolate import CubicHermiteSpline
+    equation = _buffered_equation(len(vels), len(omegas))
+
+    def exact(log_vels):
+        nodes = np.exp(log_vels)
+        roots, stats = _solve_checked(equation, (nodes,), (omegas, exp_vals_sqrd))
+        step = 1e-4
+        lhs = [rho_equation(roots*np.exp(sign*step), nodes, omegas, exp_vals_sqrd) + RESIDUAL_SCALE
+               for sign in (1, -1)]
+        slopes = 1 + 4/((np.log(lhs[0]) - np.log(lhs[1]))/(2*step))
+        return np.log(roots), slopes, int(np.sum(stats["function_calls"])) + 2*len(nodes)
+
+    unique_vels = np.unique(vels)
+    if len(unique_vels) <= 2*SURROGATE_NODES:
+        rhos, stats = _solve_checked(equation, (vels,), (omegas, exp_vals_sqrd))
+        return rhos, {"nodes": vels, "function_calls": int(np.sum(stats["function_calls"])),
+                      "residual": 0.0}
+
+    new_nodes = np.linspace(np.log(unique_vels[0]), np.log(unique_vels[-1]), SURROGATE_NODES)
+    nodes, log_rhos, slopes = np.empty(0), np.empty(0), np.empty(0)
+    function_calls = 0
+    while True:
+        new_log_rhos, new_slopes, calls = exact(new_nodes)
+        function_calls += calls
+        nodes = np.concatenate([nodes, new_nodes])
+        log_rhos = np.concatenate([log_rhos, new_log_rhos])
+        slopes = np.concatenate([slopes, new_slopes])
+        order = np.argsort(nodes)
+        nodes, log_rhos, slopes = nodes[order], log_rhos[order], slopes[order]
+
+        # Residual of the interpolant at the midpoint of every interval
+        interpolant = CubicHermiteSpline(nodes, log_rhos, _monotone_slopes(nodes, log_rhos, slopes))
+        midpoints = (nodes[1:] + nodes[:-1])/2
+        residual = np.abs(rho_equation(np.exp(interpolant(midpoints)), np.exp(midpoints), omegas,
+                                       exp_vals_sqrd))/RESIDUAL_SCALE
+        function_calls += len(midpoints)
+        new_nodes = midpoints[residual > rtol]
+        if new_nodes.size == 0:
+            break
+        if len(nodes) + len(new_nodes) > min(SURROGATE_MAX_NODES, len(unique_vels)):
+            rhos, stats = _solve_checked(equation, (vels,), (omegas, exp_vals_sqrd))
+            return rhos, {"nodes": vels, "residual": 0.0,
+                          "function_calls": function_calls + int(np.sum(stats["function_calls"]))}
+
+    rhos = np.exp(interpolant(np.log(vels)))
+    return rhos, {"nodes": np.exp(nodes), "function_calls": function_calls,
+                  "residual": float(np.max(residual))}
+
+
+def _solve_checked(
+        equation: callable,
+        batch_args: tuple,
+        args: tuple
+    ):
+    """Solve the rho_min equation over `DOMAIN` for every velocity (`batch_args[0]`) with
+    `solve_batch`. Returns the roots and the solver statistics, and raises a ValueError listing
+    the velocities whose bracket holds no root."""
+    rhos, converged, info = solve_batch(equation, DOMAIN, batch_args, *args, full_output=True)
+    if not np.all(converged):
+        raise ValueError(f"Error in root finding: no solution within bracket {DOMAIN} "
+                         f"for velocities {batch_args[0][~converged]}")
+    return rhos, info
+
+
+def _buffered_equation(
+        size: int,
+        n_terms: int
+    ):
+    """`rho_equation` for `solve_batch`, evaluated in `out`/`work` buffers kept for up to `size`
+    velocities, so the solver iterations do not allocate arrays per (velocity, perturber) pair."""
+    out, work = equation_buffers(size, n_terms)
+
+    def equation(rho, *args):
+        return rho_equation(rho, *args, out=out[:, :len(rho)], work=work[:, :len(rho)])
+    return equation
+
+
+def _monotone_slopes(
+        x: np.ndarray,
+        y: np.ndarray,
+        slopes: np.ndarray
+    ):
+    """Limit Hermite node slopes (Fritsch-Carlson) so each interval between monotone nodes is
+    interpolated monotonically."""
+    slopes = slopes.copy()
+    secants = np.diff(y)/np.diff(x)
+    for k, secant in enumerate(secants):
+        if secant == 0:
+            slopes[k] = slopes[k + 1] = 0.0
+            continue
+        alpha, beta = slopes[k]/secant, slopes[k + 1]/secant
+        if alpha < 0:
+            slopes[k], alpha = 0.0, 0.0
+        if beta < 0:
+            slopes[k + 1], beta = 0.0, 0.0
+        if alpha**2 + beta**2 > 9:
+            tau = 3/np.hypot(alpha, beta)
+            slopes[k], slopes[k + 1] = tau*alpha*secant, tau*beta*secant
+    return slopes
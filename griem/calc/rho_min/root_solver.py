@@ -1,22 +1,33 @@
 """
 root_solver.py
 
-Numerical root solver using the Brent method from SciPy.
+Numerical root solvers using the Brent method.
 
-Wraps `scipy.optimize.root_scalar` to provide a simplified interface
+`solve` wraps `scipy.optimize.root_scalar` to provide a simplified interface
 for solving scalar equations over a bracketing interval. Automatically
 raises a clear error if the solver fails to converge.
+
+`solve_batch` runs the same Brent iteration on a whole batch of independent
+equations at once using NumPy array operations, evaluating the function only
+on the members of the batch that have not yet converged.
 """
 
 
 # Import modules
-from scipy.optimize import root_scalar
+import numpy as np
+
+# Default tolerances of `scipy.optimize.brentq`
+XTOL = 2e-12
+RTOL = 4*np.finfo(float).eps
+MAXITER = 100
+
 
 def solve(
         func: callable, 
         domain_bracket: list, 
         *args, 
-        method: str = 'brentq'):
+        method: str = 'brentq',
+        full_output: bool = False):
     """
     Solve a scalar nonlinear equation using a root-finding method (default: Brent's method).
 
@@ -29,13 +40,17 @@ def solve(
         domain_bracket (list or tuple): Two-element bracket [a, b] where the root is expected.
         *args: Additional arguments passed to `func`.
         method (str, optional): Root-finding method used by `root_scalar`. Default is 'brentq'.
+        full_output (bool, optional): Also return the solver statistics. Defaults to False.
 
     Returns:
         float: The root of the function within the provided bracket.
+        dict: If `full_output`, the number of `iterations` and `function_calls` used.
 
     Raises:
         ValueError: If the solver fails to converge or another error occurs.
     """
+    from scipy.optimize import root_scalar
+
     def f(x):
         return func(x, *args)
 
@@ -43,7 +58,127 @@ def solve(
         sol = root_scalar(f, bracket=domain_bracket, method=method)
         if not sol.converged:
             raise ValueError(f"Solution did not converge withing bracket {domain_bracket}")
+        if full_output:
+            return sol.root, {"iterations": sol.iterations, "function_calls": sol.function_calls}
         return sol.root
     except Exception as e:
         raise ValueError(f"Error in root finding: {e}")
-    
+
+
+def solve_batch(
+        func: callable,
+        domain_bracket: list,
+        batch_args: tuple,
+        *args,
+        xtol: float = XTOL,
+        rtol: float = RTOL,
+        maxiter: int = MAXITER,
+        full_output: bool = False):
+    """
+    Solve a batch of independent scalar equations with a vectorized Brent's method.
+
+    Every member of the batch is iterated together: each iteration performs Brent's
+    interpolation/bisection step on all unconverged members with array operations, then
+    calls `func` once on just those members. The step logic and stopping criterion follow
+    SciPy's `brentq`, so the roots agree with `solve` to the same tolerance.
+
+    Args:
+        func (callable): Vectorized function `func(x, *batch_args, *args)` returning an array
+                         the same shape as `x`.
+        domain_bracket (list or tuple): Two-element bracket [a, b]. Each end is either a scalar
+                                        shared by every member or an array with one entry
+                                        per member.
+        batch_args (tuple): Arrays with one entry per batch member. Only the entries of the
+                            unconverged members are passed to `func`.
+        *args: Additional arguments passed unchanged to `func`.
+        xtol (float, optional): Absolute tolerance. Defaults to brentq's 2e-12.
+        rtol (float, optional): Relative tolerance. Defaults to brentq's 4*eps.
+        maxiter (int, optional): Maximum number of iterations. Defaults to 100.
+        full_output (bool, optional): Also return the solver statistics. Defaults to False.
+
+    Returns:
+        tuple:
+            roots (np.ndarray): Root of each member (NaN where the bracket has no sign change).
+            converged (np.ndarray): Boolean mask of the members that converged.
+            info (dict): If `full_output`, per-member `iterations` and `function_calls` arrays.
+    """
+    batch_args = tuple(np.atleast_1d(arg) for arg in batch_args)
+    size = len(batch_args[0])
+
+    def f(x, index):
+        return func(x, *(arg[index] for arg in batch_args), *args)
+
+    index = np.arange(size)
+    xpre = np.array(np.broadcast_to(domain_bracket[0], size), dtype=np.float64)
+    xcur = np.array(np.broadcast_to(domain_bracket[1], size), dtype=np.float64)
+    fpre = f(xpre, index)
+    fcur = f(xcur, index)
+    iterations = np.zeros(size, dtype=np.int64)
+    function_calls = np.full(size, 2, dtype=np.int64)
+    xblk, fblk = np.zeros(size), np.zeros(size)
+    spre, scur = np.zeros(size), np.zeros(size)
+
+    roots = np.full(size, np.nan)
+    converged = np.zeros(size, dtype=bool)
+
+    # Members without a sign change in the bracket can never converge
+    valid = fpre*fcur <= 0
+    roots[fcur == 0] = xcur[fcur == 0]
+    roots[fpre == 0] = xpre[fpre == 0]
+    converged[valid & ((fpre == 0) | (fcur == 0))] = True
+    active = valid & ~converged
+
+    for _ in range(maxiter):
+        idx = np.flatnonzero(active)
+        if idx.size == 0:
+            break
+        iterations[idx] += 1
+        xp, xc, xb = xpre[idx], xcur[idx], xblk[idx]
+        fp, fc, fb = fpre[idx], fcur[idx], fblk[idx]
+        sp, sc = spre[idx], scur[idx]
+
+        # Keep the root bracketed between `xc` and `xb`
+        new_block = (fp != 0) & (fc != 0) & (np.signbit(fp) != np.signbit(fc))
+        xb, fb = np.where(new_block, xp, xb), np.where(new_block, fp, fb)
+        sp, sc = np.where(new_block, xc - xp, sp), np.where(new_block, xc - xp, sc)
+
+        # Make `xc` the best estimate so far
+        swap = np.abs(fb) < np.abs(fc)
+        xp, fp = np.where(swap, xc, xp), np.where(swap, fc, fp)
+        xc, fc = np.where(swap, xb, xc), np.where(swap, fb, fc)
+        xb, fb = np.where(swap, xp, xb), np.where(swap, fp, fb)
+
+        delta = (xtol + rtol*np.abs(xc))/2
+        sbis = (xb - xc)/2
+        done = (fc == 0) | (np.abs(sbis) < delta)
+        roots[idx[done]] = xc[done]
+        converged[idx[done]] = True
+        active[idx[done]] = False
+
+        # Try secant interpolation or inverse quadratic extrapolation, else bisect
+        with np.errstate(divide="ignore", invalid="ignore"):
+            interpolate = (np.abs(sp) > delta) & (np.abs(fc) < np.abs(fp))
+            dpre = (fp - fc)/(xp - xc)
+            dblk = (fb - fc)/(xb - xc)
+            stry = np.where(xp == xb,
+                            -fc*(xc - xp)/(fc - fp),
+                            -fc*(fb*dblk - fp*dpre)/(dblk*dpre*(fb - fp)))
+        accept = interpolate & (2*np.abs(stry) < np.minimum(np.abs(sp), 3*np.abs(sbis) - delta))
+        sp, sc = np.where(accept, sc, sbis), np.where(accept, stry, sbis)
+
+        xp, fp = xc, fc
+        xc = xc + np.where(np.abs(sc) > delta, sc, np.where(sbis > 0, delta, -delta))
+
+        keep = ~done
+        idx = idx[keep]
+        xpre[idx], fpre[idx], xblk[idx], fblk[idx] = xp[keep], fp[keep], xb[keep], fb[keep]
+        spre[idx], scur[idx], xcur[idx] = sp[keep], sc[keep], xc[keep]
+        if idx.size:
+            fcur[idx] = f(xcur[idx], idx)
+            function_calls[idx] += 1
+
+    # Members still iterating ran out of iterations; report their best estimate
+    roots[active] = xcur[active]
+    if full_output:
+        return roots, converged, {"iterations": iterations, "function_calls": function_calls}
+    return roots, converged
@@ -12,14 +12,21 @@ Stark broadening expression.
 # Import modules
 import numpy as np
 
-from ..utils.functions import a, b
+from ..utils.functions import WORK_SLOTS, griem_functions
+from ..utils.profiling import timed
+
+# Largest number of (velocity, perturber) elements evaluated at once by default
+CHUNK_ELEMENTS = 2**20
+
 
 # Main function
+@timed("sum")
 def sum(
         rhos: np.ndarray, 
         vels: np.ndarray, 
         omegas:np.ndarray, 
-        exp_vals_sqrd: np.ndarray
+        exp_vals_sqrd: np.ndarray,
+        chunk_size: int = None
     ):
     """
     Evaluate the summation term in Griem's Stark broadening model.
@@ -28,21 +35,56 @@ def sum(
     depends on the scaled impact parameter (z_min), expectation values, and special
     functions `a(z)` and `b(z)`. Handles single or multiple velocities for integration.
 
+    The (n_vel x n_terms) matrix of z_mins is built by broadcasting, `a` and `b` are evaluated
+    on it in one call each, and the result is reduced against `exp_vals_sqrd` with a
+    matrix-vector product. Velocities are processed in chunks of `chunk_size` rows so memory
+    stays bounded for very large grids; the z, function and Bessel buffers are allocated once
+    and reused by every chunk.
+
     Args:
         rhos (np.ndarray): Critical impact parameter(s), one per velocity.
         vels (np.ndarray): Electron velocities (can be single value or array).
-        omegas (np.ndarray): Angular frequency differences between upper and perturbing states.
+        omegas (np.ndarray): Angular frequency differences between upper and perturbing states,
+                             or one row of them per velocity (e.g. for a whole series of states).
         exp_vals_sqrd (np.ndarray): Squared dipole matrix elements (expectation values) 
-                                    for each perturbing transition.
+                                    for each perturbing transition, same shape as `omegas`.
+        chunk_size (int, optional): Number of velocities evaluated per chunk. Defaults to None,
+                                    which keeps each chunk below `CHUNK_ELEMENTS` elements.
 
     Returns:
         np.ndarray: Array of complex-valued summation results (same length as `vels`).
     """
     vels = np.atleast_1d(vels)
+    rhos = np.atleast_1d(rhos)
+    omegas = np.asarray(omegas, dtype=np.float64)
+    exp_vals_sqrd = np.asarray(exp_vals_sqrd, dtype=np.float64)
+    per_row = omegas.ndim == 2
+    n_terms = omegas.shape[-1] if per_row else omegas.size
     sums = np.empty_like(vels, dtype=np.complex128)
-    for vel, rho, n in zip(vels, rhos, range(0, len(vels))):
-        z_mins = 1e-10*rho*omegas/vel
+    if chunk_size is None:
+        chunk_size = max(1, CHUNK_ELEMENTS // max(1, n_terms))
+
+    chunk_size = max(1, min(chunk_size, len(vels)))
+    z_buffer = np.empty((chunk_size, n_terms))
+    values = np.empty((2, chunk_size, n_terms))
+    work = np.empty((WORK_SLOTS, chunk_size, n_terms))
+
+    for start in range(0, len(vels), chunk_size):
+        stop = min(start + chunk_size, len(vels))
+        rows = stop - start
+        z_mins = z_buffer[:rows]
+        if per_row:
+            np.multiply((1e-10*rhos[start:stop]/vels[start:stop])[:, None], omegas[start:stop], out=z_mins)
+        else:
+            np.multiply.outer(1e-10*rhos[start:stop]/vels[start:stop], omegas, out=z_mins)
 
-        a_terms, b_terms = np.array(a(z_mins)), 1j*np.array(b((3/4)*z_mins))
-        sums[n] = np.sum(exp_vals_sqrd*(a_terms + b_terms))
-    return sums
\ No newline at end of file
+        griem_functions(z_mins, "a", out=values[:1, :rows], work=work[:, :rows])
+        z_mins *= 3/4
+        griem_functions(z_mins, "b", out=values[1:, :rows], work=work[:, :rows])
+        if per_row:
+            exp_rows = exp_vals_sqrd[start:stop]
+            sums[start:stop] = (np.einsum("ij,ij->i", values[0, :rows], exp_rows)
+                                + 1j*np.einsum("ij,ij->i", values[1, :rows], exp_rows))
+        else:
+            sums[start:stop] = values[0, :rows] @ exp_vals_sqrd + 1j*(values[1, :rows] @ exp_vals_sqrd)
+    return sums
@@ -0,0 +1,375 @@
+"""
+catalog.py
+
+Line-catalog generator: Stark widths and shifts of every allowed (lower, upper) transition of
+an element over a set of plasma conditions, streamed to a CSV, Parquet or HDF5 file.
+
+The allowed transitions are enumerated from the energy level index, and grouped by upper state,
+since the result of a line does not depend on its lower state. Chunks of upper states are
+calculated by `run_engine.run_series_temperatures` (one batched rho_min solve per chunk, shared
+by every temperature and lower state) on a worker pool, and the rows of each chunk are written
+as soon as it completes. Only a bounded number of chunks is ever in flight, so memory stays flat
+however large the catalog is.
+"""
+
+# Import modules
+import csv
+import os
+from concurrent.futures import Executor
+from typing import Union
+
+import numpy as np
+
+from .run_engine import run_series_temperatures
+from .utils.helpers import load_energy_index
+from .utils.parallel import map_unordered
+
+# Columns of a catalog, in order
+CATALOG_COLUMNS = ("element", "lower_state", "upper_state", "wavelength_nm", "temperature_K",
+                   "density", "width", "shift")
+
+# Catalog file formats by file extension
+CATALOG_FORMATS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet",
+                   ".h5": "hdf5", ".hdf5": "hdf5"}
+
+
+def allowed_transitions(
+        element: str,
+        lower_states: list = None,
+        max_n: int = None
+    ):
+    """
+    Electric dipole transitions between the levels of an element.
+
+    A transition is allowed if the orbital angular momentum changes by one (l = L ± 1) and the
+    total angular momentum by at most one. The upper state is the level of higher energy.
+
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        lower_states (list, optional): Only return transitions from these lower states (e.g.
+                                       ['5S1/2', '5P3/2']). Defaults to None, which uses every level.
+        max_n (int, optional): Largest principal quantum number of the upper state. Defaults to
+                               None (no limit).
+
+    Raises:
+        ValueError: If a state of `lower_states` is not found in the data.
+
+    Returns:
+        list: (lower state, upper state) pairs, ordered by upper state then lower state as in
+              the energy table.
+    """
+    index = load_energy_index(element)
+    configs = index.levels["Config"]
+    energy = index.levels["Energy"]
+    rows = np.array(sorted(index.rows.values()))
+    if lower_states is None:
+        lower_rows = rows
+    else:
+        for state in lower_states:
+            if index.row(state) is None:
+                raise ValueError(f"No lower state with configuation: {state}")
+        lower_rows = np.array([index.row(state) for state in lower_states])
+
+    transitions = []
+    for upper in rows:
+        if max_n is not None and index.n[upper] > max_n:
+            continue
+        allowed = ((np.abs(index.l[lower_rows] - index.l[upper]) == 1)
+                   & (np.abs(index.j[lower_rows] - index.j[upper]) <= 1)
+                   & (energy[lower_rows] < energy[upper]))
+        transitions += [(str(configs[lower]), str(configs[upper])) for lower in lower_rows[allowed]]
+    return transitions
+
+
+def catalog_blocks(
+        element: str,
+        temperatures: Union[float, np.ndarray],
+        densities: Union[float, np.ndarray] = None,
+        transitions: list = None,
+        n_terms: int = 1,
+        n_nodes: int = 32,
+        chunk_size: int = 16,
+        executor: Union[str, Executor] = "serial",
+        max_workers: int = None
+    ):
+    """
+    Generate the catalog of an element, one block of rows per chunk of upper states.
+
+    Every line gets one row per temperature and density. Widths and shifts are per unit electron
+    density (see the README) unless `densities` are given, in which case they are multiplied by
+    each density (the impact approximation is linear in the density).
+
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        temperatures (float, np.ndarray): Electron temperatures [K] (Maxwellian electrons).
+        densities (float, np.ndarray, optional): Electron densities. Defaults to None, which gives
+                                                 the widths and shifts per unit density.
+        transitions (list, optional): (lower state, upper state) pairs. Defaults to None, which
+                                       uses every allowed transition (see `allowed_transitions`).
+        n_terms (int, optional): The number of perturbing states to include. Defaults to 1.
+        n_nodes (int, optional): Number of quadrature nodes per temperature. Defaults to 32.
+        chunk_size (int, optional): Number of upper states calculated together. Defaults to 16.
+        executor (str or Executor, optional): 'serial', 'thread', 'process', or an existing
+                                              `concurrent.futures.Executor`. Defaults to 'serial'.
+        max_workers (int, optional): Number of thread or process workers. Defaults to None.
+
+    Yields:
+        dict: Column name -> array of the rows of one chunk (see CATALOG_COLUMNS), in the order
+              the chunks complete.
+    """
+    temperatures = np.atleast_1d(np.asarray(temperatures, dtype=np.float64))
+    density_values = np.ones(1) if densities is None else np.atleast_1d(
+        np.asarray(densities, dtype=np.float64))
+    if transitions is None:
+        transitions = allowed_transitions(element)
+    index = load_energy_index(element)
+
+    # Lower states of each upper state, then chunks of upper states
+    lines = {}
+    for lower_state, upper_state in transitions:
+        lines.setdefault(upper_state, []).append(lower_state)
+    upper_states = list(lines)
+    chunks = (upper_states[start:start + chunk_size]
+              for start in range(0, len(upper_states), chunk_size))
+    tasks = ((element, chunk, temperatures, n_terms, n_nodes) for chunk in chunks)
+
+    results = map_unordered(_catalog_chunk, tasks, executor, max_workers,
+                            energy_data={element: index.levels})
+    for _, (chunk, integral) in results:
+        block = {name: [] for name in CATALOG_COLUMNS}
+        for state, state_integral in zip(chunk, integral):
+            upper_energy = index.levels["Energy"][index.row(state)]
+            for lower_state in lines[state]:
+                lower_energy = index.levels["Energy"][index.row(lower_state)]
+                wavelength = 1e7/abs(upper_energy - lower_energy)
+                for temperature, value in zip(temperatures, state_integral):
+                    for density in density_values:
+                        block["element"].append(element)
+                        block["lower_state"].append(lower_state)
+                        block["upper_state"].append(state)
+                        block["wavelength_nm"].append(wavelength)
+                        block["temperature_K"].append(temperature)
+                        block["density"].append(np.nan if densities is None else density)
+                        block["width"].append(value.real*density)
+                        block["shift"].append(value.imag*density)
+        yield {name: np.asarray(values) for name, values in block.items()}
+
+
+def _catalog_chunk(task: tuple):
+    """Width/shift of a chunk of upper states at every temperature (process pool task)."""
+    element, upper_states, temperatures, n_terms, n_nodes = task
+    integral, _, _ = run_series_temperatures(element, None, upper_states, temperatures,
+                                             n_terms, n_nodes)
+    return upper_states, integral
+
+
+def write_catalog(
+        path: str,
+        elements: Union[str, list],
+        temperatures: Union[float, np.ndarray],
+        densities: Union[float, np.ndarray] = None,
+        lower_states: list = None,
+        max_n: int = None,
+        n_terms: int = 1,
+        n_nodes: int = 32,
+        chunk_size: int = 16,
+        executor: Union[str, Executor] = "serial",
+        max_workers: int = None,
+        file_format: str = None
+    ):
+    """
+    Calculate the line catalog of one or more elements and stream it to a file.
+
+    Example:
+        >>> write_catalog("catalog.csv", ["Rb", "Cs"], temperatures=[5000, 10000, 20000],
+        ...               max_n=15, executor="process")
+
+    Args:
+        path (str): Output file.
+        elements (str, list): Element symbol(s) (e.g. ['Rb', 'Cs']).
+        temperatures (float, np.ndarray): Electron temperatures [K].
+        densities (float, np.ndarray, optional): Electron densities. Defaults to None (widths
+                                                 and shifts per unit density).
+        lower_states (list, optional): Only catalog transitions from these lower states. Defaults
+                                       to None. Requires a single element.
+        max_n (int, optional): Largest principal quantum number of the upper states. Defaults to None.
+        n_terms (int, optional): The number of perturbing states to include. Defaults to 1.
+        n_nodes (int, optional): Number of quadrature nodes per temperature. Defaults to 32.
+        chunk_size (int, optional): Number of upper states calculated together. Defaults to 16.
+        executor (str or Executor, optional): 'serial', 'thread', 'process', or an existing
+                                              `concurrent.futures.Executor`. Defaults to 'serial'.
+        max_workers (int, optional): Number of thread or process workers. Defaults to None.
+        file_format (str, optional): 'csv', 'parquet' or 'hdf5'. Defaults to None, which uses the
+                                     extension of `path`.
+
+    Raises:
+        ValueError: If the file format is unknown or its library is not installed, or if
+                    `lower_states` is given for several elements.
+
+    Returns:
+        int: Number of rows written.
+    """
+    elements = [elements] if isinstance(elements, str) else list(elements)
+    if lower_states is not None and len(elements) > 1:
+        raise ValueError("lower_states can only be given for a single element")
+    n_rows = 0
+    with open_catalog_writer(path, file_format) as writer:
+        for element in elements:
+            transitions = allowed_transitions(element, lower_states, max_n)
+            for block in catalog_blocks(element, temperatures, densities, transitions, n_terms,
+                                        n_nodes, chunk_size, executor, max_workers):
+                writer.write(block)
+                n_rows += len(block["width"])
+    return n_rows
+
+
+def open_catalog_writer(
+        path: str,
+        file_format: str = None
+    ):
+    """
+    Open a streaming catalog writer.
+
+    Args:
+        path (str): Output file.
+        file_format (str, optional): 'csv', 'parquet' or 'hdf5'. Defaults to None, which uses the
+                                     extension of `path`.
+
+    Raises:
+        ValueError: If the format is unknown or its library is not installed.
+
+    Returns:
+        CSVCatalogWriter, ParquetCatalogWriter or HDF5CatalogWriter: The writer.
+    """
+    if file_format is None:
+        file_format = CATALOG_FORMATS.get(os.path.splitext(path)[1].lower())
+    writers = {"csv": CSVCatalogWriter, "parquet": ParquetCatalogWriter, "hdf5": HDF5CatalogWriter}
+    if file_format not in writers:
+        raise ValueError(f"Unknown catalog format for {path}. Use one of {tuple(writers)}.")
+    return writers[file_format](path)
+
+
+class CSVCatalogWriter:
+    """
+    Streaming CSV catalog writer.
+
+    Methods:
+        write(block): Append a block of rows (see `catalog_blocks`).
+        close(): Close the file.
+    """
+    def __init__(self, path: str):
+        """
+        Open `path` and write the header.
+
+        Args:
+            path (str): Output file.
+        """
+        self._file = open(path, "w", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(CATALOG_COLUMNS)
+
+    def write(self, block: dict):
+        """Append a block of rows."""
+        self._writer.writerows(zip(*[block[name].tolist() for name in CATALOG_COLUMNS]))
+        self._file.flush()
+
+    def close(self):
+        """Close the file."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ParquetCatalogWriter:
+    """
+    Streaming Parquet catalog writer (requires `pyarrow`), one row group per block.
+
+    Methods:
+        write(block): Append a block of rows (see `catalog_blocks`).
+        close(): Close the file.
+    """
+    def __init__(self, path: str):
+        """
+        Open `path`.
+
+        Args:
+            path (str): Output file.
+
+        Raises:
+            ValueError: If `pyarrow` is not installed.
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ValueError("Writing Parquet catalogs requires pyarrow") from None
+        self._pyarrow = pyarrow
+        schema = pyarrow.schema([(name, pyarrow.string()) for name in CATALOG_COLUMNS[:3]]
+                                + [(name, pyarrow.float64()) for name in CATALOG_COLUMNS[3:]])
+        self._writer = pyarrow.parquet.ParquetWriter(path, schema)
+
+    def write(self, block: dict):
+        """Append a block of rows."""
+        columns = [self._pyarrow.array(block[name].tolist()) for name in CATALOG_COLUMNS]
+        self._writer.write_table(self._pyarrow.Table.from_arrays(columns, names=list(CATALOG_COLUMNS)))
+
+    def close(self):
+        """Close the file."""
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class HDF5CatalogWriter:
+    """
+    Streaming HDF5 catalog writer (requires `h5py`), with one resizable dataset per column.
+
+    Methods:
+        write(block): Append a block of rows (see `catalog_blocks`).
+        close(): Close the file.
+    """
+    def __init__(self, path: str):
+        """
+        Open `path` and create the datasets.
+
+        Args:
+            path (str): Output file.
+
+        Raises:
+            ValueError: If `h5py` is not installed.
+        """
+        try:
+            import h5py
+        except ImportError:
+            raise ValueError("Writing HDF5 catalogs requires h5py") from None
+        self._file = h5py.File(path, "w")
+        string = h5py.string_dtype()
+        for n, name in enumerate(CATALOG_COLUMNS):
+            self._file.create_dataset(name, shape=(0,), maxshape=(None,), chunks=(4096,),
+                                      dtype=string if n < 3 else np.float64)
+
+    def write(self, block: dict):
+        """Append a block of rows."""
+        for name in CATALOG_COLUMNS:
+            dataset, values = self._file[name], block[name]
+            start = dataset.shape[0]
+            dataset.resize((start + len(values),))
+            dataset[start:] = values.astype(object) if values.dtype.kind == "U" else values
+
+    def close(self):
+        """Close the file."""
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
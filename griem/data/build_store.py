@@ -0,0 +1,57 @@
+"""
+build_store.py
+
+One-time build step that compiles the Excel energy level workbooks into compact NumPy `.npz`
+stores that ship with the package.
+
+Parsing the workbooks with `pandas.read_excel` is far slower than the physics itself, so the
+runtime loader (`utils.helpers.load_energy_data`) reads the `.npz` stores instead. Re-run this
+module whenever one of the workbooks is edited:
+
+    python -m griem.data.build_store            # rebuild every element
+    python -m griem.data.build_store Rb         # rebuild a single element
+"""
+
+# Import modules
+import sys
+
+import numpy as np
+import pandas as pd
+
+from ..utils.helpers import ENERGY_DATA_FILES, energy_data_path
+
+
+def build_energy_store(element: str):
+    """
+    Convert the Excel workbook of `element` into an `.npz` store.
+
+    Every column is saved as its own array (strings as fixed-width unicode so the store loads
+    without pickling), along with a `__columns__` array preserving the column order. Empty
+    spreadsheet columns (pandas' "Unnamed: n") are dropped.
+
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+
+    Returns:
+        str: Path of the written `.npz` store.
+    """
+    data = pd.read_excel(energy_data_path(element, ".xlsx"))
+    data = data.loc[:, ~data.columns.astype(str).str.startswith("Unnamed")]
+
+    arrays = {}
+    for column in data.columns:
+        values = data[column].to_numpy()
+        if values.dtype == object:
+            values = values.astype(str)
+        arrays[str(column)] = values
+    arrays["__columns__"] = np.array([str(column) for column in data.columns])
+
+    path = energy_data_path(element)
+    np.savez(path, **arrays)
+    return path
+
+
+if __name__ == "__main__":
+    elements = sys.argv[1:] or list(ENERGY_DATA_FILES)
+    for element in elements:
+        print(f"Wrote {build_energy_store(element)}")
@@ -0,0 +1,223 @@
+"""
+fields.py
+
+Spatially resolved width/shift maps of plasma fields (e.g. from simulations), evaluated in
+chunks through memory maps so that resident memory stays bounded for any number of cells.
+
+The input field is either an electron temperature per cell, evaluated with a `lookup.LineTable`,
+or a full EVDF per cell on a shared velocity grid, integrated against the Griem kernel of each
+line (rho_min and the summation are solved once per upper state, see `run_engine`). An optional
+electron density field scales the results. Inputs are read from `.npy` files with
+`mmap_mode='r'`, and the output `(*cells, n_lines)` complex array is written into a `.npy`
+memory map, one chunk of cells per task, so the chunks can run on a process pool.
+
+Finished chunks are recorded in a progress file next to the output, together with a digest of
+the inputs, and an interrupted run with the same inputs resumes with the chunks that are missing.
+"""
+
+# Import modules
+import os
+from concurrent.futures import Executor
+from typing import Union
+
+import numpy as np
+
+from . import __version__
+from .lookup import LineTable
+from .run_engine import series_terms, series_kernel
+from .calc.data_processing import check_states, process_data
+from .calc.integral import integrate_series
+from .utils import functions
+from .utils.helpers import load_energy_index
+from .utils.parallel import map_unordered
+from .utils.result_cache import input_digest
+
+
+def evaluate_field(
+        element: str,
+        lines: list,
+        output: str,
+        temperature: Union[str, np.ndarray] = None,
+        evdf: Union[str, np.ndarray] = None,
+        velocity: np.ndarray = None,
+        density: Union[str, np.ndarray] = None,
+        table: LineTable = None,
+        n_terms: int = 1,
+        chunk_size: int = 2**18,
+        executor: Union[str, Executor] = "serial",
+        max_workers: int = None,
+        resume: bool = True
+    ):
+    """
+    Width/shift map of `lines` over a plasma field, written to the `.npy` file `output`.
+
+    Give either `temperature` (Maxwellian electrons, interpolated from `table`) or `evdf` and
+    `velocity` (one distribution per cell). Fields are `.npy` paths (memory-mapped in every
+    worker) or arrays; use paths with a 'process' executor, since arrays are copied to each task.
+
+    Example:
+        >>> table = LineTable.build("Rb", [("5P3/2", "10S1/2")], t_min=1000, t_max=50000)
+        >>> widths = evaluate_field("Rb", [("5P3/2", "10S1/2")], "width_shift.npy",
+        ...                         temperature="te.npy", density="ne.npy", table=table,
+        ...                         executor="process")
+
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        lines (list): (lower state, upper state) pairs (e.g. [('5P3/2', '10S1/2')]).
+        output (str): Output `.npy` file, shape (*cells, n_lines), complex width + 1j*shift.
+        temperature (str, np.ndarray, optional): Electron temperature [K] of each cell.
+                                                 Defaults to None.
+        evdf (str, np.ndarray, optional): EVDF of each cell on `velocity`, shape (*cells, n_vel).
+                                          Defaults to None.
+        velocity (np.ndarray, optional): Velocity grid of `evdf`. Defaults to None.
+        density (str, np.ndarray, optional): Electron density of each cell, multiplying the
+                                             widths and shifts. Defaults to None (per unit density).
+        table (LineTable, optional): Table holding `lines`, used with `temperature`. Defaults to
+                                     None, which builds one over the range of the field.
+        n_terms (int, optional): The number of perturbing states to include. Defaults to 1.
+        chunk_size (int, optional): Number of cells per task. Defaults to 2**18.
+        executor (str or Executor, optional): 'serial', 'thread', 'process', or an existing
+                                              `concurrent.futures.Executor`. Defaults to 'serial'.
+        max_workers (int, optional): Number of thread or process workers. Defaults to None.
+        resume (bool, optional): Keep the finished chunks of an interrupted run with the same
+                                 inputs (fields, lines, table, settings and package version).
+                                 A run with other inputs starts over. Defaults to True.
+
+    Raises:
+        ValueError: If not exactly one of `temperature` and `evdf` is given, `evdf` has no
+                    `velocity`, the field shapes do not match, or a line is not found.
+
+    Returns:
+        np.memmap: The read-only output map.
+    """
+    if (temperature is None) == (evdf is None):
+        raise ValueError("Give either a temperature or an evdf field")
+    index = load_energy_index(element)
+    for lower_state, upper_state in lines:
+        check_states(index, lower_state, upper_state)
+
+    spec = {"density": density, "n_lines": len(lines)}
+    if temperature is not None:
+        field = _open(temperature)
+        cells = field.shape
+        if table is None:
+            t_min, t_max = _field_range(field, chunk_size)
+            table = LineTable.build(element, lines, 0.99*t_min, 1.01*t_max, n_terms=n_terms,
+                                    executor=executor, max_workers=max_workers)
+        spec.update(temperature=temperature, table=table,
+                    rows=np.array([table.line(*line) for line in lines]))
+    else:
+        if velocity is None:
+            raise ValueError("An evdf field needs its velocity grid")
+        field = _open(evdf)
+        velocity = np.asarray(velocity, dtype=np.float64)
+        if field.shape[-1] != len(velocity):
+            raise ValueError(f"evdf has {field.shape[-1]} velocities, velocity has {len(velocity)}")
+        cells = field.shape[:-1]
+        upper_states = list(dict.fromkeys(upper_state for _, upper_state in lines))
+        processed_data = [process_data(index, None, state) for state in upper_states]
+        omegas, exp_vals_sqrd, _ = series_terms(processed_data, n_terms)
+        rhos, summation = series_kernel(velocity, omegas, exp_vals_sqrd)
+        rows = [upper_states.index(upper_state) for _, upper_state in lines]
+        spec.update(evdf=evdf, velocity=velocity, rhos=rhos[rows], summation=summation[rows])
+    if density is not None and _open(density).shape != cells:
+        raise ValueError(f"density has shape {_open(density).shape}, the field has {cells}")
+
+    # Output and progress maps; resuming keeps the chunks marked as done by a run whose inputs
+    # have the same digest
+    n_cells = int(np.prod(cells))
+    n_chunks = -(-n_cells // chunk_size)
+    progress = output + ".progress.npy"
+    digest_path = output + ".digest"
+    shape = tuple(cells) + (len(lines),)
+    digest = input_digest((
+        __version__, functions.get_backend(), element,
+        *(str(state) for line in lines for state in line), n_terms, chunk_size,
+        "temperature" if temperature is not None else "evdf",
+        _field_digest(field, chunk_size),
+        None if density is None else _field_digest(_open(density), chunk_size),
+        velocity, None if table is None else table.temperatures,
+        None if table is None else np.asarray(table.values)))
+    fresh = not (resume and os.path.exists(output) and os.path.exists(progress)
+                 and _open(output).shape == shape and _open(progress).shape == (n_chunks,)
+                 and _read_digest(digest_path) == digest)
+    if fresh:
+        np.lib.format.open_memmap(output, mode="w+", dtype=np.complex128, shape=shape).flush()
+        np.lib.format.open_memmap(progress, mode="w+", dtype=np.uint8, shape=(n_chunks,)).flush()
+        with open(digest_path, "w") as file:
+            file.write(digest)
+    done = np.load(progress)
+    spec.update(output=output, progress=progress, chunk_size=chunk_size)
+
+    tasks = ((spec, chunk) for chunk in np.flatnonzero(done == 0))
+    for _ in map_unordered(_field_chunk, tasks, executor, max_workers,
+                           energy_data={element: index.levels}):
+        pass
+    os.remove(progress)
+    os.remove(digest_path)
+    return np.load(output, mmap_mode="r")
+
+
+def _field_chunk(task: tuple):
+    """Evaluate one chunk of cells, write it into the output map and mark it as done."""
+    spec, chunk = task
+    start = chunk*spec["chunk_size"]
+    stop = start + spec["chunk_size"]
+    if "temperature" in spec:
+        temperature = _open(spec["temperature"]).reshape(-1)[start:stop]
+        values = spec["table"].query(spec["rows"][None, :], temperature[:, None])
+    else:
+        evdf = _open(spec["evdf"])
+        evdf = np.asarray(evdf.reshape(-1, evdf.shape[-1])[start:stop], dtype=np.float64)
+        values = integrate_series(spec["velocity"], spec["rhos"], spec["summation"], evdf).T
+        values = values / (2*np.pi)
+    if spec["density"] is not None:
+        values = values*np.asarray(_open(spec["density"]).reshape(-1)[start:stop])[:, None]
+
+    output = np.load(spec["output"], mmap_mode="r+")
+    output.reshape(-1, spec["n_lines"])[start:stop] = values
+    output.flush()
+    progress = np.load(spec["progress"], mmap_mode="r+")
+    progress[chunk] = 1
+    progress.flush()
+    return chunk
+
+
+def _field_range(
+        field: np.ndarray,
+        chunk_size: int
+    ):
+    """Smallest and largest value of a field, read in chunks."""
+    flat = field.reshape(-1)
+    t_min, t_max = np.inf, -np.inf
+    for start in range(0, len(flat), chunk_size):
+        values = flat[start:start + chunk_size]
+        t_min, t_max = min(t_min, values.min()), max(t_max, values.max())
+    return float(t_min), float(t_max)
+
+
+def _field_digest(
+        field: np.ndarray,
+        chunk_size: int
+    ):
+    """Digest of the shape and contents of a field, read in chunks."""
+    flat = field.reshape(-1)
+    chunks = (input_digest((flat[start:start + chunk_size],))
+              for start in range(0, len(flat), chunk_size))
+    return input_digest((str(field.shape), *chunks))
+
+
+def _read_digest(path: str):
+    """The input digest stored at `path`, or None if there is none."""
+    try:
+        with open(path) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _open(field: Union[str, np.ndarray]):
+    """A field: memory-mapped read-only from a `.npy` path, or the array itself."""
+    if isinstance(field, str):
+        return np.load(field, mmap_mode="r")
+    return np.asarray(field)
@@ -0,0 +1,275 @@
+"""
+lookup.py
+
+Precomputed width/shift tables of a fixed set of lines over electron temperature, for codes
+that need Stark parameters at millions of (Te, ne) points (e.g. radiative transfer).
+
+A `LineTable` holds the width and shift of every line at nodes uniformly spaced in log(Te),
+together with their derivatives in log(Te), and interpolates them with cubic Hermite
+polynomials. Widths and shifts are per unit electron density and scale linearly with it (impact
+approximation), so densities are applied at query time.
+
+The interpolation error is measured when the table is built: every line is also calculated at
+the midpoints between nodes, where the Hermite error is largest, and the largest relative
+deviation (relative to the largest |width| or |shift| of the line) is stored as `width_error`
+and `shift_error`. With the default 64 nodes from 300 K to 100000 K it is a few times 1e-6.
+
+Tables are saved as a `.npy` file of values, memory-mapped on load, with a `.json` file of
+metadata next to it.
+"""
+
+# Import modules
+import json
+import os
+from concurrent.futures import Executor
+from functools import partial
+from typing import Union
+
+import numpy as np
+
+from . import __version__
+from .run_engine import run_series_temperatures
+from .calc.data_processing import check_states
+from .utils.helpers import load_energy_index
+from .utils.parallel import map_ordered, split_work
+
+
+class LineTable:
+    """
+    Width/shift lookup table of a set of lines over log electron temperature.
+
+    Attributes:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        lines (list): (lower state, upper state) pairs, one per table row.
+        temperatures (np.ndarray): Temperature nodes [K], uniform in log(Te).
+        values (np.ndarray): Array (4, n_lines, n_temperatures) of the width, the shift and
+                             their derivatives with respect to log(Te), usually a read-only
+                             memory map.
+        width_error (np.ndarray): Measured relative interpolation error of the width of each line.
+        shift_error (np.ndarray): Measured relative interpolation error of the shift of each line.
+        n_terms (int): The number of perturbing states used.
+
+    Methods:
+        build(element, lines, ...): Calculate a new table.
+        query(lines, temperatures, densities): Interpolated widths and shifts.
+        line(lower_state, upper_state): Row of a line.
+        save(path): Save the table.
+        load(path): Load a saved table, memory-mapped.
+    """
+    def __init__(
+            self,
+            element: str,
+            lines: list,
+            temperatures: np.ndarray,
+            values: np.ndarray,
+            width_error: np.ndarray,
+            shift_error: np.ndarray,
+            n_terms: int = 1
+        ):
+        """
+        Initialize a LineTable object.
+
+        Args:
+            element (str): The alkali element symbol (e.g. 'Rb').
+            lines (list): (lower state, upper state) pairs.
+            temperatures (np.ndarray): Temperature nodes [K], uniform in log(Te).
+            values (np.ndarray): Width, shift and their log(Te) derivatives,
+                                 shape (4, n_lines, n_temperatures).
+            width_error (np.ndarray): Relative interpolation error of each width.
+            shift_error (np.ndarray): Relative interpolation error of each shift.
+            n_terms (int, optional): The number of perturbing states used. Defaults to 1.
+        """
+        self.element = element
+        self.lines = [tuple(line) for line in lines]
+        self.temperatures = np.asarray(temperatures, dtype=np.float64)
+        self.values = values
+        self.width_error = np.asarray(width_error, dtype=np.float64)
+        self.shift_error = np.asarray(shift_error, dtype=np.float64)
+        self.n_terms = n_terms
+        self._u_min = np.log(self.temperatures[0])
+        self._step = (np.log(self.temperatures[-1]) - self._u_min)/(len(self.temperatures) - 1)
+        self._rows = {line: n for n, line in enumerate(self.lines)}
+
+    @classmethod
+    def build(
+            cls,
+            element: str,
+            lines: list,
+            t_min: float = 300.0,
+            t_max: float = 1e5,
+            n_temperatures: int = 64,
+            n_terms: int = 1,
+            n_nodes: int = 32,
+            executor: Union[str, Executor] = "serial",
+            max_workers: int = None
+        ):
+        """
+        Calculate the table of `lines` on `n_temperatures` nodes from `t_min` to `t_max`.
+
+        Each distinct upper state is calculated once (see `run_engine.run_series_temperatures`),
+        at the nodes and at the midpoints used to measure the interpolation error.
+
+        Args:
+            element (str): The alkali element symbol (e.g. 'Rb').
+            lines (list): (lower state, upper state) pairs (e.g. [('5P3/2', '10S1/2')]).
+            t_min (float, optional): Lowest temperature [K]. Defaults to 300.
+            t_max (float, optional): Highest temperature [K]. Defaults to 1e5.
+            n_temperatures (int, optional): Number of temperature nodes. Defaults to 64.
+            n_terms (int, optional): The number of perturbing states to include. Defaults to 1.
+            n_nodes (int, optional): Number of Maxwellian quadrature nodes per temperature.
+                                     Defaults to 32.
+            executor (str or Executor, optional): 'serial', 'thread', 'process', or an existing
+                                                  `concurrent.futures.Executor`. Defaults to 'serial'.
+            max_workers (int, optional): Number of thread or process workers. Defaults to None.
+
+        Raises:
+            ValueError: If a line is not found in the data, or the temperature grid is invalid.
+
+        Returns:
+            LineTable: The new table.
+        """
+        if not 0 < t_min < t_max or n_temperatures < 3:
+            raise ValueError("Need 0 < t_min < t_max and at least 3 temperatures")
+        index = load_energy_index(element)
+        for lower_state, upper_state in lines:
+            check_states(index, lower_state, upper_state)
+
+        # Nodes and midpoints, all calculated in one pass
+        u = np.linspace(np.log(t_min), np.log(t_max), 2*n_temperatures - 1)
+        upper_states = list(dict.fromkeys(upper_state for _, upper_state in lines))
+        run_chunk = partial(run_series_temperatures, element, None, temperatures=np.exp(u),
+                            n_terms=n_terms, n_nodes=n_nodes)
+        results = map_ordered(run_chunk, split_work(upper_states, executor, max_workers), executor,
+                              max_workers, energy_data={element: index.levels})
+        integral = np.concatenate([chunk_integral for chunk_integral, _, _ in results])
+        integral = integral[[upper_states.index(upper_state) for _, upper_state in lines]]
+
+        nodes, midpoints = integral[:, ::2], integral[:, 1::2]
+        step = u[2] - u[0]
+        values = np.stack([nodes.real, nodes.imag,
+                           np.gradient(nodes.real, step, axis=-1, edge_order=2),
+                           np.gradient(nodes.imag, step, axis=-1, edge_order=2)])
+
+        table = cls(element, lines, np.exp(u[::2]), values, np.zeros(len(lines)),
+                    np.zeros(len(lines)), n_terms)
+        rows = np.repeat(np.arange(len(lines)), n_temperatures - 1)
+        estimate = table.query(rows, np.tile(np.exp(u[1::2]), len(lines))).reshape(midpoints.shape)
+        table.width_error = (np.max(np.abs(estimate.real - midpoints.real), axis=-1)
+                             / np.max(np.abs(nodes.real), axis=-1))
+        table.shift_error = (np.max(np.abs(estimate.imag - midpoints.imag), axis=-1)
+                             / np.max(np.abs(nodes.imag), axis=-1))
+        return table
+
+    def line(
+            self,
+            lower_state: str,
+            upper_state: str
+        ):
+        """
+        Row of a line in the table.
+
+        Args:
+            lower_state (str): Lower state of the line (e.g. '5P3/2').
+            upper_state (str): Upper state of the line (e.g. '10S1/2').
+
+        Raises:
+            ValueError: If the line is not in the table.
+
+        Returns:
+            int: The row.
+        """
+        if (lower_state, upper_state) not in self._rows:
+            raise ValueError(f"Line {lower_state} -> {upper_state} is not in the table")
+        return self._rows[(lower_state, upper_state)]
+
+    def query(
+            self,
+            lines: Union[int, np.ndarray],
+            temperatures: Union[float, np.ndarray],
+            densities: Union[float, np.ndarray] = None
+        ):
+        """
+        Interpolated widths and shifts.
+
+        Args:
+            lines (int, np.ndarray): Row(s) of the lines (see `line`), broadcast against
+                                     `temperatures`.
+            temperatures (float, np.ndarray): Electron temperatures [K], within the table.
+            densities (float, np.ndarray, optional): Electron densities the widths and shifts are
+                                                     multiplied by. Defaults to None (per unit
+                                                     density).
+
+        Raises:
+            ValueError: If a temperature is outside the table.
+
+        Returns:
+            np.ndarray: Complex width + 1j*shift at each point.
+        """
+        u = np.log(np.asarray(temperatures, dtype=np.float64))
+        s = (u - self._u_min)/self._step
+        n_intervals = len(self.temperatures) - 1
+        if np.any((s < -1e-9) | (s > n_intervals + 1e-9)):
+            raise ValueError(f"Temperatures must be within [{self.temperatures[0]}, "
+                             f"{self.temperatures[-1]}] K")
+        k = np.clip(s.astype(np.intp), 0, n_intervals - 1)
+        t = s - k
+        lines, k, t = np.broadcast_arrays(lines, k, t)
+
+        # Cubic Hermite basis on the unit interval, derivatives scaled by the node spacing
+        t2, t3 = t*t, t*t*t
+        h00, h01 = 2*t3 - 3*t2 + 1, 3*t2 - 2*t3
+        h10, h11 = (t3 - 2*t2 + t)*self._step, (t3 - t2)*self._step
+        values = self.values
+        width = (h00*values[0][lines, k] + h01*values[0][lines, k + 1]
+                 + h10*values[2][lines, k] + h11*values[2][lines, k + 1])
+        shift = (h00*values[1][lines, k] + h01*values[1][lines, k + 1]
+                 + h10*values[3][lines, k] + h11*values[3][lines, k + 1])
+        if densities is not None:
+            width, shift = width*densities, shift*densities
+        return width + 1j*shift
+
+    def save(self, path: str):
+        """
+        Save the table as `path` (.npy) and its metadata as `path` with a `.json` extension.
+
+        Args:
+            path (str): Output file, e.g. 'rb_lines.npy'. A `.npy` extension is appended if
+                        missing, as `np.save` does.
+        """
+        values_path, metadata_path = _table_paths(path)
+        np.save(values_path, np.asarray(self.values))
+        metadata = {"version": __version__, "element": self.element, "lines": self.lines,
+                    "t_min": self.temperatures[0], "t_max": self.temperatures[-1],
+                    "n_temperatures": len(self.temperatures), "n_terms": self.n_terms,
+                    "width_error": self.width_error.tolist(),
+                    "shift_error": self.shift_error.tolist()}
+        with open(metadata_path, "w") as file:
+            json.dump(metadata, file, indent=1)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Load a table saved by `save`, memory-mapping its values.
+
+        Args:
+            path (str): The `.npy` file, or the `path` given to `save`.
+
+        Returns:
+            LineTable: The table.
+        """
+        values_path, metadata_path = _table_paths(path)
+        with open(metadata_path) as file:
+            metadata = json.load(file)
+        temperatures = np.exp(np.linspace(np.log(metadata["t_min"]), np.log(metadata["t_max"]),
+                                          metadata["n_temperatures"]))
+        return cls(metadata["element"], metadata["lines"], temperatures,
+                   np.load(values_path, mmap_mode="r"), metadata["width_error"],
+                   metadata["shift_error"], metadata["n_terms"])
+
+
+def _table_paths(path: str):
+    """The values (.npy) and metadata (.json) files of a table saved as `path`."""
+    base, extension = os.path.splitext(os.fspath(path))
+    if extension != ".npy":
+        base = base + extension
+    return base + ".npy", base + ".json"
@@ -28,6 +28,7 @@ class GriemResults():
         shift (float or np.ndarray): Stark line shifts (imaginary part of input).
         ratio (float or np.ndarray): Shift-to-width ratio (d/w) for each state.
         table (Table): A formatted table object for printing and saving results.
+        profile (dict): Instrumentation report of the calculation, or None if it was not profiled.
 
     Methods:
         print():
@@ -39,14 +40,25 @@ class GriemResults():
     Args:
         width_shift (list or np.ndarray): Complex-valued results from Griem calculation,
                                           where the real part is the width and the imaginary 
-                                          part is the shift.
+                                          part is the shift. A 2-D array holds one column
+                                          per velocity distribution.
         states (list or np.ndarray): List of upper states for which the calculation was performed.
         interact_states (list or np.ndarray, optional): List of states that contributed to 
                                                         the interaction/broadening for each result.
+        temperatures (list or np.ndarray, optional): Electron temperature of each column of a 2-D
+                                                     `width_shift` (see `Griem.scan_temperature`).
+        error (list or np.ndarray, optional): Complex error estimates of adaptive integration,
+                                              stored as `width_error` and `shift_error`.
+        n_terms (list or np.ndarray, optional): Number of perturbing states used for each upper state.
+        profile (dict, optional): Instrumentation report of the calculation (see `utils.profiling`).
     """
     def __init__(self, width_shift: Union[list, np.ndarray], 
                  states: Union[list, np.ndarray], 
-                 interact_states: Union[list, np.ndarray] = None):
+                 interact_states: Union[list, np.ndarray] = None,
+                 temperatures: Union[list, np.ndarray] = None,
+                 error: Union[list, np.ndarray] = None,
+                 n_terms: Union[list, np.ndarray] = None,
+                 profile: dict = None):
         """Initialize a GriemResults object for storing results.
 
         Args:
@@ -54,30 +66,66 @@ class GriemResults():
             states (list, np.ndarray): list of upper states calculation was performed for.
             interact_states (list, np.ndarray, optional): List of interacting states included for
                                                           calculation. Defaults to None.
+            temperatures (list, np.ndarray, optional): Temperature [K] of each distribution, used
+                                                       to label the table. Defaults to None.
+            error (list, np.ndarray, optional): error estimate of the width (real part) and shift
+                                                (imaginary part). Defaults to None.
+            n_terms (list, np.ndarray, optional): number of perturbing states used for each upper
+                                                  state. Defaults to None.
+            profile (dict, optional): instrumentation report of the calculation, see
+                                      `Griem.calculate(profile=True)`. Defaults to None.
         """
         # Store arguments as attributes
         self.states = states
+        self.temperatures = temperatures
+        self.profile = profile
         width_shift = np.asarray(width_shift)
         self.width = np.real(width_shift)
         self.shift = np.imag(width_shift)
         self.ratio = None
+        self.width_error = None if error is None else np.real(error)
+        self.shift_error = None if error is None else np.imag(error)
+        self.n_terms = n_terms
 
         # Change to float if only one upper state
         if self.width.size == 1:
             self.width = float(self.width)
             self.shift = float(self.shift)
+            if error is not None:
+                self.width_error = float(self.width_error)
+                self.shift_error = float(self.shift_error)
 
         # Calculate d/w
         self.ratio = self.shift / self.width
 
-        # Create Table of result data
-        table = pd.DataFrame({
-            "Upper state": self.states,
-            "Width": self.width,
-            "Shift": self.shift,
-            "d/w":    self.ratio})
+        # Create Table of result data, one row per upper state (and distribution)
+        if width_shift.ndim == 2:
+            num_distributions = width_shift.shape[1]
+            if temperatures is None:
+                label, distributions = "Distribution", np.arange(num_distributions)
+            else:
+                label, distributions = "T [K]", np.asarray(temperatures)
+            table = pd.DataFrame({
+                "Upper state": np.repeat(self.states, num_distributions),
+                label: np.tile(distributions, len(self.states)),
+                "Width": np.ravel(self.width),
+                "Shift": np.ravel(self.shift),
+                "d/w":    np.ravel(self.ratio)})
+        else:
+            num_distributions = 1
+            table = pd.DataFrame({
+                "Upper state": self.states,
+                "Width": self.width,
+                "Shift": self.shift,
+                "d/w":    self.ratio})
+        if n_terms is not None:
+            table["Terms"] = np.repeat(n_terms, num_distributions)
+        if error is not None:
+            table["Width error"] = np.ravel(self.width_error)
+            table["Shift error"] = np.ravel(self.shift_error)
         if interact_states is not None:
-            table["Interaction states"] = [", ".join(row) for row in interact_states]
+            table["Interaction states"] = [", ".join(row) for row in interact_states
+                                           for _ in range(num_distributions)]
         self.table = Table(table, title="Griem Results")
 
     # Create methods for printing and saving
@@ -7,15 +7,26 @@ and encapsulates the full computation pipeline from raw energy data to final res
 """
 
 # Import modules
+from __future__ import annotations
+
 import numpy as np
-from typing import Union
+from typing import TYPE_CHECKING, Union
 
-from .utils.helpers import load_energy_data
+from .utils.helpers import load_energy_index
+from .utils.energy_index import EnergyIndex
 from .calc.data_processing import process_data
 from .calc.data_processing import create_terms
+from .calc.data_processing import check_states
 from .calc.rho_min.rhos_solve import calculate_rhos
 from .calc.summation import sum
-from .calc.integral import integrate_griem
+from .calc.integral import integrate_griem, integrate_series, integrate_stream, as_evdf
+from .calc.integral import integrate_weighted, maxwellian_quadrature
+from .calc.integral import integrate_adaptive, evdf_function, velocity_kernel
+from .calc.perturbers import converge_terms
+from .utils.result_cache import ResultCache, DiskCache, result_key
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 # Main function
@@ -25,7 +36,12 @@ def run(
         upper_state:str, 
         velocity: Union[float, np.ndarray], 
         EVDF: Union[float, np.ndarray] = 1.0, 
-        n_terms: int = 1):
+        n_terms: Union[int, str] = 1,
+        energy_data: Union[EnergyIndex, pd.DataFrame] = None,
+        terms_rtol: float = 1e-3,
+        cache: Union[ResultCache, DiskCache] = None,
+        rho_method: str = 'batch',
+        rho_rtol: float = 1e-6):
     """
     Perform a full Griem line-broadening calculation for a given transition.
 
@@ -40,26 +56,470 @@ def run(
         velocity (float, np.ndarray): Velocity of the electrons - can be a single value (v_bar),
                                         or it can be an array of velocities used with an EVDF.
         EVDF (float, np.ndarray, optional): Electron velocity distribution function (e.g. 
-                                            Maxwell-Boltzmann). Defaults to 1.0.
-        n_terms (int, optional): The number of perturbing states to include in the calculation. 
-                                    Defaults to 1.
+                                            Maxwell-Boltzmann), or a function of velocity.
+                                            Defaults to 1.0. A 2-D array
+                                            (n_distributions x n_vel) or an iterable of EVDFs
+                                            shares one rho/summation kernel between all of them.
+        n_terms (int, str, optional): The number of perturbing states to include in the calculation,
+                                      or 'auto' to add states until the width and shift change
+                                      by less than `terms_rtol` (see `calc.perturbers`).
+                                      Defaults to 1.
+        energy_data (EnergyIndex, pd.DataFrame, optional): Energy data of `element`. Defaults
+                                                           to None, which uses the cached index.
+        terms_rtol (float, optional): Relative tolerance of `n_terms='auto'`. Defaults to 1e-3.
+        cache (ResultCache, DiskCache, optional): Cache of results by upper state, in memory or
+                                                  on disk (see `utils.result_cache`); the lower
+                                                  state is still checked on a hit. Not used with
+                                                  an explicit `energy_data`. Defaults to None.
+        rho_method (str, optional): rho_min solver method (see `calc.rho_min.rhos_solve`), e.g.
+                                    'surrogate' to interpolate rho_min(v) between a few exact
+                                    solves. Not supported with `n_terms='auto'`. Defaults to 'batch'.
+        rho_rtol (float, optional): Residual tolerance of the 'surrogate' method. Defaults to 1e-6.
+
+    Raises:
+        ValueError: If `rho_method` is combined with `n_terms='auto'`.
 
     Returns:
         tuple:
-            integral (float): The final integrated line width/shift (Stark broadening contribution).
+            integral (float): The final integrated line width/shift (Stark broadening contribution),
+                              or an array with one value per distribution for several EVDFs.
             interacting_states (list): List of interaction state labels used in the calculation.
-            processed_data (pd.DataFrame): Processed energy and transition data used in the summation.
+            processed_data (np.ndarray): Processed energy and transition data used in the summation.
     """
     # Perform calculation pipelining
-    data = load_energy_data(element)
+    if n_terms == 'auto' and rho_method != 'batch':
+        raise ValueError("n_terms='auto' solves rho_min incrementally and needs rho_method='batch'")
+    EVDF = as_evdf(EVDF)
+    if callable(EVDF):
+        EVDF = EVDF(velocity)
+    data = load_energy_index(element) if energy_data is None else energy_data
+    key = None
+    if cache is not None and energy_data is None:
+        key = result_key(element, upper_state, velocity, EVDF, n_terms, terms_rtol, rho_method,
+                         rho_rtol)
+        cached = cache.get(key)
+        if cached is not None:
+            check_states(data, lower_state, upper_state)
+            # Entries stored by `run_series` hold a scalar where `run` returns a 1-element array
+            if np.ndim(EVDF) == 2:
+                shape = (len(EVDF),)
+            else:
+                shape = (1,) if np.size(velocity) == 1 else ()
+            integral = cached[0] if np.shape(cached[0]) == shape else np.reshape(cached[0], shape)
+            return integral, cached[1], cached[2]
+
     processed_data = process_data(data, lower_state, upper_state)
-    omegas, exp_vals_sqrd, interact_states = create_terms(processed_data, n_terms)
-    rhos = calculate_rhos(velocity, omegas, exp_vals_sqrd)
-    summation = sum(rhos, velocity, omegas, exp_vals_sqrd)
-    integral = integrate_griem(velocity, rhos, summation, EVDF) / (2*np.pi)
+    rhos = None
+    if n_terms == 'auto':
+        integral, interact_states = converge_terms(processed_data, velocity, EVDF, terms_rtol)
+        integral = integral / (2*np.pi)
+    else:
+        omegas, exp_vals_sqrd, interact_states = create_terms(processed_data, n_terms)
+        rhos = calculate_rhos(velocity, omegas, exp_vals_sqrd, method=rho_method, rtol=rho_rtol)
+        summation = sum(rhos, velocity, omegas, exp_vals_sqrd)
+        integral = integrate_griem(velocity, rhos, summation, EVDF) / (2*np.pi)
+    if cache is not None:
+        cache.put(key, (integral, interact_states, processed_data), rhos=rhos)
     return integral, interact_states, processed_data
 
 
+def run_series(
+        element: str,
+        lower_state: str,
+        upper_states: Union[list, np.ndarray],
+        velocity: Union[float, np.ndarray],
+        EVDF: Union[float, np.ndarray] = 1.0,
+        n_terms: int = 1,
+        energy_data: Union[EnergyIndex, pd.DataFrame] = None,
+        cache: Union[ResultCache, DiskCache] = None):
+    """
+    Perform the Griem calculation for many upper states in one vectorized pass.
+
+    The perturbing states of every upper state are collected into (n_states x n_terms) omega
+    and expectation value matrices (padded with zero-weight terms where a state has fewer
+    perturbers), rho_min is solved for the whole (n_states x n_vel) grid by one batched
+    Brent solve, and the summation and integral are evaluated for all states together.
 
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        lower_state (str): Lower state of the transitions (e.g. '4D3/2'), or None if the
+                           transitions have been checked already.
+        upper_states (list, np.ndarray): Upper states of the transitions (e.g. ['12F5/2', '13F5/2']).
+        velocity (float, np.ndarray): Velocity of the electrons - can be a single value (v_bar),
+                                        or it can be an array of velocities used with an EVDF.
+        EVDF (float, np.ndarray, optional): Electron velocity distribution function, or several
+                                            as a 2-D array (see `run`). Defaults to 1.0.
+        n_terms (int, optional): The number of perturbing states to include in the calculation.
+                                    Defaults to 1.
+        energy_data (EnergyIndex, pd.DataFrame, optional): Energy data of `element`. Defaults
+                                                           to None, which uses the cached index.
+        cache (ResultCache, DiskCache, optional): Cache of results by upper state; only the
+                                                  states that miss are calculated, each once.
+                                                  Not used with an explicit `energy_data`.
+                                                  Defaults to None.
+
+    Returns:
+        tuple:
+            integral (np.ndarray): Width/shift of each upper state, (n_states x n_distributions)
+                                   for several EVDFs.
+            interacting_states (list): Interaction state labels of each upper state.
+            processed_data (list): Processed energy and transition data of each upper state.
+    """
+    EVDF = as_evdf(EVDF)
+    if callable(EVDF):
+        EVDF = EVDF(velocity)
+    data = load_energy_index(element) if energy_data is None else energy_data
+    if not isinstance(data, EnergyIndex):
+        data = EnergyIndex.from_frame(data)
+    if cache is not None and energy_data is None:
+        return _run_series_cached(element, lower_state, upper_states, velocity, EVDF, n_terms,
+                                  data, cache)
+
+    vels = np.atleast_1d(velocity)
+    rhos, summation, interact_states, processed_data = _series_kernel(data, lower_state,
+                                                                      upper_states, vels, n_terms)
+    integral = integrate_series(velocity, rhos, summation, EVDF)
+    return integral / (2*np.pi), interact_states, processed_data
+
+
+def run_stream(
+        element: str,
+        lower_state: str,
+        upper_states: Union[str, list, np.ndarray],
+        velocity: np.ndarray,
+        snapshots,
+        n_terms: int = 1,
+        batch_size: int = 256,
+        energy_data: Union[EnergyIndex, pd.DataFrame] = None):
+    """
+    Perform the Griem calculation for a stream of EVDF snapshots on a shared velocity grid.
+
+    rho_min and the summation are solved once for `velocity`, then the snapshots are integrated
+    in batches as they are read (see `calc.integral.integrate_stream`), so a long simulation
+    output never has to be held in memory.
+
+    Example:
+        >>> snapshots = np.load("evdf.npy", mmap_mode="r")   # (n_snapshots x n_vel)
+        >>> for width_shift in run_stream("Rb", "5P3/2", "10S1/2", velocity, snapshots, 3):
+        ...     widths.append(width_shift.real)
+
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        lower_state (str): Lower state of the transitions (e.g. '4D3/2').
+        upper_states (str, list, np.ndarray): Upper state, or several upper states.
+        velocity (np.ndarray): Velocity grid of the snapshots.
+        snapshots (np.ndarray or iterable): (n_snapshots x n_vel) array or memory map, or an
+                                            iterable (e.g. a generator) of EVDF arrays.
+        n_terms (int, optional): The number of perturbing states to include in the calculation.
+                                    Defaults to 1.
+        batch_size (int, optional): Number of snapshots integrated together. Defaults to 256.
+        energy_data (EnergyIndex, pd.DataFrame, optional): Energy data of `element`. Defaults
+                                                           to None, which uses the cached index.
+
+    Yields:
+        complex or np.ndarray: Width/shift of each snapshot, with one value per upper state if
+                               `upper_states` is a list.
+    """
+    single = isinstance(upper_states, str)
+    data = load_energy_index(element) if energy_data is None else energy_data
+    if not isinstance(data, EnergyIndex):
+        data = EnergyIndex.from_frame(data)
+    velocity = np.asarray(velocity, dtype=np.float64)
+    rhos, summation, _, _ = _series_kernel(data, lower_state, [upper_states] if single else upper_states,
+                                           velocity, n_terms)
+    for integral in integrate_stream(velocity, rhos, summation, snapshots, batch_size):
+        integral = integral / (2*np.pi)
+        yield integral[0] if single else integral
 
 
+def run_series_temperatures(
+        element: str,
+        lower_state: str,
+        upper_states: Union[list, np.ndarray],
+        temperatures: Union[float, np.ndarray],
+        n_terms: int = 1,
+        n_nodes: int = 32,
+        energy_data: Union[EnergyIndex, pd.DataFrame] = None):
+    """
+    Perform the Griem calculation for many upper states and Maxwellian temperatures at once.
+
+    Combines `run_series` and `run_temperatures`: rho_min and the summation are solved in one
+    batch on the merged Maxwellian quadrature nodes of every temperature, for every upper state.
+
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        lower_state (str): Lower state of the transitions (e.g. '4D3/2'), or None if the
+                           transitions have been checked already.
+        upper_states (list, np.ndarray): Upper states of the transitions (e.g. ['12F5/2', '13F5/2']).
+        temperatures (float, np.ndarray): Electron temperatures [K].
+        n_terms (int, optional): The number of perturbing states to include in the calculation.
+                                    Defaults to 1.
+        n_nodes (int, optional): Number of quadrature nodes per temperature. Defaults to 32.
+        energy_data (EnergyIndex, pd.DataFrame, optional): Energy data of `element`. Defaults
+                                                           to None, which uses the cached index.
+
+    Returns:
+        tuple:
+            integral (np.ndarray): Width/shift of each upper state at each temperature
+                                   (n_states x n_temperatures).
+            interacting_states (list): Interaction state labels of each upper state.
+            processed_data (list): Processed energy and transition data of each upper state.
+    """
+    vels, weights = maxwellian_quadrature(temperatures, n_nodes)
+    data = load_energy_index(element) if energy_data is None else energy_data
+    if not isinstance(data, EnergyIndex):
+        data = EnergyIndex.from_frame(data)
+    rhos, summation, interact_states, processed_data = _series_kernel(data, lower_state,
+                                                                      upper_states, vels, n_terms)
+    integral = integrate_weighted(weights, vels, rhos, summation)
+    return integral / (2*np.pi), interact_states, processed_data
+
+
+def series_terms(
+        processed_data: list,
+        n_terms: int):
+    """
+    Perturbing states of many upper states, as padded matrices.
+
+    Args:
+        processed_data (list): Processed data of each upper state (see `process_data`).
+        n_terms (int): The number of perturbing states to include in the calculation.
+
+    Returns:
+        tuple:
+            omegas (np.ndarray): Angular frequencies (n_states x n_terms), padded with 1.
+            exp_vals_sqrd (np.ndarray): Squared expectation values (n_states x n_terms), padded
+                                        with 0 so padding terms have no weight.
+            interacting_states (list): Interaction state labels of each upper state.
+    """
+    terms = [create_terms(processed, n_terms) for processed in processed_data]
+    width = max([1] + [len(omegas) for omegas, _, _ in terms])
+    omegas = np.ones((len(terms), width))
+    exp_vals_sqrd = np.zeros((len(terms), width))
+    for n, (state_omegas, state_exp_vals, _) in enumerate(terms):
+        omegas[n, :len(state_omegas)] = state_omegas
+        exp_vals_sqrd[n, :len(state_exp_vals)] = state_exp_vals
+    return omegas, exp_vals_sqrd, [states for _, _, states in terms]
+
+
+def series_kernel(
+        velocity: Union[float, np.ndarray],
+        omegas: np.ndarray,
+        exp_vals_sqrd: np.ndarray):
+    """
+    rho_min and the summation of every upper state (row of `omegas`) at every velocity.
+
+    Args:
+        velocity (float, np.ndarray): Velocity of the electrons, or a velocity grid.
+        omegas (np.ndarray): Angular frequencies (n_states x n_terms), see `series_terms`.
+        exp_vals_sqrd (np.ndarray): Squared expectation values (n_states x n_terms).
+
+    Returns:
+        tuple:
+            rhos (np.ndarray): rho_min (n_states x n_vel).
+            summation (np.ndarray): Summed contribution of the perturbing states (n_states x n_vel).
+    """
+    # Flatten the (n_states x n_vel) grid, one row of perturbing states per grid point
+    vels = np.atleast_1d(velocity)
+    grid_vels = np.tile(vels, len(omegas))
+    grid_omegas = np.repeat(omegas, len(vels), axis=0)
+    grid_exp_vals = np.repeat(exp_vals_sqrd, len(vels), axis=0)
+    rhos = calculate_rhos(grid_vels, grid_omegas, grid_exp_vals)
+    summation = sum(rhos, grid_vels, grid_omegas, grid_exp_vals)
+
+    shape = (len(omegas), len(vels))
+    return rhos.reshape(shape), summation.reshape(shape)
+
+
+def _series_kernel(
+        index: EnergyIndex,
+        lower_state: str,
+        upper_states: Union[list, np.ndarray],
+        vels: np.ndarray,
+        n_terms: int):
+    """rho_min and the summation of every upper state on the velocities `vels`, as
+    (n_states x n_vel) arrays, with the interaction states and processed data of each state."""
+    processed_data = [process_data(index, lower_state, state) for state in upper_states]
+    omegas, exp_vals_sqrd, interact_states = series_terms(processed_data, n_terms)
+    rhos, summation = series_kernel(vels, omegas, exp_vals_sqrd)
+    return rhos, summation, interact_states, processed_data
+
+
+def _run_series_cached(
+        element: str,
+        lower_state: str,
+        upper_states: Union[list, np.ndarray],
+        velocity: Union[float, np.ndarray],
+        EVDF: Union[float, np.ndarray],
+        n_terms: int,
+        index: EnergyIndex,
+        cache: Union[ResultCache, DiskCache]):
+    """`run_series` through `cache`: the distinct upper states that miss are calculated in one
+    batch and stored, and every state is read back from the cache entries."""
+    keys = [result_key(element, state, velocity, EVDF, n_terms) for state in upper_states]
+    values = {}
+    for key, state in zip(keys, upper_states):
+        if key not in values:
+            values[key] = cache.get(key)
+        if values[key] is not None and lower_state is not None:
+            check_states(index, lower_state, state)
+
+    missing = {key: state for key, state in zip(keys, upper_states) if values[key] is None}
+    if missing:
+        rhos, summation, interact_states, processed_data = _series_kernel(
+            index, lower_state, list(missing.values()), np.atleast_1d(velocity), n_terms)
+        integral = integrate_series(velocity, rhos, summation, EVDF) / (2*np.pi)
+        for n, key in enumerate(missing):
+            values[key] = (integral[n], interact_states[n], processed_data[n])
+            cache.put(key, values[key], rhos=rhos[n])
+
+    shape = (len(EVDF),) if np.ndim(EVDF) == 2 else ()
+    integral = np.array([np.reshape(values[key][0], shape) for key in keys])
+    return integral, [values[key][1] for key in keys], [values[key][2] for key in keys]
+
+
+def run_lines(
+        element: str,
+        lines: list,
+        velocity: Union[float, np.ndarray],
+        EVDF: Union[float, np.ndarray] = 1.0,
+        n_terms: int = 1,
+        cache: Union[ResultCache, DiskCache] = None):
+    """
+    Perform the Griem calculation for many lines, computing each upper state once.
+
+    The result of a line does not depend on its lower state, so the lines are checked, their
+    distinct upper states are calculated together by `run_series`, and each result is fanned
+    out to every line with that upper state.
+
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        lines (list): (lower state, upper state) pairs (e.g. [('5P3/2', '10S1/2')]).
+        velocity (float, np.ndarray): Velocity of the electrons, or a velocity grid.
+        EVDF (float, np.ndarray, optional): Electron velocity distribution function(s), see `run`.
+                                            Defaults to 1.0.
+        n_terms (int, optional): The number of perturbing states to include in the calculation.
+                                    Defaults to 1.
+        cache (ResultCache, DiskCache, optional): Cache of results by upper state, e.g. shared
+                                                  between calls. Defaults to None.
+
+    Raises:
+        ValueError: If a lower or upper state is not found in the data.
+
+    Returns:
+        tuple:
+            integral (np.ndarray): Width/shift of each line, (n_lines x n_distributions) for
+                                   several EVDFs.
+            interacting_states (list): Interaction state labels of each line.
+    """
+    index = load_energy_index(element)
+    for lower_state, upper_state in lines:
+        check_states(index, lower_state, upper_state)
+    upper_states = [upper_state for _, upper_state in lines]
+    unique_states = list(dict.fromkeys(upper_states))
+    integral, interact_states, _ = run_series(element, None, unique_states, velocity, EVDF,
+                                              n_terms, cache=cache)
+    rows = [unique_states.index(state) for state in upper_states]
+    return integral[rows], [interact_states[row] for row in rows]
+
+
+def run_adaptive(
+        element: str,
+        lower_state: str,
+        upper_state: str,
+        velocity: np.ndarray,
+        EVDF: Union[float, np.ndarray, callable] = 1.0,
+        n_terms: int = 1,
+        rtol: float = 1e-6,
+        energy_data: Union[EnergyIndex, pd.DataFrame] = None):
+    """
+    Perform the Griem calculation with adaptive, error-controlled velocity integration.
+
+    Only the range of `velocity` is used: the integral is refined with Gauss-Kronrod quadrature
+    (see `calc.integral.integrate_adaptive`), solving rho_min and the summation for the new
+    quadrature nodes of each refinement round only.
+
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        lower_state (str): Lower state of the transition (e.g. '4D3/2').
+        upper_state (str): Upper state of the transition (e.g. '12F5/2').
+        velocity (np.ndarray): Velocities spanning the integration range (and the grid of `EVDF`).
+        EVDF (float, np.ndarray, callable, optional): Electron velocity distribution function,
+                                                      tabulated on `velocity` (linearly
+                                                      interpolated) or a function of velocity.
+                                                      Defaults to 1.0.
+        n_terms (int, optional): The number of perturbing states to include in the calculation.
+                                    Defaults to 1.
+        rtol (float, optional): Relative error tolerance of the width and shift. Defaults to 1e-6.
+        energy_data (EnergyIndex, pd.DataFrame, optional): Energy data of `element`. Defaults
+                                                           to None, which uses the cached index.
+
+    Raises:
+        ValueError: If `velocity` does not span a range, `EVDF` holds several distributions, or
+                    `n_terms` is 'auto'.
+
+    Returns:
+        tuple:
+            integral (complex): The width/shift.
+            error (complex): Error estimate of the width (real) and shift (imaginary).
+            interacting_states (list): List of interaction state labels used in the calculation.
+            processed_data (np.ndarray): Processed energy and transition data used in the summation.
+    """
+    if np.size(velocity) < 2:
+        raise ValueError("Adaptive integration needs a range of velocities")
+    if n_terms == 'auto':
+        raise ValueError("Adaptive integration needs a fixed number of terms")
+    evdf = evdf_function(velocity, as_evdf(EVDF))
+    data = load_energy_index(element) if energy_data is None else energy_data
+    processed_data = process_data(data, lower_state, upper_state)
+    omegas, exp_vals_sqrd, interact_states = create_terms(processed_data, n_terms)
+
+    def kernel(vels):
+        rhos = calculate_rhos(vels, omegas, exp_vals_sqrd)
+        return velocity_kernel(vels, rhos, sum(rhos, vels, omegas, exp_vals_sqrd))
+
+    bounds = (np.min(velocity), np.max(velocity))
+    integral, error, _ = integrate_adaptive(kernel, evdf, bounds, rtol=rtol)
+    return integral / (2*np.pi), error / (2*np.pi), interact_states, processed_data
+
+
+def run_temperatures(
+        element: str,
+        lower_state: str,
+        upper_state: str,
+        temperatures: Union[float, np.ndarray],
+        n_terms: int = 1,
+        n_nodes: int = 32,
+        energy_data: Union[EnergyIndex, pd.DataFrame] = None):
+    """
+    Perform the Griem calculation for Maxwellian electrons at several temperatures.
+
+    The velocity nodes of every temperature (see `calc.integral.maxwellian_quadrature`) are
+    merged, rho_min and the summation are evaluated once on all of them, and each temperature's
+    Maxwellian average is a weighted sum of that kernel.
+
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        lower_state (str): Lower state of the transition (e.g. '4D3/2').
+        upper_state (str): Upper state of the transition (e.g. '12F5/2').
+        temperatures (float, np.ndarray): Electron temperatures [K].
+        n_terms (int, optional): The number of perturbing states to include in the calculation.
+                                    Defaults to 1.
+        n_nodes (int, optional): Number of quadrature nodes per temperature. Defaults to 32.
+        energy_data (EnergyIndex, pd.DataFrame, optional): Energy data of `element`. Defaults
+                                                           to None, which uses the cached index.
+
+    Returns:
+        tuple:
+            integral (np.ndarray): The width/shift at each temperature.
+            interacting_states (list): List of interaction state labels used in the calculation.
+            processed_data (np.ndarray): Processed energy and transition data used in the summation.
+    """
+    vels, weights = maxwellian_quadrature(temperatures, n_nodes)
+    data = load_energy_index(element) if energy_data is None else energy_data
+    processed_data = process_data(data, lower_state, upper_state)
+    omegas, exp_vals_sqrd, interact_states = create_terms(processed_data, n_terms)
+    rhos = calculate_rhos(vels, omegas, exp_vals_sqrd)
+    summation = sum(rhos, vels, omegas, exp_vals_sqrd)
+    integral = integrate_weighted(weights, vels, rhos, summation) / (2*np.pi)
+    return integral, interact_states, processed_data
@@ -0,0 +1,117 @@
+"""
+energy_index.py
+
+Array-backed index of an element's energy levels, so the per-state data processing works on
+NumPy slices instead of filtering, sorting and de-duplicating a pandas DataFrame every time.
+
+The index holds the energy level table as a structured array together with the quantum numbers
+n, l and j of every level, a configuration string -> row lookup, and the rows of each orbital
+angular momentum l.
+"""
+
+# Import modules
+from __future__ import annotations
+
+import re
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Configuration strings, e.g. '12F5/2' -> n=12, L='F', j=5/2
+_CONFIG_PATTERN = re.compile(r"^(\d+)([A-Z])(\d+)/(\d+)$")
+
+
+class EnergyIndex:
+    """
+    Precompiled index of the energy levels of one element.
+
+    Attributes:
+        levels (np.ndarray): Structured array with one record per level and one field per column
+                             of the energy data (e.g. 'Config', 'Energy', 'nnl', 'l').
+        n (np.ndarray): Principal quantum number of each level.
+        l (np.ndarray): Orbital angular momentum quantum number of each level.
+        j (np.ndarray): Total angular momentum quantum number of each level.
+        general (np.ndarray): Configuration without j (e.g. '12F'), used to drop fine structure.
+        rows (dict): Row of the first level with each configuration string.
+        by_l (dict): Rows (in table order) of the levels with each value of l.
+
+    Methods:
+        from_frame(data): Build the index from an energy data DataFrame.
+        row(state): Row of the level `state`.
+        frame(): The energy data as a DataFrame.
+    """
+    def __init__(self, levels: np.ndarray):
+        """
+        Initialize an EnergyIndex object.
+
+        Args:
+            levels (np.ndarray): Structured array of energy levels, with at least the fields
+                                 'Config', 'Energy', 'nnl' and 'l'.
+
+        Raises:
+            ValueError: If a configuration string cannot be parsed.
+        """
+        self.levels = levels
+        configs = levels["Config"]
+        parsed = [_CONFIG_PATTERN.match(config) for config in configs]
+        for config, match in zip(configs, parsed):
+            if match is None:
+                raise ValueError(f"Cannot parse configuration: {config}")
+
+        self.n = np.array([int(match[1]) for match in parsed], dtype=np.int64)
+        self.l = np.asarray(levels["l"], dtype=np.int64)
+        self.j = np.array([int(match[3])/int(match[4]) for match in parsed])
+        self.general = np.array([config[:-3] for config in configs])
+
+        self.rows = {}
+        for row, config in enumerate(configs):
+            self.rows.setdefault(str(config), row)
+        self.by_l = {int(l): np.flatnonzero(self.l == l) for l in np.unique(self.l)}
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame):
+        """
+        Build the index from an energy data DataFrame (see `helpers.load_energy_data`).
+
+        Args:
+            data (pd.DataFrame): Energy level data.
+
+        Returns:
+            EnergyIndex: The index.
+        """
+        columns = []
+        for name in data.columns:
+            values = np.asarray(data[name])
+            if values.dtype == object:
+                values = values.astype(str)
+            columns.append((str(name), values))
+        levels = np.empty(len(data), dtype=[(name, values.dtype) for name, values in columns])
+        for name, values in columns:
+            levels[name] = values
+        return cls(levels)
+
+    def row(self, state: str):
+        """
+        Row of the (first) level with configuration `state`.
+
+        Args:
+            state (str): Configuration string (e.g. '12F5/2').
+
+        Returns:
+            int: Row of the level, or None if there is no such level.
+        """
+        return self.rows.get(state)
+
+    def frame(self):
+        """
+        The energy data as a DataFrame.
+
+        Returns:
+            pd.DataFrame: One row per level.
+        """
+        import pandas as pd
+
+        return pd.DataFrame(self.levels)
@@ -0,0 +1,265 @@
+"""
+fast_functions.py
+
+Tabulated, error-bounded evaluators for Griem's special functions `A(z)`, `B(z)`, `a(z)` and
+`b(z)` (see `utils.functions`).
+
+Each function is positive for z > 0, so its logarithm is tabulated against u = log(z) with
+piecewise Chebyshev polynomials on [Z_MIN, Z_MAX]. Below Z_MIN the leading terms of the
+small-z Bessel series are used, and above Z_MAX the large-z asymptotic (Hankel) expansions,
+which also avoid the cancellation the exact `B(z)`/`b(z)` suffer for large z. The number of
+table segments is doubled until the relative error against the exact SciPy functions is below
+the requested `rtol` at test points between the Chebyshev nodes of every segment.
+
+Tables are built once per `rtol`, saved as `.npy` files in the cache directory (`$GRIEM_CACHE_DIR`,
+or `~/.cache/griem`) and memory-mapped, so worker processes share the same pages.
+"""
+
+# Import modules
+import os
+import tempfile
+
+import numpy as np
+
+# Table domain, Chebyshev degree, and number of terms in the large-z expansions
+Z_MIN = 1e-8
+Z_MAX = 20.0
+DEGREE = 12
+N_ASYMPTOTIC = 24
+MIN_RTOL = 1e-12
+TABLE_VERSION = 1
+
+# Order in which the functions are stored in a table file
+FUNCTION_NAMES = ("A", "B", "a", "b")
+
+_U_MIN, _U_MAX = np.log(Z_MIN), np.log(Z_MAX)
+_LOADED_TABLES = {}
+
+
+def _hankel_coefficients(nu: int):
+    """Coefficients of the large-z expansion of the scaled Bessel function K_nu(z)*exp(z)*sqrt(2z/pi)
+    in powers of 1/z. The coefficients of I_nu(z)*exp(-z)*sqrt(2*pi*z) alternate in sign."""
+    mu = 4*nu**2
+    coefficients = [1.0]
+    for k in range(1, N_ASYMPTOTIC):
+        coefficients.append(coefficients[-1]*(mu - (2*k - 1)**2)/(8*k))
+    return np.array(coefficients)
+
+
+_K0, _K1 = _hankel_coefficients(0), _hankel_coefficients(1)
+_ALTERNATE = (-1.0)**np.arange(N_ASYMPTOTIC)
+_I0, _I1 = _K0*_ALTERNATE, _K1*_ALTERNATE
+_KI_DIFFERENCE = np.convolve(_K0, _I0)[:N_ASYMPTOTIC] - np.convolve(_K1, _I1)[:N_ASYMPTOTIC]
+_K0_I1 = np.convolve(_K0, _I1)[:N_ASYMPTOTIC]
+_K0_I1[0] = 0.0
+
+
+def _small(name: str, z: np.ndarray):
+    """Leading terms of the small-z expansions (relative error O(z**2) or better)."""
+    z = np.maximum(z, np.finfo(np.float64).tiny)
+    L = np.log(z/2) + np.euler_gamma
+    if name == "A":
+        return 1 + z**2*(L**2 + L - 0.5)
+    if name == "B":
+        return np.pi*z**2*(-L - 0.5)
+    if name == "a":
+        return -L
+    return np.pi*(0.5 + z**2*L/2)
+
+
+def _large(name: str, z: np.ndarray):
+    """Large-z asymptotic expansions, including the cutoffs used by the exact functions."""
+    inverse_powers = np.power.outer(1/z, np.arange(N_ASYMPTOTIC))
+    if name == "A":
+        return (np.pi/2)*z*np.exp(-2*z)*((inverse_powers @ _K0)**2 + (inverse_powers @ _K1)**2)
+    if name == "B":
+        return np.where(z < 1e6, (np.pi/2)*z*(inverse_powers @ _KI_DIFFERENCE), 0.0)
+    if name == "a":
+        return (np.pi/2)*np.exp(-2*z)*(inverse_powers @ _K0)*(inverse_powers @ _K1)
+    return np.where(z < 1e8, -(np.pi/2)*(inverse_powers @ _K0_I1), 0.0)
+
+
+def _exact(name: str, z: np.ndarray):
+    """Exact SciPy evaluation of the function `name` for z > 0."""
+    from . import functions
+    return getattr(functions, name + "_exact")(z)
+
+
+class FunctionTables:
+    """
+    Piecewise Chebyshev tables of log(A), log(B), log(a) and log(b) over log(z).
+
+    Attributes:
+        coefficients (np.ndarray): Array (4, n_segments, DEGREE + 1) of Chebyshev coefficients,
+                                   usually a read-only memory map.
+        rtol (float): Relative error bound the tables were built for.
+
+    Methods:
+        A(z), B(z), a(z), b(z): Evaluate the tabulated functions.
+        evaluate(name, z): Evaluate the function `name` ('A', 'B', 'a' or 'b').
+        build(rtol): Build new tables for the error bound `rtol`.
+    """
+    def __init__(
+            self,
+            coefficients: np.ndarray,
+            rtol: float
+        ):
+        """
+        Initialize a FunctionTables object.
+
+        Args:
+            coefficients (np.ndarray): Chebyshev coefficients, shape (4, n_segments, DEGREE + 1).
+            rtol (float): Relative error bound the tables were built for.
+        """
+        self.coefficients = coefficients
+        self.rtol = rtol
+        self._step = (_U_MAX - _U_MIN)/coefficients.shape[1]
+
+    @classmethod
+    def build(cls, rtol: float):
+        """
+        Build tables meeting the relative error bound `rtol`.
+
+        Args:
+            rtol (float): Relative error bound, at least MIN_RTOL.
+
+        Raises:
+            ValueError: If `rtol` is below MIN_RTOL or cannot be met.
+
+        Returns:
+            FunctionTables: The new tables.
+        """
+        if rtol < MIN_RTOL:
+            raise ValueError(f"rtol must be at least {MIN_RTOL}, the accuracy of the exact functions")
+        nodes = np.cos(np.pi*(np.arange(DEGREE + 1) + 0.5)/(DEGREE + 1))
+        vandermonde = np.polynomial.chebyshev.chebvander(nodes, DEGREE)
+        checks = np.linspace(-1, 1, 2*DEGREE + 3)[1:-1]
+
+        n_segments = 8
+        while n_segments <= 2**14:
+            step = (_U_MAX - _U_MIN)/n_segments
+            starts = _U_MIN + step*np.arange(n_segments)[:, None]
+            coefficients = np.empty((len(FUNCTION_NAMES), n_segments, DEGREE + 1))
+            for n, name in enumerate(FUNCTION_NAMES):
+                g = np.log(_exact(name, np.exp(starts + step*(nodes + 1)/2)))
+                coefficients[n] = np.linalg.solve(vandermonde, g.T).T
+
+            tables = cls(coefficients, rtol)
+            z = np.exp(starts + step*(checks + 1)/2).ravel()
+            error = max(np.max(np.abs(tables.evaluate(name, z)/_exact(name, z) - 1))
+                        for name in FUNCTION_NAMES)
+            if error < rtol:
+                return tables
+            n_segments *= 2
+        raise ValueError(f"Could not build function tables with rtol={rtol}")
+
+    def evaluate(
+            self,
+            name: str,
+            z: np.ndarray
+        ):
+        """
+        Evaluate one of the tabulated functions.
+
+        Args:
+            name (str): Function name, 'A', 'B', 'a' or 'b'.
+            z (np.ndarray): independent variable
+
+        Returns:
+            numpy.ndarray: dependent variable
+        """
+        z = np.asarray(z, dtype=np.float64)
+        arg = np.abs(z)
+        f = np.empty_like(arg)
+
+        # Only visit the branches that have members; most calls never leave the table
+        small, large = arg < Z_MIN, arg > Z_MAX
+        if small.any() or large.any():
+            table = ~(small | large)
+            f[table] = self._interpolate(FUNCTION_NAMES.index(name), arg[table])
+            if small.any():
+                f[small] = _small(name, arg[small])
+            if large.any():
+                f[large] = _large(name, arg[large])
+        else:
+            f[...] = self._interpolate(FUNCTION_NAMES.index(name), arg)
+
+        if name == "b":
+            f *= np.where(z > 0, 1, -1)
+        return f
+
+    def _interpolate(
+            self,
+            n: int,
+            z: np.ndarray
+        ):
+        """Evaluate the table of function `n` at Z_MIN <= z <= Z_MAX."""
+        coefficients = np.asarray(self.coefficients[n])
+        s = (np.log(z) - _U_MIN)/self._step
+        k = np.clip(s.astype(np.intp), 0, coefficients.shape[0] - 1)
+        t = 2*(s - k) - 1
+
+        # Small arrays: T_j(t) = cos(j*arccos(t)) in a few calls. Large arrays: Clenshaw recurrence
+        if t.size < 256:
+            chebyshev = np.cos(np.multiply.outer(np.arccos(t), np.arange(DEGREE + 1)))
+            return np.exp(np.einsum("...j,...j->...", coefficients[k], chebyshev))
+
+        b1, b2 = np.zeros_like(t), np.zeros_like(t)
+        for j in range(DEGREE, 0, -1):
+            b1, b2 = coefficients[k, j] + 2*t*b1 - b2, b1
+        return np.exp(coefficients[k, 0] + t*b1 - b2)
+
+    def A(self, z):
+        """Tabulated `A(z)`."""
+        return self.evaluate("A", z)
+
+    def B(self, z):
+        """Tabulated `B(z)`."""
+        return self.evaluate("B", z)
+
+    def a(self, z):
+        """Tabulated `a(z)`."""
+        return self.evaluate("a", z)
+
+    def b(self, z):
+        """Tabulated `b(z)`."""
+        return self.evaluate("b", z)
+
+
+def cache_dir():
+    """
+    Directory where function tables are cached.
+
+    Returns:
+        str: `$GRIEM_CACHE_DIR` if set, otherwise `~/.cache/griem`.
+    """
+    return os.environ.get("GRIEM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "griem"))
+
+
+def load_tables(rtol: float = 1e-10):
+    """
+    Load the function tables for `rtol`, building and caching them on disk if needed.
+
+    Tables are memory-mapped read-only from the cache directory and kept for the rest of the
+    process. The file is written atomically, so concurrent processes can build the same table.
+
+    Args:
+        rtol (float, optional): Relative error bound. Defaults to 1e-10.
+
+    Returns:
+        FunctionTables: The loaded tables.
+    """
+    if rtol in _LOADED_TABLES:
+        return _LOADED_TABLES[rtol]
+
+    path = os.path.join(cache_dir(), f"function_tables_v{TABLE_VERSION}_rtol{rtol:.3e}.npy")
+    if not os.path.exists(path):
+        tables = FunctionTables.build(rtol)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".npy")
+        with os.fdopen(fd, "wb") as file:
+            np.save(file, tables.coefficients)
+        os.replace(tmp_path, path)
+
+    _LOADED_TABLES[rtol] = FunctionTables(np.load(path, mmap_mode="r"), rtol)
+    return _LOADED_TABLES[rtol]
@@ -2,14 +2,206 @@
 functions.py
 
 This module contains special customs functions from Griem and data filtering helper functions.
+
+`A`, `B`, `a` and `b` dispatch to the active backend: 'exact' evaluates the SciPy Bessel
+functions (`A_exact`, ...), while 'fast' uses the error-bounded tables of
+`utils.fast_functions`. Switch with `set_backend()`.
 """
 
 # Import modules
 import numpy as np
 import scipy.special as func
 
+from . import profiling
+
+# Active special-function backend, see `set_backend()`
+_BACKEND = {"name": "exact", "tables": None}
+
+# Scratch arrays needed by `griem_functions()`: K0, K1, I0, I1, |z| and one temporary
+WORK_SLOTS = 6
+
+
+def set_backend(
+        name: str = "exact",
+        rtol: float = 1e-10
+    ):
+    """
+    Select how `A`, `B`, `a` and `b` are evaluated.
+
+    Args:
+        name (str, optional): 'exact' for the SciPy Bessel functions, or 'fast' for the
+                              tabulated evaluators. Defaults to 'exact'.
+        rtol (float, optional): Relative error bound of the 'fast' tables. Defaults to 1e-10.
+
+    Raises:
+        ValueError: If `name` is not a known backend.
+    """
+    if name == "exact":
+        _BACKEND.update(name=name, tables=None)
+    elif name == "fast":
+        from .fast_functions import load_tables
+        _BACKEND.update(name=name, tables=load_tables(rtol))
+    else:
+        raise ValueError(f"Unknown special-function backend: {name}")
+
+
+def get_backend():
+    """
+    Name of the active special-function backend.
+
+    Returns:
+        str: 'exact' or 'fast'.
+    """
+    return _BACKEND["name"]
+
+
 # Define Functions
 def A(z):
+    """`A(z_min)` function from Griem, evaluated with the active backend.
+
+    Args:
+        z (numpy.dnarray): independent variable
+
+    Returns:
+        numpy.ndarray: dependent variable
+    """
+    if _BACKEND["tables"] is not None:
+        return _BACKEND["tables"].A(z)
+    return A_exact(z)
+
+def B(z):
+    """`B(z_min)` function from Griem, evaluated with the active backend.
+
+    Args:
+        z (numpy.dnarray): independent variable
+
+    Returns:
+        numpy.ndarray: dependent variable
+    """
+    if _BACKEND["tables"] is not None:
+        return _BACKEND["tables"].B(z)
+    return B_exact(z)
+
+def a(z):
+    """`a(z_min)` function from Griem, evaluated with the active backend.
+
+    Args:
+        z (numpy.dnarray): independent variable
+
+    Returns:
+        numpy.ndarray: dependent variable
+    """
+    if _BACKEND["tables"] is not None:
+        return _BACKEND["tables"].a(z)
+    return a_exact(z)
+
+def b(z):
+    """`b(z_min)` function from Griem, evaluated with the active backend.
+
+    Args:
+        z (numpy.dnarray): independent variable
+
+    Returns:
+        numpy.ndarray: dependent variable
+    """
+    if _BACKEND["tables"] is not None:
+        return _BACKEND["tables"].b(z)
+    return b_exact(z)
+
+def griem_functions(
+        z: np.ndarray,
+        names: str = "AB",
+        out: np.ndarray = None,
+        work: np.ndarray = None
+    ):
+    """Fused evaluation of several of Griem's functions at the same `z`, with the active backend.
+
+    With the exact backend, each scaled modified Bessel function needed by `names` (K0, K1, I0,
+    I1) is evaluated once and shared between the functions, e.g. `A` and `B` together need four
+    Bessel evaluations instead of six. Results are written into `out`, and the Bessel values and
+    every intermediate into `work`, so a loop that keeps both buffers does not allocate arrays
+    of the size of `z`.
+
+    Args:
+        z (numpy.ndarray): independent variable
+        names (str, optional): Functions to evaluate, any of 'A', 'B', 'a', 'b'. Defaults to 'AB'.
+        out (numpy.ndarray, optional): Buffer of shape (len(names),) + z.shape for the results.
+        work (numpy.ndarray, optional): Scratch buffer of shape (WORK_SLOTS,) + z.shape.
+
+    Returns:
+        numpy.ndarray: `out`, where out[n] holds function names[n] evaluated at `z`.
+    """
+    if profiling._ACTIVE is not None:
+        profiling._ACTIVE.record_functions(names, z)
+    if _BACKEND["tables"] is not None:
+        z = np.asarray(z, dtype=np.float64)
+        if out is None:
+            out = np.empty((len(names),) + z.shape)
+        for n, name in enumerate(names):
+            out[n] = _BACKEND["tables"].evaluate(name, z)
+        return out
+    return _evaluate_exact(z, names, out, work)
+
+def _evaluate_exact(
+        z: np.ndarray,
+        names: str,
+        out: np.ndarray = None,
+        work: np.ndarray = None
+    ):
+    """Fused SciPy evaluation behind `griem_functions()`, using exponentially scaled Bessel
+    functions so no argument needs masking. `B` is zero for |z| >= 1e6 and `b` for |z| >= 1e8,
+    where the exact expressions are dominated by cancellation."""
+    z = np.asarray(z, dtype=np.float64)
+    if out is None:
+        out = np.empty((len(names),) + z.shape)
+    if z.ndim == 0:
+        _evaluate_exact(z[None], names, out[:, None])
+        return out
+    if work is None:
+        work = np.empty((WORK_SLOTS,) + z.shape)
+    k0, k1, i0, i1, arg, temp = work
+
+    # The scaled Bessel functions are NaN beyond ~2e9; every function is cut off before then
+    np.abs(z, out=arg)
+    bessel_arg = np.minimum(arg, 1e8, out=temp)
+    func.kve(0, bessel_arg, out=k0)
+    if "A" in names or "B" in names or "a" in names:
+        func.kve(1, bessel_arg, out=k1)
+    if "B" in names:
+        func.ive(0, bessel_arg, out=i0)
+    if "B" in names or "b" in names:
+        func.ive(1, bessel_arg, out=i1)
+
+    for f, name in zip(out, names):
+        if name == "A":
+            np.multiply(k0, k0, out=f)
+            f += np.multiply(k1, k1, out=temp)
+            f *= np.multiply(arg, arg, out=temp)
+            f *= np.exp(np.multiply(arg, -2, out=temp), out=temp)
+        elif name == "B":
+            np.multiply(k0, i0, out=f)
+            f -= np.multiply(k1, i1, out=temp)
+            f *= np.multiply(arg, arg, out=temp)
+            f *= np.pi
+            if arg.size and arg.max() >= 1e6:
+                f[arg >= 1e6] = 0.0
+        elif name == "a":
+            np.multiply(k0, k1, out=f)
+            f *= arg
+            f *= np.exp(np.multiply(arg, -2, out=temp), out=temp)
+        elif name == "b":
+            np.multiply(arg, k0, out=f)
+            f *= i1
+            np.subtract(0.5, f, out=f)
+            f *= np.pi
+            np.copysign(f, z, out=f)
+            if arg.size and arg.max() >= 1e8:
+                f[arg >= 1e8] = 0.0
+        else:
+            raise ValueError(f"Unknown Griem function: {name}")
+    return out
+
+def A_exact(z):
     """`A(z_min)` function from Griem. Uses modified Bessel functions of the second kind
     of order zero and one.
     Parity = even.
@@ -24,7 +216,7 @@ def A(z):
     f = z**2*(func.kn(1, arg)**2 + func.kn(0, arg)**2)
     return f
 
-def B(z):
+def B_exact(z):
     """`B(z_min)` function from Griem. Uses modified Bessel functions of the second kind
     of order zero and one, and modified Bessel functions of the first kind of order zero
     and one.
@@ -36,26 +228,9 @@ def B(z):
     Returns:
         numpy.ndarray: dependent variable
     """
-    z = np.asarray(z)
-    f = np.empty_like(z, dtype=np.float64)
-
-    use_bessel = z < 1e6
-
-    # Compute where z is sufficiently small so as to not overflow bessel functions
-    f[use_bessel] = (
-        np.pi * z[use_bessel]**2 * 
-        (func.kve(0, z[use_bessel]) * func.ive(0, z[use_bessel]) 
-         - func.kve(1, z[use_bessel]) * func.ive(1, z[use_bessel]))
-    )
-
-    # Use asymptotic limit for sufficiently large z
-    f[~use_bessel] = 0.0
-
-    return f
-
+    return _evaluate_exact(z, "B")[0]
 
-
-def a(z):
+def a_exact(z):
     """`A(z_min)` function from Griem. Uses modified Bessel functions of the second kind
     of order zero and one.
     Parit = even.
@@ -69,7 +244,7 @@ def a(z):
     f = arg*func.kn(0, arg)*func.kn(1, arg)
     return f
 
-def b(z):
+def b_exact(z):
     """`A(z_min)` function from Griem. Uses a modified Bessel function of the second kind
     of order zero, and a modified Bessel function of the first kind of order one.
     Parity = odd.
@@ -79,19 +254,4 @@ def b(z):
     Returns:
         numpy.ndarray: dependent variable
     """
-    z = np.asarray(z)
-    f = np.empty_like(z, dtype=np.float64)
-
-
-
-
-    use_bessel = z < 1e8
-    sign = np.where(z > 0, 1, -1)[use_bessel]
-    arg = np.abs(z)[use_bessel]
-
-    # Compute where z is sufficiently small so as to not overflow bessel functions
-    f[use_bessel] = np.pi*(0.5 - arg*func.kve(0, arg)*func.ive(1, arg))*sign
-
-    # Use asymptotic limit for sufficiently large z
-    f[~use_bessel] = 0.0
-    return f
\ No newline at end of file
+    return _evaluate_exact(z, "b")[0]
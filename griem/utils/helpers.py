@@ -9,35 +9,150 @@ a custom dictionary with aliasing of keys.
 import os
 
 import numpy as np
-import pandas as pd
 from collections import UserDict
 
+from .energy_index import EnergyIndex
+from .profiling import timed
+
+# Map of element symbol to the base file name of its energy level data in `griem/data`
+ENERGY_DATA_FILES = {
+    "Rb": "Rb_energy_values",
+    "Cs": "Cs_energy_values"
+}
+
+def energy_data_path(element: str, extension: str = ".npz"):
+    """
+    Absolute path of the energy level data file for `element`.
+
+    Args:
+        element (str): user chosen alkali
+        extension (str, optional): File extension, '.npz' or '.xlsx'. Defaults to '.npz'.
+
+    Raises:
+        ValueError: If `element` is not supported.
+
+    Returns:
+        str: Absolute path to the data file.
+    """
+    if element not in ENERGY_DATA_FILES:
+        raise ValueError(f"Unsupported element: {element}")
+    base_dir = os.path.dirname(__file__)  # gets the folder of helpers.py
+    file_path = os.path.join(base_dir, "..", "data", ENERGY_DATA_FILES[element] + extension)
+    return os.path.abspath(file_path)  # clean absolute path
+
+
+# Process-wide caches of energy level data and of its index, keyed by element
+_ENERGY_DATA_CACHE = {}
+_ENERGY_INDEX_CACHE = {}
+
+
+@timed("load_energy_data")
 def load_energy_data(element):
     """
     Imports energy level values for specified alkali.
 
+    The data is read from the compiled `.npz` store in `griem/data` (see
+    `griem.data.build_store`), falling back to the Excel workbook if no store exists. Each
+    element is read at most once per process; later calls return a copy of the cached data.
+
     Args:
         element (str): user chosen alkali
 
+    Raises:
+        ValueError: If `element` is not supported.
+
     Returns:
         pandas.core.frame.DataFrame: Pandas dataframe of Rb energy levels
         with quantum numbers and quantum defect.
     """
-    file_map = {
-        "Rb": "Rb_energy_values.xlsx",
-        "Cs": "Cs_energy_values.xlsx"
-    }
-    file_name = file_map[element]
+    if element not in _ENERGY_DATA_CACHE:
+        _ENERGY_DATA_CACHE[element] = _read_energy_data(element)
+    return _ENERGY_DATA_CACHE[element].copy()
 
 
-    if not file_name:
-        ValueError(f"Unsupported element: {element}")
+@timed("load_energy_data")
+def load_energy_index(element):
+    """
+    Array-backed index of the energy levels of the specified alkali.
 
-    # Load data into dataframe
-    base_dir = os.path.dirname(__file__)  # gets the folder of helpers.py
-    file_path = os.path.join(base_dir, "..", "data", file_name)
-    file_path = os.path.abspath(file_path)  # clean absolute path
-    return pd.read_excel(file_path)
+    The index is built once per process, from the cached energy data if it has been loaded and
+    otherwise straight from the `.npz` store (without importing pandas), and is shared, not
+    copied, so it must not be modified.
+
+    Args:
+        element (str): user chosen alkali
+
+    Raises:
+        ValueError: If `element` is not supported.
+
+    Returns:
+        EnergyIndex: Index of the energy levels.
+    """
+    if element not in _ENERGY_INDEX_CACHE:
+        if element in _ENERGY_DATA_CACHE:
+            _ENERGY_INDEX_CACHE[element] = EnergyIndex.from_frame(_ENERGY_DATA_CACHE[element])
+        else:
+            _ENERGY_INDEX_CACHE[element] = EnergyIndex(_read_energy_levels(element))
+    return _ENERGY_INDEX_CACHE[element]
+
+
+def clear_energy_data_cache(element=None):
+    """
+    Invalidates the cached energy level data and indexes.
+
+    Args:
+        element (str, optional): Element to invalidate. Defaults to None, which clears every element.
+    """
+    if element is None:
+        _ENERGY_DATA_CACHE.clear()
+        _ENERGY_INDEX_CACHE.clear()
+    else:
+        _ENERGY_DATA_CACHE.pop(element, None)
+        _ENERGY_INDEX_CACHE.pop(element, None)
+
+
+def _read_energy_data(element):
+    """
+    Reads the energy level data of `element` from disk.
+
+    Args:
+        element (str): user chosen alkali
+
+    Returns:
+        pandas.core.frame.DataFrame: Energy level data.
+    """
+    import pandas as pd
+
+    file_path = energy_data_path(element)
+    if not os.path.exists(file_path):
+        return pd.read_excel(energy_data_path(element, ".xlsx"))
+
+    with np.load(file_path, allow_pickle=False) as store:
+        columns = [str(column) for column in store["__columns__"]]
+        return pd.DataFrame({column: store[column] for column in columns}, columns=columns)
+
+
+def _read_energy_levels(element):
+    """
+    Reads the energy level data of `element` from its `.npz` store as a structured array, the
+    layout of `EnergyIndex.levels`, falling back to the Excel workbook if no store exists.
+
+    Args:
+        element (str): user chosen alkali
+
+    Returns:
+        np.ndarray: Structured array with one record per level.
+    """
+    file_path = energy_data_path(element)
+    if not os.path.exists(file_path):
+        return EnergyIndex.from_frame(_read_energy_data(element)).levels
+
+    with np.load(file_path, allow_pickle=False) as store:
+        columns = [(str(column), store[str(column)]) for column in store["__columns__"]]
+    levels = np.empty(len(columns[0][1]), dtype=[(name, values.dtype) for name, values in columns])
+    for name, values in columns:
+        levels[name] = values
+    return levels
 
 
 def find_upper_states(element: str, upper_orbital: str):
@@ -51,12 +166,9 @@ def find_upper_states(element: str, upper_orbital: str):
     Returns:
         np.ndarray: List of all the upper states with L_{j} momentum.
     """
-    data = load_energy_data(element)
-    all_states = np.array(data['Config'])
-    all_obritals = np.array(data['Config'].str[-4:])
-    upper_orbitals_indices = np.where(all_obritals != upper_orbital)[0]
-    upper_states = np.delete(all_states, upper_orbitals_indices)
-    return upper_states
+    configs = load_energy_index(element).levels["Config"]
+    return np.array([str(config) for config in configs if config[-4:] == upper_orbital],
+                    dtype=object)
 
 
 class AliasDict(UserDict):
@@ -0,0 +1,202 @@
+"""
+parallel.py
+
+Helpers for running independent calculations (e.g. the upper states of a series) serially, on a
+thread pool, or on a process pool, with results returned in input order.
+
+Process pool workers are initialized with the parent's energy data and special-function backend,
+so each worker neither reloads the energy data nor rebuilds the function tables.
+"""
+
+# Import modules
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Union
+
+import numpy as np
+
+from . import helpers
+from . import functions
+from .energy_index import EnergyIndex
+
+# Executors that can be requested by name
+EXECUTORS = ("serial", "thread", "process")
+
+
+def map_ordered(
+        function: callable,
+        iterable,
+        executor: Union[str, Executor] = "serial",
+        max_workers: int = None,
+        energy_data: dict = None
+    ):
+    """
+    Apply `function` to every item of `iterable` and return the results in input order.
+
+    Args:
+        function (callable): Function of one argument. Must be picklable for 'process'.
+        iterable (iterable): Items to apply `function` to.
+        executor (str or Executor, optional): 'serial', 'thread', 'process', or an existing
+                                              `concurrent.futures.Executor`. Defaults to 'serial'.
+        max_workers (int, optional): Number of workers of a 'thread' or 'process' pool. Defaults
+                                     to None, which lets `concurrent.futures` choose.
+        energy_data (dict, optional): Energy levels by element (see `init_worker`), preloaded
+                                      into every process pool worker. Defaults to None.
+
+    Raises:
+        ValueError: If `executor` is not a known executor.
+
+    Returns:
+        list: `function(item)` for every item, in the order of `iterable`.
+    """
+    if isinstance(executor, Executor):
+        return list(executor.map(function, iterable))
+    if executor == "serial":
+        return [function(item) for item in iterable]
+    if executor == "thread":
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(function, iterable))
+    if executor == "process":
+        tables = functions._BACKEND["tables"]
+        initargs = (energy_data or {}, functions.get_backend(), getattr(tables, "rtol", None))
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                 initargs=initargs) as pool:
+            return list(pool.map(function, iterable))
+    raise ValueError(f"Unknown executor: {executor}. Use one of {EXECUTORS} or an Executor.")
+
+
+def map_unordered(
+        function: callable,
+        iterable,
+        executor: Union[str, Executor] = "serial",
+        max_workers: int = None,
+        energy_data: dict = None,
+        max_pending: int = None
+    ):
+    """
+    Apply `function` to every item of `iterable`, yielding the results as they complete.
+
+    At most `max_pending` items are submitted ahead of the results that have been consumed, so
+    a long (or lazy) `iterable` is never materialized and the memory held by finished results
+    stays bounded.
+
+    Args:
+        function (callable): Function of one argument. Must be picklable for 'process'.
+        iterable (iterable): Items to apply `function` to.
+        executor (str or Executor, optional): 'serial', 'thread', 'process', or an existing
+                                              `concurrent.futures.Executor`. Defaults to 'serial'.
+        max_workers (int, optional): Number of workers of a 'thread' or 'process' pool. Defaults
+                                     to None, which lets `concurrent.futures` choose.
+        energy_data (dict, optional): Energy levels by element (see `init_worker`), preloaded
+                                      into every process pool worker. Defaults to None.
+        max_pending (int, optional): Largest number of submitted, unfinished items. Defaults to
+                                     None, which uses twice the number of workers.
+
+    Raises:
+        ValueError: If `executor` is not a known executor.
+
+    Yields:
+        tuple: (position of the item in `iterable`, `function(item)`), in completion order.
+    """
+    if executor == "serial":
+        for n, item in enumerate(iterable):
+            yield n, function(item)
+        return
+    if isinstance(executor, Executor):
+        yield from _map_window(function, iterable, executor, max_pending or 2*(max_workers or 1))
+        return
+    max_pending = max_pending or 2*(max_workers or os.cpu_count() or 1)
+    if executor == "thread":
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            yield from _map_window(function, iterable, pool, max_pending)
+        return
+    if executor == "process":
+        tables = functions._BACKEND["tables"]
+        initargs = (energy_data or {}, functions.get_backend(), getattr(tables, "rtol", None))
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                                 initargs=initargs) as pool:
+            yield from _map_window(function, iterable, pool, max_pending)
+        return
+    raise ValueError(f"Unknown executor: {executor}. Use one of {EXECUTORS} or an Executor.")
+
+
+def _map_window(
+        function: callable,
+        iterable,
+        pool: Executor,
+        max_pending: int
+    ):
+    """Submit the items of `iterable` to `pool` keeping at most `max_pending` in flight, and
+    yield (position, result) pairs as they complete."""
+    pending = {}
+    items = enumerate(iterable)
+    exhausted = False
+    while True:
+        while not exhausted and len(pending) < max_pending:
+            try:
+                n, item = next(items)
+            except StopIteration:
+                exhausted = True
+                break
+            pending[pool.submit(function, item)] = n
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future.result()
+
+
+def split_work(
+        items,
+        executor: Union[str, Executor] = "serial",
+        max_workers: int = None
+    ):
+    """
+    Split `items` into one contiguous chunk per worker, for engines that batch a whole chunk.
+
+    Args:
+        items (list or np.ndarray): Items to split.
+        executor (str or Executor, optional): Executor the chunks will run on. 'serial' gives a
+                                              single chunk. Defaults to 'serial'.
+        max_workers (int, optional): Number of workers. Defaults to None, which uses the
+                                     number of CPUs.
+
+    Returns:
+        list: Non-empty chunks of `items`, in order.
+    """
+    items = np.asarray(items)
+    if executor == "serial" or len(items) == 0:
+        return [items]
+    n_chunks = min(len(items), max_workers or os.cpu_count() or 1)
+    return np.array_split(items, n_chunks)
+
+
+def init_worker(
+        energy_data: dict,
+        backend: str = "exact",
+        rtol: float = None
+    ):
+    """
+    Initialize a process pool worker with the parent's state.
+
+    Args:
+        energy_data (dict): Energy levels by element, as structured arrays (see
+                            `EnergyIndex.levels`) stored in the worker's index cache, or as
+                            energy data DataFrames stored in its data cache.
+        backend (str, optional): Special-function backend. Defaults to 'exact'.
+        rtol (float, optional): Relative error bound of the 'fast' backend. Defaults to None.
+    """
+    for element, data in energy_data.items():
+        if isinstance(data, np.ndarray):
+            helpers._ENERGY_DATA_CACHE.pop(element, None)
+            helpers._ENERGY_INDEX_CACHE[element] = EnergyIndex(data)
+        else:
+            import pandas as pd
+
+            helpers._ENERGY_DATA_CACHE[element] = pd.DataFrame(data)
+            helpers._ENERGY_INDEX_CACHE.pop(element, None)
+    if backend == "fast":
+        functions.set_backend(backend, rtol)
+    else:
+        functions.set_backend(backend)
@@ -0,0 +1,213 @@
+"""
+profiling.py
+
+Opt-in instrumentation of the calculation pipeline.
+
+A `Profiler` is activated as a context manager. While it is active, the pipeline stages
+(`load_energy_index`, `process_data`, `create_terms`, `calculate_rhos`, `sum` and the integrals)
+record their wall and CPU time and the size of the arrays they return, `calculate_rhos` records
+the root-solver iterations and function evaluations of every velocity, and the special
+functions record how often they are called and on how many points. When it finishes, the
+profiler passes its report to every callback, e.g. a metrics collector:
+
+    >>> with Profiler(callbacks=[collector.push]) as profiler:
+    ...     run("Rb", "5P3/2", "10S1/2", velocity, EVDF, n_terms=5)
+    >>> profiler.report()["stages"]["calculate_rhos"]["wall"]
+
+`Griem.calculate(profile=True)` does the same and attaches the report to the results. Without
+an active profiler every instrumented call costs a single global lookup. Work done in process
+pool workers is only timed as a whole by the stage that waits for it.
+"""
+
+# Import modules
+import time
+from collections import defaultdict
+from functools import wraps
+
+import numpy as np
+
+# Profiler receiving the measurements, None when profiling is off
+_ACTIVE = None
+
+
+class Profiler:
+    """
+    Collector of per-stage timings, root-solver statistics, special-function call counts and
+    peak array sizes.
+
+    Attributes:
+        callbacks (list): Functions called with the report when the profiler exits.
+
+    Methods:
+        stage(name): Context manager timing a stage.
+        record_solver(info): Add root-solver statistics.
+        record_functions(names, z): Add special-function evaluations.
+        record_array(name, value): Track the largest array (in bytes) seen under `name`.
+        report(): The measurements as a dict.
+    """
+    def __init__(self, callbacks: list = None):
+        """
+        Initialize a Profiler object.
+
+        Args:
+            callbacks (list, optional): Functions of one argument, called with the report when
+                                        the profiler exits. Defaults to None.
+        """
+        self.callbacks = list(callbacks or [])
+        self._stages = defaultdict(lambda: {"calls": 0, "wall": 0.0, "cpu": 0.0})
+        self._functions = defaultdict(lambda: {"calls": 0, "points": 0})
+        self._arrays = defaultdict(int)
+        self._iterations = []
+        self._function_calls = []
+        self._total = {"wall": 0.0, "cpu": 0.0}
+        self._previous = None
+        self._start = None
+
+    def __enter__(self):
+        global _ACTIVE
+        self._previous, _ACTIVE = _ACTIVE, self
+        self._start = (time.perf_counter(), time.process_time())
+        return self
+
+    def __exit__(self, *exc_info):
+        global _ACTIVE
+        self._total["wall"] += time.perf_counter() - self._start[0]
+        self._total["cpu"] += time.process_time() - self._start[1]
+        _ACTIVE = self._previous
+        report = self.report()
+        for callback in self.callbacks:
+            callback(report)
+
+    def stage(self, name: str):
+        """
+        Context manager adding the wall and CPU time of its body to the stage `name`.
+
+        Args:
+            name (str): Stage name.
+
+        Returns:
+            _StageTimer: The timer.
+        """
+        return _StageTimer(self._stages[name])
+
+    def record_solver(self, info: dict):
+        """
+        Add root-solver statistics.
+
+        Args:
+            info (dict): Per-velocity `iterations` and/or `function_calls` (see `calculate_rhos`).
+        """
+        if "iterations" in info:
+            self._iterations.append(np.atleast_1d(info["iterations"]))
+        if "function_calls" in info:
+            self._function_calls.append(np.atleast_1d(info["function_calls"]))
+
+    def record_functions(
+            self,
+            names: str,
+            z: np.ndarray
+        ):
+        """
+        Add evaluations of the special functions `names` at the points `z`.
+
+        Args:
+            names (str): Functions evaluated, any of 'A', 'B', 'a', 'b'.
+            z (np.ndarray): Points they are evaluated at.
+        """
+        size = np.size(z)
+        for name in names:
+            self._functions[name]["calls"] += 1
+            self._functions[name]["points"] += size
+        self.record_array("special_functions", z)
+
+    def record_array(
+            self,
+            name: str,
+            value
+        ):
+        """
+        Track the largest array seen under `name`.
+
+        Args:
+            name (str): Label of the array.
+            value: Array, or a tuple/list of arrays (the largest counts). Other values are ignored.
+        """
+        values = value if isinstance(value, (tuple, list)) else (value,)
+        for array in values:
+            if isinstance(array, np.ndarray):
+                self._arrays[name] = max(self._arrays[name], array.nbytes)
+
+    def report(self):
+        """
+        The measurements.
+
+        Returns:
+            dict: With the keys
+                - 'total': wall and CPU time [s] spent inside the profiler
+                - 'stages': calls, wall and CPU time [s] of each stage
+                - 'solver': total and largest per-velocity `iterations` and `function_calls`,
+                  the number of `solves`, and the per-velocity arrays of every solve
+                - 'special_functions': calls and evaluated points of each function
+                - 'peak_array_bytes': largest array of each stage (and of the special functions)
+        """
+        solver = {"solves": len(self._iterations) or len(self._function_calls)}
+        for name, values in (("iterations", self._iterations),
+                             ("function_calls", self._function_calls)):
+            solver[name] = int(sum(np.sum(value) for value in values))
+            solver[f"max_{name}"] = int(max((np.max(value) for value in values if value.size),
+                                            default=0))
+            solver[f"{name}_per_velocity"] = values
+        return {"total": dict(self._total),
+                "stages": {name: dict(stage) for name, stage in self._stages.items()},
+                "solver": solver,
+                "special_functions": {name: dict(counts) for name, counts in self._functions.items()},
+                "peak_array_bytes": dict(self._arrays)}
+
+
+class _StageTimer:
+    """Context manager adding its wall and CPU time to a stage entry."""
+    def __init__(self, entry: dict):
+        self.entry = entry
+
+    def __enter__(self):
+        self._start = (time.perf_counter(), time.process_time())
+        return self
+
+    def __exit__(self, *exc_info):
+        self.entry["calls"] += 1
+        self.entry["wall"] += time.perf_counter() - self._start[0]
+        self.entry["cpu"] += time.process_time() - self._start[1]
+
+
+def active():
+    """
+    The active profiler.
+
+    Returns:
+        Profiler: The profiler, or None when profiling is off.
+    """
+    return _ACTIVE
+
+
+def timed(name: str):
+    """
+    Decorator timing a pipeline stage, and the arrays it returns, while a profiler is active.
+
+    Args:
+        name (str): Stage name.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _ACTIVE
+            if profiler is None:
+                return function(*args, **kwargs)
+            with profiler.stage(name):
+                result = function(*args, **kwargs)
+            profiler.record_array(name, result)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,439 @@
+"""
+result_cache.py
+
+Cache of Griem results keyed by the inputs that determine them.
+
+The width and shift of a line depend on the element, the upper state, the velocity grid, the
+EVDF, the number of perturbing terms and the special-function backend, but not on the lower
+state, which is only checked for existence. Lines that share an upper state (e.g. a catalog
+with several lower states) therefore share one cache entry, and every upper level is
+computed once.
+
+`ResultCache` keeps results in memory for one process; `DiskCache` persists them as
+content-addressed files that any number of processes and jobs can share.
+"""
+
+# Import modules
+import copy
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+from .. import __version__
+from . import functions
+from .fast_functions import cache_dir
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# Age [s] after which a temporary file is taken to be left behind by a crashed writer
+STALE_TEMPORARY_AGE = 3600
+
+
+def result_key(
+        element: str,
+        upper_state: str,
+        velocity,
+        EVDF,
+        n_terms,
+        terms_rtol: float = None,
+        rho_method: str = 'batch',
+        rho_rtol: float = None
+    ):
+    """
+    Key of the result of one upper state.
+
+    Arrays are hashed by content (dtype, shape and bytes), so equal grids give equal keys no
+    matter where they come from. The package version is part of the key, so results of an older
+    version are never reused.
+
+    Args:
+        element (str): The alkali element symbol (e.g. 'Rb').
+        upper_state (str): Upper state of the transition (e.g. '12F5/2').
+        velocity (float, np.ndarray): Velocity or velocity grid.
+        EVDF (float, np.ndarray): Electron velocity distribution function(s).
+        n_terms (int, str): Number of perturbing states, or 'auto'.
+        terms_rtol (float, optional): Relative tolerance of `n_terms='auto'`. Defaults to None.
+        rho_method (str, optional): rho_min solver method. Only the approximate 'surrogate'
+                                    method changes the key. Defaults to 'batch'.
+        rho_rtol (float, optional): Residual tolerance of the 'surrogate' method. Defaults to None.
+
+    Returns:
+        str: Hex digest of the inputs, or None if they cannot be hashed (e.g. a function EVDF).
+    """
+    if callable(EVDF):
+        return None
+    tables = functions._BACKEND["tables"]
+    values = (__version__, element, str(upper_state), velocity, EVDF, n_terms,
+              terms_rtol if n_terms == 'auto' else None,
+              functions.get_backend(), getattr(tables, "rtol", None))
+    if rho_method == 'surrogate':
+        values += (rho_method, rho_rtol)
+    return input_digest(values)
+
+
+def input_digest(values):
+    """
+    Stable hash of a sequence of inputs.
+
+    Args:
+        values (iterable): Strings, None, numbers or arrays (hashed by shape and float64 bytes).
+
+    Returns:
+        str: Hex digest of the values.
+    """
+    digest = hashlib.sha256()
+    for value in values:
+        if isinstance(value, str) or value is None:
+            digest.update(repr(value).encode())
+        else:
+            array = np.ascontiguousarray(value, dtype=np.float64)
+            digest.update(f"{array.shape}".encode())
+            digest.update(array.tobytes())
+        digest.update(b"|")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    In-memory cache of Griem results with least-recently-used eviction.
+
+    The cache lives in the process that created it: it is shared by threads (lookups and
+    updates hold a lock), but a process pool worker gets its own copy. Values are copied when
+    stored and when returned, so callers may modify results without changing the cache, as with
+    `DiskCache`.
+
+    Attributes:
+        max_entries (int): Largest number of entries kept, None for no limit.
+        hits (int): Number of lookups that found an entry.
+        misses (int): Number of lookups that did not.
+
+    Methods:
+        get(key): Cached value of `key`, or None.
+        put(key, value): Store a value.
+        clear(): Remove every entry and reset the statistics.
+    """
+    def __init__(self, max_entries: int = None):
+        """
+        Initialize an empty ResultCache.
+
+        Args:
+            max_entries (int, optional): Largest number of entries kept. Defaults to None (no limit).
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key: str):
+        """
+        Cached value of `key`.
+
+        Args:
+            key (str): Key from `result_key`.
+
+        Returns:
+            tuple: A copy of the cached value, or None on a miss (always for a None key).
+        """
+        with self._lock:
+            if key is None or key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            value = self._entries[key]
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: tuple, rhos: np.ndarray = None):
+        """
+        Store `value` under `key`, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key (str): Key from `result_key`. None keys are not stored.
+            value (tuple): Value to store (a copy is kept).
+            rhos (np.ndarray, optional): rho_min of the entry. Not kept in memory (see
+                                         `DiskCache`). Defaults to None.
+        """
+        if key is None:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove every entry and reset the statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class DiskCache:
+    """
+    Persistent, content-addressed cache of Griem results with least-recently-used eviction.
+
+    Each entry is a `.npz` file named by its key (see `result_key`) holding the width/shift
+    integral, the interaction states, the processed data and, optionally, the rho_min solutions.
+    Files are written atomically (temporary file + rename) and reads treat a missing or partial
+    file as a miss, so several processes can share one directory. Reading an entry updates its
+    modification time, and when the directory grows beyond `max_bytes` the entries used least
+    recently are removed (under a lock file where the platform supports it). Temporary files
+    older than `STALE_TEMPORARY_AGE`, left behind by writers that crashed, count towards the
+    size and are removed by the same eviction.
+
+    The cache only holds its directory and settings, so it can be passed to process pool workers.
+
+    Attributes:
+        directory (str): Cache directory.
+        max_bytes (int): Size budget of the entries, None for no limit.
+        store_rhos (bool): Whether the rho_min solutions are stored with the results.
+        hits (int): Number of lookups of this object that found an entry.
+        misses (int): Number of lookups of this object that did not.
+
+    Methods:
+        get(key): Cached value of `key`, or None.
+        get_rhos(key): Cached rho_min of `key`, or None.
+        put(key, value, rhos): Store a value.
+        stats(): Hit/miss counts, number of entries and their size.
+        clear(): Remove every entry and reset the statistics.
+    """
+    def __init__(
+            self,
+            directory: str = None,
+            max_bytes: int = 2**30,
+            store_rhos: bool = False
+        ):
+        """
+        Initialize a DiskCache object.
+
+        Args:
+            directory (str, optional): Cache directory. Defaults to None, which uses `results`
+                                       in the griem cache directory (`$GRIEM_CACHE_DIR`, or
+                                       `~/.cache/griem`).
+            max_bytes (int, optional): Size budget of the entries. Defaults to 1 GiB.
+            store_rhos (bool, optional): Store the rho_min solutions with the results. Defaults
+                                         to False.
+        """
+        self.directory = directory or os.path.join(cache_dir(), "results")
+        self.max_bytes = max_bytes
+        self.store_rhos = store_rhos
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_size"] = None
+        return state
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __contains__(self, key):
+        return key is not None and os.path.exists(self._path(key))
+
+    def get(self, key: str):
+        """
+        Cached value of `key`.
+
+        Args:
+            key (str): Key from `result_key`.
+
+        Returns:
+            tuple: (integral, interaction states, processed data), or None on a miss (always for
+                   a None key).
+        """
+        value = None if key is None else self._load(key, ("integral", "interact_states",
+                                                           "processed_data"))
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        integral, interact_states, processed_data = value
+        return integral[()], interact_states.tolist(), processed_data
+
+    def get_rhos(self, key: str):
+        """
+        Cached rho_min solutions of `key`. Does not count as a lookup.
+
+        Args:
+            key (str): Key from `result_key`.
+
+        Returns:
+            np.ndarray: rho_min of the entry, or None if it has none.
+        """
+        value = None if key is None else self._load(key, ("rhos",))
+        return None if value is None else value[0]
+
+    def put(self, key: str, value: tuple, rhos: np.ndarray = None):
+        """
+        Store `value` under `key`, then evict the least recently used entries if the cache is
+        over its size budget.
+
+        Args:
+            key (str): Key from `result_key`. None keys are not stored.
+            value (tuple): (integral, interaction states, processed data).
+            rhos (np.ndarray, optional): rho_min of the entry, stored if `store_rhos`. Defaults
+                                         to None.
+        """
+        if key is None:
+            return
+        integral, interact_states, processed_data = value
+        arrays = {"integral": np.asarray(integral),
+                  "interact_states": np.asarray(interact_states, dtype=str),
+                  "processed_data": processed_data}
+        if self.store_rhos and rhos is not None:
+            arrays["rhos"] = np.asarray(rhos)
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez(file, **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+
+        if self.max_bytes is not None:
+            if self._size is None:
+                self._size = sum(size for _, _, size in self._entries() + self._stale_temporaries())
+            self._size += os.path.getsize(path)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def stats(self):
+        """
+        Statistics of the cache.
+
+        Returns:
+            dict: 'hits' and 'misses' of this object, and the 'entries' and 'bytes' on disk.
+        """
+        entries = self._entries()
+        return {"hits": self.hits, "misses": self.misses, "entries": len(entries),
+                "bytes": sum(size for _, _, size in entries)}
+
+    def clear(self):
+        """
+        Remove every entry and reset the statistics.
+        """
+        with self._lock():
+            for path, _, _ in self._entries() + self._stale_temporaries():
+                _remove(path)
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str):
+        """File of the entry `key`."""
+        return os.path.join(self.directory, key[:2], key + ".npz")
+
+    def _load(self, key: str, names: tuple):
+        """Arrays `names` of the entry `key` (refreshing its use time), or None if the entry
+        does not exist, lacks one of them, or is unreadable."""
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as store:
+                arrays = tuple(store[name] for name in names)
+            os.utime(path)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            return None
+        return arrays
+
+    def _entries(self, suffix: str = ".npz"):
+        """(path, last use time, size) of every entry, or of every file ending in `suffix`."""
+        entries = []
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith(suffix):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((entry.path, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _stale_temporaries(self):
+        """(path, modification time, size) of the temporary files of crashed writers."""
+        cutoff = time.time() - STALE_TEMPORARY_AGE
+        return [entry for entry in self._entries(".tmp") if entry[1] < cutoff]
+
+    def _evict(self):
+        """Remove stale temporary files, then the least recently used entries until the cache
+        fits its size budget."""
+        with self._lock():
+            for path, _, _ in self._stale_temporaries():
+                _remove(path)
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            self._size = sum(size for _, _, size in entries)
+            for path, _, size in entries:
+                if self._size <= self.max_bytes:
+                    break
+                _remove(path)
+                self._size -= size
+
+    def _lock(self):
+        """Exclusive lock on the cache directory, shared by every process using it."""
+        return _FileLock(os.path.join(self.directory, ".lock"))
+
+
+class _FileLock:
+    """Context manager holding an exclusive `flock` on a file (a no-op without `fcntl`)."""
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def _remove(path: str):
+    """Remove a file another process may have removed already."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,85 @@
+"""
+stages.py
+
+Dependency tracking for the stages of a calculation pipeline.
+
+Each stage stores its output together with a digest of the inputs it was computed from (see
+`result_cache.input_digest`). A stage's inputs include the digest of the stages it depends on,
+so changing one input recomputes exactly the stages downstream of it and reuses the rest.
+"""
+
+# Import modules
+from .result_cache import input_digest
+
+
+class StageCache:
+    """
+    Outputs of pipeline stages, keyed by the inputs they depend on.
+
+    Attributes:
+        recomputed (list): Names of the stages computed (not reused) since the last `reset_log`.
+
+    Methods:
+        run(name, inputs, compute): Output of a stage, computed only if its inputs changed.
+        digest(name): Input digest of the stored output of a stage.
+        reset_log(): Clear `recomputed`.
+        clear(): Forget every stage.
+    """
+    def __init__(self):
+        """
+        Initialize an empty StageCache.
+        """
+        self.recomputed = []
+        self._stages = {}
+
+    def run(
+            self,
+            name: str,
+            inputs: tuple,
+            compute: callable
+        ):
+        """
+        Output of the stage `name`, reused if it was last computed from the same inputs.
+
+        Args:
+            name (str): Stage name.
+            inputs (tuple): Values the stage depends on, including the `digest` of upstream
+                            stages (strings, None, numbers or arrays).
+            compute (callable): Function of no arguments that computes the stage.
+
+        Returns:
+            tuple: (output of the stage, digest of its inputs).
+        """
+        digest = input_digest(inputs)
+        stored = self._stages.get(name)
+        if stored is None or stored[0] != digest:
+            stored = (digest, compute())
+            self._stages[name] = stored
+            self.recomputed.append(name)
+        return stored[1], digest
+
+    def digest(self, name: str):
+        """
+        Input digest of the stored output of the stage `name`.
+
+        Args:
+            name (str): Stage name.
+
+        Returns:
+            str: The digest, or None if the stage has not been computed.
+        """
+        stored = self._stages.get(name)
+        return None if stored is None else stored[0]
+
+    def reset_log(self):
+        """
+        Clear the list of recomputed stages.
+        """
+        self.recomputed = []
+
+    def clear(self):
+        """
+        Forget every stage.
+        """
+        self._stages.clear()
+        self.recomputed = []
@@ -3,7 +3,7 @@ from setuptools import setup, find_packages
 setup(
     name="griem",
     version="0.1.0",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks"]),
     include_package_data=True,
     install_requires=[
         "numpy",